@@ -0,0 +1,271 @@
+import io
+import os
+import json
+import time
+import platform
+import argparse
+import statistics
+import subprocess
+import tempfile
+from contextlib import redirect_stdout
+
+from multicell_utils.registry import SchemaRegistry, project_root, object_schemas_dir, \
+    process_schemas_dir, templates_dir
+from multicell_utils.builder import ModelBuilder
+from multicell_utils.graph import create_graph_from_model
+
+
+RESULTS_FORMAT = 1
+
+# (n_objects, depth, branching, n_processes, inheritance_depth)
+DEFAULT_SIZES = [
+    (100, 3, 10, 100, 2),
+    (1000, 4, 10, 1000, 2),
+    (10000, 4, 20, 10000, 2),
+]
+
+
+def synthetic_model(n_objects=1000, depth=3, branching=10, n_processes=None, inheritance_depth=2,
+                    registry=None, name='synthetic'):
+    """Generate a valid model of ``n_objects`` objects from the registered types.
+
+    A Universe holds a MaterialObjectSpace, under which CellPopulation
+    containers are nested ``branching`` wide down to containment depth
+    ``depth``, as long as the object count allows. The remaining objects are
+    cells spread evenly over the deepest containers; their type is the
+    deepest registered Cell subtype with at most ``inheritance_depth``
+    ancestors. ``n_processes`` processes, by default one per cell, cycle
+    through the process types that accept that cell type.
+    """
+    if registry is None:
+        from schema import schema_registry as registry
+    if n_objects < 3:
+        raise ValueError("A synthetic model needs at least 3 objects")
+    cell_type = _cell_type(registry, inheritance_depth)
+    process_types = [process_type for process_type, allowed in registry.process_participation.items()
+                     if registry._is_allowed_type(cell_type, allowed)]
+
+    objects = {
+        'universe': {'type': 'Universe', 'attributes': {}, 'contained_objects': ['space']},
+        'space': {'type': 'MaterialObjectSpace', 'attributes': {}, 'contained_objects': []},
+    }
+    frontier = ['space']
+    for level in range(2, depth):
+        if len(objects) + len(frontier) * branching >= n_objects:
+            break
+        next_frontier = []
+        for parent in frontier:
+            for _ in range(branching):
+                population = f"population {level}.{len(next_frontier)}"
+                objects[population] = {'type': 'CellPopulation', 'attributes': {}, 'contained_objects': []}
+                objects[parent]['contained_objects'].append(population)
+                next_frontier.append(population)
+        frontier = next_frontier
+
+    cells = [f"cell {index}" for index in range(n_objects - len(objects))]
+    for index, cell in enumerate(cells):
+        objects[cell] = {'type': cell_type, 'attributes': {'volume': 1.0 + index % 100}}
+        objects[frontier[index % len(frontier)]]['contained_objects'].append(cell)
+
+    processes = {}
+    n_processes = len(cells) if n_processes is None else n_processes
+    for index in range(n_processes if cells and process_types else 0):
+        process_type = process_types[index % len(process_types)]
+        processes[f"{process_type} {index}"] = {
+            'type': process_type,
+            'attributes': {},
+            'participating_objects': [cells[index % len(cells)]],
+        }
+    return {'id': f"{name}_{n_objects}", 'name': name, 'objects': objects, 'processes': processes}
+
+
+def _cell_type(registry, inheritance_depth):
+    # the deepest leaf type derived from Cell within the inheritance depth
+    candidates = [object_type for object_type in registry.object_types
+                  if (object_type == 'Cell' or 'Cell' in registry.object_ancestors(object_type))
+                  and object_type not in registry.allowed_containments
+                  and len(registry.object_ancestors(object_type)) <= inheritance_depth]
+    if not candidates:
+        return 'Cell'
+    return max(candidates, key=lambda object_type: len(registry.object_ancestors(object_type)))
+
+
+def time_call(function, repeat=3):
+    """Run ``function`` ``repeat`` times and summarize the wall-clock seconds."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            function()
+        seconds.append(time.perf_counter() - start)
+    return {
+        'min': min(seconds),
+        'median': statistics.median(seconds),
+        'mean': statistics.mean(seconds),
+        'repeat': repeat,
+    }
+
+
+def new_registry():
+    registry = SchemaRegistry()
+    registry.add_schema_directory(object_schemas_dir, 'object')
+    registry.add_schema_directory(process_schemas_dir, 'process')
+    registry.add_schema_directory(templates_dir, 'template')
+    return registry
+
+
+def bench_registry(repeat=3):
+    return {
+        'registry_load': time_call(lambda: new_registry().preload(), repeat),
+        'registry_first_lookup': time_call(lambda: new_registry()._ensure_object('CellCPM'), repeat),
+    }
+
+
+def bench_model(n_objects, depth, branching, n_processes, inheritance_depth, repeat=3):
+    """Time validation, specialization, save, load and graphing of one synthetic model."""
+    from schema import schema_registry
+    schema_registry.preload()
+    model = synthetic_model(n_objects, depth, branching, n_processes, inheritance_depth)
+    results = {
+        'validate_template': time_call(lambda: schema_registry.validate_template(model), repeat),
+        'validate_containment': time_call(lambda: schema_registry.validate_containment(model), repeat),
+        'create_graph_from_model': time_call(lambda: create_graph_from_model(model), repeat),
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        model_file = os.path.join(directory, 'synthetic.json')
+        with open(model_file, 'w') as file:
+            json.dump(model, file)
+        results['load'] = time_call(lambda: ModelBuilder(model_file=model_file), repeat)
+
+        builder = ModelBuilder(model_file=model_file)
+        builder.validate(verbose=False)
+        results['save'] = time_call(lambda: builder.save('saved.json', directory=directory), repeat)
+
+        # specialize every cell of a model of base Cell types, then validate the edits
+        base = synthetic_model(n_objects, depth, branching, n_processes, inheritance_depth=1)
+        base_file = os.path.join(directory, 'base.json')
+        with open(base_file, 'w') as file:
+            json.dump(base, file)
+        cells = [name for name, obj in base['objects'].items() if obj['type'] == 'Cell']
+
+        def specialize():
+            specialized = ModelBuilder(model_file=base_file)
+            specialized.validate()
+            for name in cells:
+                specialized.specialize(path=['objects', name], new_type='CellCPM')
+            specialized.validate()
+        results['specialize'] = time_call(specialize, repeat)
+    return results
+
+
+def run_benchmarks(sizes=None, repeat=3, output=None):
+    """Run the benchmark suite and return its results.
+
+    ``sizes`` is a list of (n_objects, depth, branching, n_processes,
+    inheritance_depth) tuples. With ``output``, the results are also
+    written there as JSON, along with the commit and the machine they were
+    measured on.
+    """
+    sizes = DEFAULT_SIZES if sizes is None else sizes
+    results = {
+        'format': RESULTS_FORMAT,
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'registry': bench_registry(repeat),
+        'models': [],
+    }
+    for n_objects, depth, branching, n_processes, inheritance_depth in sizes:
+        results['models'].append({
+            'n_objects': n_objects,
+            'depth': depth,
+            'branching': branching,
+            'n_processes': n_processes,
+            'inheritance_depth': inheritance_depth,
+            'results': bench_model(n_objects, depth, branching, n_processes, inheritance_depth, repeat),
+        })
+    if output is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as file:
+            json.dump(results, file, indent=4)
+    return results
+
+
+def compare_results(baseline, current):
+    """Return the ratio of current to baseline median seconds for each timing."""
+    ratios = {}
+    for name, timing in current['registry'].items():
+        if name in baseline['registry']:
+            ratios[('registry', name)] = timing['median'] / baseline['registry'][name]['median']
+    baseline_models = {_size_key(entry): entry['results'] for entry in baseline['models']}
+    for entry in current['models']:
+        previous = baseline_models.get(_size_key(entry), {})
+        for name, timing in entry['results'].items():
+            if name in previous:
+                ratios[(_size_key(entry), name)] = timing['median'] / previous[name]['median']
+    return ratios
+
+
+def _size_key(entry):
+    return (entry['n_objects'], entry['depth'], entry['branching'], entry['n_processes'],
+            entry['inheritance_depth'])
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=project_root, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def test_synthetic_model():
+    from schema import schema_registry
+    model = synthetic_model(n_objects=500, depth=4, branching=5, n_processes=300, inheritance_depth=2)
+    assert len(model['objects']) == 500 and len(model['processes']) == 300
+    assert model['objects']['cell 0']['type'] == 'CellCPM'
+    schema_registry.validate_template(model)
+
+    shallow = synthetic_model(n_objects=50, depth=2, inheritance_depth=1)
+    assert {obj['type'] for obj in shallow['objects'].values()} == {'Universe', 'MaterialObjectSpace', 'Cell'}
+    assert len(shallow['objects']['space']['contained_objects']) == 48
+    schema_registry.validate_template(shallow)
+
+
+def test_run_benchmarks():
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, 'results.json')
+        results = run_benchmarks(sizes=[(50, 3, 3, 20, 2)], repeat=1, output=output)
+        with open(output, 'r') as file:
+            assert json.load(file)['models'][0]['n_objects'] == 50
+    timings = results['models'][0]['results']
+    assert set(timings) == {'validate_template', 'validate_containment', 'create_graph_from_model',
+                            'load', 'save', 'specialize'}
+    assert all(ratio == 1 for ratio in compare_results(results, results).values())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time registry loading, validation, I/O and graphing.')
+    parser.add_argument('--objects', type=int, nargs='+', help='object counts of the synthetic models')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--branching', type=int, default=10)
+    parser.add_argument('--inheritance-depth', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=os.path.join('out', 'benchmarks', 'results.json'))
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    sizes = None
+    if args.objects:
+        sizes = [(n, args.depth, args.branching, n, args.inheritance_depth) for n in args.objects]
+    results = run_benchmarks(sizes, repeat=args.repeat, output=args.output)
+    print(f"Benchmark results saved to {args.output}")
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        for key, ratio in compare_results(baseline, results).items():
+            print(f"{key}: {ratio:.2f}x")
@@ -1,12 +1,20 @@
 import os
+import re
 import json
+import fnmatch
+import itertools
 
 from jsonschema import ValidationError
 from multicell_utils.validate import validate_schema, object_meta_schema, process_meta_schema
-from multicell_utils import pf
+from multicell_utils import pf, instrument, serialize
 from schema import schema_registry
-from multicell_utils.registry import project_root
+from multicell_utils.registry import project_root, is_name_list
+from multicell_utils.ids import ModelIdAllocator
+from multicell_utils.compact import CompactModel
+from multicell_utils.containment import ContainmentIndex
 from multicell_utils.graph import create_graph_from_model
+from multicell_utils.hashing import ModelHashes, SubtreeCache, collect_violations_hashed
+from multicell_utils.units import convert_model
 
 
 class SchemaCreator:
@@ -61,7 +69,7 @@ class SchemaCreator:
             else:
                 print(f"Overwriting schema despite registration failure: {e}")
 
-    def save(self, filename, directory="schema"):
+    def save(self, filename, directory="schema", mode="pretty"):
         try:
             self.validate()
         except ValidationError as e:
@@ -72,9 +80,8 @@ class SchemaCreator:
         local_directory = os.path.join(directory, self.schema_type)
         if not os.path.exists(absolute_directory):
             os.makedirs(absolute_directory)
-        with open(os.path.join(absolute_directory, filename), 'w') as file:
-            json.dump(self.schema, file, indent=4)
-            print(f"Schema saved to {os.path.join(local_directory, filename)}")
+        serialize.dump(self.schema, os.path.join(absolute_directory, filename), mode=mode)
+        print(f"Schema saved to {os.path.join(local_directory, filename)}")
 
     def load_from_json(self, json_path, name):
         assert name is not None, "Name must be provided when loading from JSON"
@@ -125,42 +132,55 @@ class ProcessCreator(SchemaCreator):
 
 def make_unique_id():
     models_dir = os.path.join(project_root, 'models')
-    existing_ids = []
-
-    if os.path.exists(models_dir):
-        for filename in os.listdir(models_dir):
-            if filename.endswith('.json'):
-                with open(os.path.join(models_dir, filename), 'r') as file:
-                    try:
-                        model = json.load(file)
-                    except json.JSONDecodeError:
-                        print(f"Error loading model from {filename}")
-                        continue
-                    existing_ids.append(model['id'])
-
-    max_id = 0
-    for model_id in existing_ids:
-        if model_id.startswith('model_'):
-            try:
-                num = int(model_id.split('_')[1])
-                if num > max_id:
-                    max_id = num
-            except ValueError:
-                continue
+    return ModelIdAllocator(models_dir).allocate()
+
+
+def _bulk_names(names, entry_type, name_format):
+    if isinstance(names, int):
+        names = [name_format.format(type=entry_type, index=index) for index in range(names)]
+    else:
+        names = list(names)
+    if len(set(names)) != len(names):
+        raise ValueError("Names of added entries must be unique")
+    return names
+
+
+def _bulk_rows(columns, count):
+    """Return an iterator over one dict of column values per entry."""
+    if not columns:
+        return itertools.repeat({}, count)
+    keys = list(columns)
+    values = []
+    for key in keys:
+        column = columns[key]
+        # NumPy arrays and pandas series become lists of plain Python values
+        column = column.tolist() if hasattr(column, 'tolist') else list(column)
+        if len(column) != count:
+            raise ValueError(f"Column '{key}' has {len(column)} values for {count} entries")
+        values.append(column)
+    return (dict(zip(keys, row)) for row in zip(*values))
 
-    new_id = f"model_{max_id + 1:06d}"
-    return new_id
 
 class ModelBuilder:
-    def __init__(self, model_name=None, model_file=None):
+    def __init__(self, model_name=None, model_file=None, compact=False, units=None):
+        """Build a new model, or edit the one saved in ``model_file``.
+
+        With ``compact``, the model is kept in a :class:`CompactModel`, which
+        uses much less memory for large models and offers the same
+        dict-shaped access through ``self.model``. ``units`` maps attribute
+        names to the units their values are saved in, when those are not the
+        units of the schemas; the values are converted on loading.
+        """
         # TODO -- load model with id?
         models_path = 'models'
         if model_file:
-            if not model_file.endswith('.json'):
+            if not model_file.endswith(('.json', '.json.gz')):
                 model_file += '.json'
             model_file = os.path.join(project_root, models_path, model_file)
-            with open(model_file, 'r') as file:
-                self.model = json.load(file)
+            with instrument.phase('builder.load'):
+                self.model = serialize.load(model_file)
+            if units:
+                convert_model(self.model, units, to_schema=True, registry=schema_registry)
         else:
             self.model = {
                 "id": make_unique_id(),
@@ -168,18 +188,137 @@ class ModelBuilder:
                 "objects": {},
                 "processes": {},
             }
+        self.compact = compact
+        self._index_model()
+
+    @classmethod
+    def from_template(cls, template_name, model_name=None, compact=False, **kwargs):
+        """Build a model from a registered template.
+
+        ``kwargs`` are passed to :meth:`TemplatePlan.instantiate`. The
+        template is validated once per registry version rather than once
+        per model, so the new model starts out validated.
+        """
+        plan = schema_registry.template_plan(template_name)
+        builder = cls.__new__(cls)
+        if 'model_id' not in kwargs:
+            kwargs['model_id'] = make_unique_id()
+        builder.model = plan.instantiate(schema_registry, name=model_name, **kwargs)
+        builder.compact = compact
+        builder._index_model()
+        builder._dirty_objects.clear()
+        builder._dirty_processes.clear()
+        builder._validated_version = schema_registry.version
+        return builder
+
+    def _index_model(self):
+        if self.compact and not isinstance(self.model, CompactModel):
+            self.model = CompactModel.from_dict(self.model)
+
+        # Containment hierarchy, kept up to date by the edit methods
+        self.containment = ContainmentIndex()
+
+        # Incremental validation state. Names of entries changed since the
+        # last successful validate() are kept in insertion-ordered dicts; the
+        # containment index and a reverse map from an object name to the
+        # processes it participates in tell which entries an edit touches.
+        self._dirty_objects = {}
+        self._dirty_processes = {}
+        self._participations = {}
+        self._validated_version = None
+        for name in self.model["objects"]:
+            self._index_object(name)
+        for name in self.model["processes"]:
+            self._index_process(name)
 
     def __repr__(self):
         # Return a string representation of the model dictionary
-        return f"ModelBuilder({pf(self.model)})"
-
-    def validate(self, verbose=True):
-        schema_registry.validate_template(self.model)
-
-    def graph(self, filename=None, output_dir='out'):
+        return f"ModelBuilder({pf(self.to_dict())})"
+
+    def to_dict(self):
+        """Return the model as a plain JSON-compatible dict."""
+        if isinstance(self.model, CompactModel):
+            return self.model.to_dict()
+        return self.model
+
+    def validate(self, verbose=True, full=False, collect_errors=False, max_errors=None, subtree_cache=None):
+        """Validate the model, re-checking only entries affected by edits.
+
+        A full validation runs the first time, when ``full`` is set, and
+        whenever the schema registry has changed since the last successful
+        validation. Use ``full=True`` after editing ``self.model`` directly.
+
+        With ``collect_errors``, returns the list of violations found in one
+        pass (at most ``max_errors``) instead of raising on the first one.
+
+        With a :class:`SubtreeCache`, a full validation skips the object
+        subtrees and processes whose hashes are in the cache, having been
+        validated under the current registry version in this or any other
+        model. This pays off when validating many models that share most of
+        their structure, such as parameter sweeps.
+        """
+        if full or self._validated_version != schema_registry.version:
+            objects = processes = None
+        else:
+            objects, processes = list(self._dirty_objects), list(self._dirty_processes)
+
+        violations = []
+        with instrument.phase('builder.validate'):
+            if objects is None and subtree_cache is not None:
+                violations = collect_violations_hashed(self.model, schema_registry, cache=subtree_cache,
+                                                       max_errors=max_errors if collect_errors else 1,
+                                                       containment=self.containment)
+                if violations and not collect_errors:
+                    violations[0].raise_error()
+            elif collect_errors:
+                violations = schema_registry.collect_violations(
+                    self.model, max_errors=max_errors, objects=objects, processes=processes,
+                    containment=self.containment)
+            elif objects is None or objects or processes:
+                schema_registry.validate_template(self.model, objects=objects, processes=processes,
+                                                  containment=self.containment)
+
+        if not violations and max_errors != 0:
+            self._dirty_objects.clear()
+            self._dirty_processes.clear()
+            self._validated_version = schema_registry.version
+        if collect_errors:
+            return violations
+
+    def _touch_object(self, name):
+        # an object changed: re-check it, its containers and its processes
+        self._dirty_objects[name] = None
+        for parent in self.containment.parents.get(name, ()):
+            self._dirty_objects[parent] = None
+        for process in self._participations.get(name, ()):
+            self._dirty_processes[process] = None
+
+    def _index_object(self, name):
+        self.containment.set_children(name, self.model["objects"][name].get("contained_objects"))
+        self._touch_object(name)
+
+    def _index_process(self, name):
+        for obj in self._participants(name):
+            self._participations.setdefault(obj, set()).add(name)
+        self._dirty_processes[name] = None
+
+    def _unindex_process(self, name):
+        for obj in self._participants(name):
+            self._participations.get(obj, set()).discard(name)
+
+    def _participants(self, name):
+        # malformed participants are left to validation to report
+        process = self.model["processes"][name]
+        participants = process.get("participating_objects", []) if isinstance(process, dict) else None
+        return participants if is_name_list(participants) else []
+
+    def graph(self, filename=None, output_dir='out', collapse=None, max_nodes=None):
         return create_graph_from_model(self.model,
                                         filename=filename,
-                                        output_dir=output_dir
+                                        output_dir=output_dir,
+                                        collapse=collapse,
+                                        max_nodes=max_nodes,
+                                        containment=self.containment
                                        )
 
     def specialize(self, path=None, new_type=None):
@@ -200,7 +339,8 @@ class ModelBuilder:
         current_type = current.get("type")
 
         # Check inheritance validity
-        if not schema_registry.inherits_from(new_type, current_type):
+        kind = 'object' if category == 'objects' else 'process'
+        if not schema_registry.inherits_from(new_type, current_type, kind=kind):
             raise ValueError(f"Cannot specialize '{current_type}' to '{new_type}': "
                              f"{new_type} does not inherit from {current_type}")
 
@@ -208,8 +348,142 @@ class ModelBuilder:
         specialized = current.copy()
         specialized["type"] = new_type
         self.model[category][name] = specialized
+        if category == "objects":
+            self._touch_object(name)
+        else:
+            self._dirty_processes[name] = None
         print(f"Specialized {category[:-1]} '{name}' from '{current_type}' to '{new_type}'")
 
+    def specialize_many(self, new_type, category="objects", of_type=None, pattern=None, under=None, validate=True):
+        """Specialize every selected entry of ``category`` to ``new_type``.
+
+        Entries are selected by any combination of ``of_type``, a type name
+        or a collection of them, ``pattern``, a glob or a compiled regular
+        expression matched against entry names, and ``under``, an object
+        whose containment subtree is selected (for objects only). Entries
+        that already have ``new_type`` are left alone.
+
+        Inheritance is checked once per distinct current type, before
+        anything is changed. Types are then replaced in place and, with
+        ``validate``, the changed entries, their containers and the
+        processes they take part in are validated together; if that fails
+        the previous types are restored before raising. Other entries
+        waiting for validation are left for the next :meth:`validate`.
+        Returns the names of the specialized entries.
+        """
+        if category not in ["objects", "processes"]:
+            raise ValueError(f"Invalid category '{category}'. Must be 'objects' or 'processes'.")
+        entries = self.model[category]
+        if under is not None:
+            if category != "objects":
+                raise ValueError("Containment subtrees can only select objects")
+            if under not in entries:
+                raise KeyError(f"No entry named '{under}' in 'objects'")
+            names = [under] + self.containment.descendants(under)
+        else:
+            names = list(entries)
+        if isinstance(of_type, str):
+            of_type = {of_type}
+        if isinstance(pattern, str):
+            pattern = re.compile(fnmatch.translate(pattern))
+
+        if category == "objects":
+            type_of = self._object_type
+        else:
+            type_of = lambda name: entries[name].get("type")
+        selected = {}
+        for name in names:
+            current_type = type_of(name)
+            if current_type == new_type or (of_type is not None and current_type not in of_type):
+                continue
+            if pattern is not None and not pattern.match(name):
+                continue
+            selected[name] = current_type
+
+        # one inheritance check per distinct type
+        kind = 'object' if category == 'objects' else 'process'
+        for current_type in set(selected.values()):
+            if not isinstance(current_type, str) or \
+                    not schema_registry.inherits_from(new_type, current_type, kind=kind):
+                raise ValueError(f"Cannot specialize '{current_type}' to '{new_type}': "
+                                 f"{new_type} does not inherit from {current_type}")
+
+        self._set_types(category, {name: new_type for name in selected})
+        if validate and selected:
+            objects, processes = self._affected_entries(category, selected)
+            try:
+                schema_registry.validate_template(self.model, objects=objects, processes=processes,
+                                                  containment=self.containment)
+            except Exception:
+                self._set_types(category, selected)
+                raise
+            for name in objects:
+                self._dirty_objects.pop(name, None)
+            for name in processes:
+                self._dirty_processes.pop(name, None)
+        print(f"Specialized {len(selected)} {category} to '{new_type}'")
+        return list(selected)
+
+    def _set_types(self, category, types):
+        entries = self.model[category]
+        set_type = getattr(entries, "set_type", None)
+        for name, entry_type in types.items():
+            if set_type is not None:
+                set_type(name, entry_type)
+            else:
+                entries[name]["type"] = entry_type
+            if category == "objects":
+                self._touch_object(name)
+            else:
+                self._dirty_processes[name] = None
+
+    def _affected_entries(self, category, names):
+        # the entries whose checks depend on the types of ``names``
+        if category == "processes":
+            return [], list(names)
+        objects, processes = {}, {}
+        for name in names:
+            objects[name] = None
+            for parent in self.containment.parents.get(name, ()):
+                objects[parent] = None
+            for process in self._participations.get(name, ()):
+                processes[process] = None
+        return list(objects), list(processes)
+
+    def fill_defaults(self, objects=None, processes=None):
+        """Add the attribute defaults of each entry's type, inherited ones included.
+
+        See :meth:`SchemaRegistry.fill_defaults`. Returns the names of the
+        objects and processes that changed.
+        """
+        objects, processes = schema_registry.fill_defaults(self.model, objects, processes)
+        for name in objects:
+            self._touch_object(name)
+        for name in processes:
+            self._dirty_processes[name] = None
+        return objects, processes
+
+    # Autocomplete
+    # Suggestions for editors and notebooks, answered from the registry's
+    # reverse indexes rather than by scanning every registered type.
+
+    def suggest_processes(self, obj_name):
+        """Return the sorted process types object ``obj_name`` can take part in."""
+        return sorted(schema_registry.compatible_processes(self._object_type(obj_name)))
+
+    def suggest_containers(self, obj_name):
+        """Return the names of the objects in the model that may contain ``obj_name``."""
+        container_types = schema_registry.allowed_containers(self._object_type(obj_name))
+        return [name for name in self.model["objects"]
+                if name != obj_name and self._object_type(name) in container_types]
+
+    def specialization_options(self, path):
+        """Return the sorted types the entry at ``path`` can be specialized to."""
+        category, name = path
+        kind = 'object' if category == 'objects' else 'process'
+        current_type = self._object_type(name) if kind == 'object' else self.model[category][name].get("type")
+        return sorted(schema_registry.subtypes_of(current_type, kind))
+
     def add_object(self,
                    name,
                    object_type,
@@ -230,6 +504,7 @@ class ModelBuilder:
             "boundary_conditions": boundary_conditions,
             "contained_objects": contained_objects
         }
+        self._index_object(name)
 
     def add_process(self,
                     name,
@@ -245,13 +520,175 @@ class ModelBuilder:
             participating_objects = [participating_objects]
         assert isinstance(participating_objects, list), "Participating objects must be a list or string"
 
+        if name in self.model["processes"]:
+            self._unindex_process(name)
         self.model["processes"][name] = {
             "type": process_type,
             "attributes": attributes,
             "participating_objects": participating_objects
         }
-
-    def save(self, filename, directory="models"):
+        self._index_process(name)
+
+    def add_objects(self,
+                    names,
+                    object_type,
+                    attributes=None,
+                    columns=None,
+                    boundary_conditions=None,
+                    container=None,
+                    name_format="{type} {index}"
+                    ):
+        """Add many objects of one type in one step, and return their names.
+
+        ``names`` is an iterable of names, or a count of objects to name
+        with ``name_format``. ``attributes`` are shared by every object;
+        ``columns`` maps attribute names to sequences or NumPy arrays with
+        one value per object. The new objects are appended to the
+        ``contained_objects`` of ``container``.
+
+        The type and its containment by ``container`` are checked once, on
+        the first object, and the first violation is raised. The new objects
+        are not re-checked one by one by the next :meth:`validate`.
+        """
+        names = _bulk_names(names, object_type, name_format)
+        rows = _bulk_rows(columns, len(names))
+        if container is not None and container not in self.model["objects"]:
+            raise KeyError(f"No entry named '{container}' in 'objects'")
+
+        attributes = attributes or {}
+        boundary_conditions = boundary_conditions or {}
+        entries = {}
+        for name, row in zip(names, rows):
+            object_attributes = dict(attributes)
+            object_attributes.update(row)
+            entries[name] = {
+                "type": object_type,
+                "attributes": object_attributes,
+                "boundary_conditions": dict(boundary_conditions),
+                "contained_objects": []
+            }
+        if not entries:
+            return names
+        self._check_sample(objects=self._object_sample(names[0], entries[names[0]], container))
+
+        # objects that replace or were referenced by other entries are re-checked
+        objects = self.model["objects"]
+        touched = [name for name in names
+                   if name in objects or name in self.containment.parents or name in self._participations]
+        objects.update(entries)
+        for name in touched:
+            self.containment.set_children(name, None)
+        if container is not None:
+            parent = objects[container]
+            children = [name for name in names if container not in self.containment.parents.get(name, ())]
+            parent["contained_objects"] = list(parent.get("contained_objects", [])) + children
+            objects[container] = parent
+            self.containment.add_children(container, children)
+        for name in touched:
+            self._touch_object(name)
+        return names
+
+    def add_processes(self,
+                      names,
+                      process_type,
+                      participating_objects,
+                      attributes=None,
+                      columns=None,
+                      name_format="{type} {index}"
+                      ):
+        """Add many processes of one type in one step, and return their names.
+
+        ``participating_objects`` has one item per process: an object name,
+        or a list of names. ``names``, ``attributes`` and ``columns`` are as
+        for :meth:`add_objects`.
+
+        Participation is checked once per distinct participating object
+        type, and the first violation is raised. Processes with participants
+        that are not in the model yet are left for :meth:`validate`.
+        """
+        names = _bulk_names(names, process_type, name_format)
+        rows = _bulk_rows(columns, len(names))
+        participating_objects = list(participating_objects)
+        if len(participating_objects) != len(names):
+            raise ValueError(f"Expected participating objects for {len(names)} processes, "
+                             f"got {len(participating_objects)}")
+
+        attributes = attributes or {}
+        objects = self.model["objects"]
+        entries = {}
+        samples = {}
+        unresolved = []
+        for name, row, participants in zip(names, rows, participating_objects):
+            participants = [participants] if isinstance(participants, str) else list(participants)
+            process_attributes = dict(attributes)
+            process_attributes.update(row)
+            entries[name] = {
+                "type": process_type,
+                "attributes": process_attributes,
+                "participating_objects": participants
+            }
+            for obj in participants:
+                if obj not in objects:
+                    unresolved.append(name)
+                    continue
+                object_type = self._object_type(obj)
+                if object_type not in samples:
+                    samples[object_type] = obj
+        if not entries:
+            return names
+
+        # one stand-in process, with one participant of each distinct type
+        sample = {
+            "objects": {obj: {"type": object_type} for object_type, obj in samples.items()},
+            "processes": {names[0]: {"type": process_type, "participating_objects": list(samples.values())}},
+        }
+        self._check_sample(sample=sample, processes=[names[0]])
+
+        processes = self.model["processes"]
+        for name in names:
+            if name in processes:
+                self._unindex_process(name)
+                self._dirty_processes[name] = None
+        processes.update(entries)
+        for name, entry in entries.items():
+            for obj in entry["participating_objects"]:
+                self._participations.setdefault(obj, set()).add(name)
+        for name in unresolved:
+            self._dirty_processes[name] = None
+        return names
+
+    def _object_type(self, name):
+        objects = self.model["objects"]
+        if hasattr(objects, "type_of"):
+            return objects.type_of(name)
+        return objects[name].get("type")
+
+    def _object_sample(self, name, entry, container):
+        # a new object, and its container holding only that object
+        sample = {name: entry}
+        if container is not None:
+            sample[container] = dict(self.model["objects"][container], contained_objects=[name])
+        return sample
+
+    def _check_sample(self, objects=None, sample=None, processes=()):
+        if sample is None:
+            sample = {"objects": objects, "processes": {}}
+        sample["id"] = self.model.get("id")
+        violations = schema_registry.iter_violations(sample, objects=list(objects or ()),
+                                                     processes=list(processes))
+        for violation in violations:
+            violation.raise_error()
+
+    def save(self, filename, directory="models", mode="pretty", compress=None, units=None):
+        """Validate the model and write it to ``directory``.
+
+        ``mode`` is 'pretty', 'compact' or 'canonical' (see
+        :mod:`multicell_utils.serialize`); ``compress`` defaults to whether
+        ``filename`` ends in ``.gz``. The file is replaced atomically.
+        ``units`` maps attribute names to the units to write their values
+        in, converting from those of the schemas; the model itself is not
+        changed.
+        """
         try:
             self.validate()
         except ValidationError as e:
@@ -262,8 +699,12 @@ class ModelBuilder:
         absolute_directory = os.path.join(project_root, directory)
         if not os.path.exists(absolute_directory):
             os.makedirs(absolute_directory)
-        with open(os.path.join(absolute_directory, filename), 'w') as file:
-            json.dump(self.model, file, indent=4)
+        with instrument.phase('builder.save'):
+            model = self.to_dict()
+            if units:
+                model = convert_model(model, units, registry=schema_registry, inplace=False)
+            serialize.dump(model, os.path.join(absolute_directory, filename), mode=mode, compress=compress)
+            ModelIdAllocator(absolute_directory).register(filename, model.get('id'))
         print(f"Model saved to {os.path.join(directory, filename)}")
 
 
@@ -345,6 +786,168 @@ def test_invalid_model():
     demo4.add_process(name='diffusion', process_type='Diffusion', participating_objects='cell')
     validate_model_fails(demo4)
 
+
+def test_incremental_validation():
+    demo = ModelBuilder(model_name='incremental')
+    demo.add_object(name='universe', object_type='Universe', contained_objects=['cell field'])
+    demo.add_object(name='cell field', object_type='CellField', contained_objects=['cell'])
+    demo.add_object(name='cell', object_type='Cell')
+    demo.add_process(name='growth', process_type='CellGrowth', participating_objects='cell')
+    demo.validate()
+    assert not demo._dirty_objects and not demo._dirty_processes
+
+    # replacing an object re-checks it, its container and its processes
+    demo.add_object(name='cell', object_type='Field')
+    assert set(demo._dirty_objects) == {'cell', 'cell field'}
+    assert set(demo._dirty_processes) == {'growth'}
+    validate_model_fails(demo)
+
+    # the failed entries stay dirty until the model validates again
+    demo.add_object(name='cell', object_type='CellCPM')
+    demo.validate()
+    demo.validate(full=True)
+
+    # objects referenced before they exist are re-checked once added
+    demo.add_process(name='motility', process_type='MotileForce', participating_objects='cell 2')
+    violations = demo.validate(collect_errors=True)
+    assert [v.rule for v in violations] == ['missing_object']
+    demo.add_object(name='cell 2', object_type='Cell')
+    assert 'motility' in demo._dirty_processes
+    demo.validate()
+
+    # the containment index follows edits and catches cycles incrementally
+    assert demo.containment.ancestors('cell') == ['cell field', 'universe']
+    demo.add_object(name='cell 2', object_type='CellField', contained_objects=['cell field'])
+    demo.add_object(name='cell field', object_type='CellField', contained_objects=['cell 2'])
+    rules = {v.rule for v in demo.validate(collect_errors=True)}
+    assert rules >= {'containment_cycle', 'multiple_parents'}
+
+
+def test_bulk_insertion():
+    for compact in [False, True]:
+        demo = ModelBuilder(model_name='bulk', compact=compact)
+        demo.add_object(name='field', object_type='CellField')
+        demo.add_object(name='chemical field', object_type='Field')
+        demo.validate()
+
+        volumes = [float(i) for i in range(1000)]
+        cells = demo.add_objects(1000, 'Cell', attributes={'unit': 'um'}, columns={'volume': volumes},
+                                 container='field', name_format='cell {index}')
+        demo.add_processes((f"growth {cell}" for cell in cells), 'CellGrowth', participating_objects=cells)
+        assert not demo._dirty_objects and not demo._dirty_processes
+        demo.validate(full=True)
+        model = demo.to_dict()
+        assert model['objects']['field']['contained_objects'] == cells
+        assert model['objects']['cell 7']['attributes'] == {'unit': 'um', 'volume': 7.0}
+        assert demo.containment.subtree_size('field') == 1001
+
+        # type and participation problems are raised once for the batch
+        try:
+            demo.add_objects(['a', 'b'], 'Field', container='field')
+        except AssertionError:
+            pass
+        else:
+            raise AssertionError("Containment of Field by CellField should fail")
+        try:
+            demo.add_processes(2, 'Diffusion', participating_objects=[['cell 0'], ['chemical field']])
+        except AssertionError:
+            pass
+        else:
+            raise AssertionError("Diffusion of a Cell should fail")
+        assert 'a' not in demo.model['objects'] and 'Diffusion 0' not in demo.model['processes']
+
+        # participants added later are checked by validate()
+        demo.add_processes(['late growth'], 'CellGrowth', participating_objects=['late cell'])
+        assert [v.rule for v in demo.validate(collect_errors=True)] == ['missing_object']
+        demo.add_objects(['late cell'], 'CellCPM', container='field')
+        assert set(demo._dirty_processes) == {'late growth'}
+        demo.validate()
+
+
+def test_save_compressed():
+    import tempfile
+    demo = ModelBuilder(model_name='compressed')
+    demo.add_object(name='space', object_type='MaterialObjectSpace', contained_objects=['cell'])
+    demo.add_object(name='cell', object_type='Cell', attributes={'volume': 2.0})
+    with tempfile.TemporaryDirectory() as directory:
+        demo.save('compressed.json.gz', directory=directory, mode='compact')
+        loaded = ModelBuilder(model_file=os.path.join(directory, 'compressed.json.gz'))
+        assert os.listdir(directory) == ['compressed.json.gz']
+    assert loaded.model == demo.model
+
+
+def test_save_units():
+    import tempfile
+    demo = ModelBuilder(model_name='units')
+    demo.add_object(name='space', object_type='MaterialObjectSpace', contained_objects=['cell'])
+    demo.add_object(name='cell', object_type='Cell')
+    demo.add_process(name='growth', process_type='CellGrowth', participating_objects=['cell'],
+                     attributes={'growth_rate': 36.0})
+    with tempfile.TemporaryDirectory() as directory:
+        demo.save('units.json', directory=directory, units={'growth_rate': '1/s'})
+        saved = serialize.load(os.path.join(directory, 'units.json'))
+        loaded = ModelBuilder(model_file=os.path.join(directory, 'units.json'), units={'growth_rate': '1/s'})
+    assert abs(saved['processes']['growth']['attributes']['growth_rate'] - 0.01) < 1e-12
+    assert demo.model['processes']['growth']['attributes']['growth_rate'] == 36.0
+    assert abs(loaded.model['processes']['growth']['attributes']['growth_rate'] - 36.0) < 1e-9
+
+
+def test_model_from_template():
+    # the checked-in Cellular Potts template is not valid yet
+    try:
+        ModelBuilder.from_template('cellular_potts')
+    except AssertionError:
+        pass
+    else:
+        raise AssertionError("Instantiating an invalid template should fail")
+
+    schema_registry.register_template({
+        'name': 'Potts',
+        'objects': {'cell_field': 'CPMCellField', 'cells': 'CellPopulation'},
+        'structure': {'cell_field': ['cells']},
+        'processes': {'growth': {'type': 'CellGrowth', 'participating_objects': ['cells']}},
+    }, 'builder_test_potts')
+    try:
+        demo = ModelBuilder.from_template('builder_test_potts', model_name='potts', compact=True,
+                                          rename={'cells': 'population'}, objects={'cells': {'size': 10}})
+    finally:
+        del schema_registry._templates['builder_test_potts']
+    assert not demo._dirty_objects and not demo._dirty_processes
+    assert demo.model['name'] == 'potts' and demo.model['id'].startswith('model_')
+    assert demo.model['objects']['population']['attributes'] == {'size': 10}
+    assert demo.containment.parent('population') == 'cell_field'
+    assert demo.validate(collect_errors=True, full=True) == []
+
+
+def test_subtree_cache_validation():
+    cache = SubtreeCache()
+    for volume in [1.0, 2.0]:
+        demo = ModelBuilder(model_name='sweep')
+        demo.add_object(name='field', object_type='CellField')
+        demo.add_objects(20, 'Cell', columns={'volume': [volume] * 19 + [0.0]}, container='field')
+        assert demo.validate(collect_errors=True, subtree_cache=cache) == []
+    # the second model shares only the last cell with the first
+    assert ('subtree', ModelHashes(demo.model).subtrees['Cell 19']) in cache
+    demo.add_object(name='Cell 3', object_type='Field')
+    violations = demo.validate(collect_errors=True, full=True, subtree_cache=cache)
+    assert [v.rule for v in violations] == ['containment']
+
+
+def test_compact_model_builder():
+    demo = ModelBuilder(model_name='compact', compact=True)
+    demo.add_object(name='space', object_type='MaterialObjectSpace', contained_objects=['cell'])
+    demo.add_object(name='cell', object_type='Cell', attributes={'volume': 2.0})
+    demo.add_process(name='motility', process_type='MotileForce', participating_objects='cell')
+    demo.validate()
+    assert demo.model['objects'].records['space'].attributes is None
+    demo.specialize(path=['objects', 'cell'], new_type='CellCPM')
+    demo.validate()
+    model = demo.to_dict()
+    assert model['objects']['cell'] == {
+        'type': 'CellCPM', 'attributes': {'volume': 2.0}, 'boundary_conditions': {}, 'contained_objects': []}
+    assert CompactModel.from_dict(model).to_dict() == model
+
+
 def test_model_specialize():
     cell_migration = ModelBuilder(model_name="cell_migration")
 
@@ -392,6 +995,75 @@ def test_model_specialize():
     cell_migration.graph(filename='cell_migration_cpm')
 
 
+def test_fill_defaults():
+    for compact in (False, True):
+        builder = ModelBuilder(model_name='defaults', compact=compact)
+        builder.add_object('field', 'CellField', attributes={'medium': 'matrix'})
+        builder.add_object('chemical', 'ChemicalField')
+        builder.add_process('diffusion', 'Diffusion', participating_objects=['chemical'])
+        builder.validate()
+        objects, processes = builder.fill_defaults()
+        assert 'field' in objects and processes == ['diffusion']
+        assert builder.model['objects']['field']['attributes']['medium'] == 'matrix'
+        assert builder.model['objects']['field']['attributes']['cell species'] == ['none']
+        assert builder.model['processes']['diffusion']['attributes'] == {'diffusion_coeffient': 0.0}
+        assert 'diffusion' in builder._dirty_processes
+        builder.validate()
+
+
+def test_autocomplete():
+    demo = ModelBuilder(model_name='autocomplete')
+    demo.add_object(name='space', object_type='MaterialObjectSpace', contained_objects=['field'])
+    demo.add_object(name='field', object_type='CellField', contained_objects=['cell'])
+    demo.add_object(name='cell', object_type='Cell')
+    assert 'CellGrowth' in demo.suggest_processes('cell')
+    assert demo.suggest_containers('cell') == ['space', 'field']
+    assert demo.suggest_containers('field') == []
+    assert 'CellCPM' in demo.specialization_options(['objects', 'cell'])
+    assert demo.specialization_options(['objects', 'space']) == []
+
+
+def test_specialize_many():
+    for compact in (False, True):
+        demo = ModelBuilder(model_name='bulk_specialize', compact=compact)
+        demo.add_object(name='space', object_type='Universe', contained_objects=['field', 'environment'])
+        demo.add_object(name='environment', object_type='MaterialObjectSpace', contained_objects=['free'])
+        demo.add_object(name='field', object_type='CellField')
+        demo.add_objects(100, 'Cell', container='field')
+        demo.add_object(name='free', object_type='Cell')
+        demo.add_processes(['growth'], 'CellGrowth', participating_objects=[['Cell 0', 'free']])
+        demo.validate()
+
+        with instrument.collect() as stats:
+            names = demo.specialize_many('CellCPM', of_type='Cell', under='field', pattern='Cell *')
+        assert len(names) == 100 and 'free' not in names
+        assert stats.counters['validations'] == 1
+        assert demo._object_type('Cell 42') == 'CellCPM' and demo._object_type('free') == 'Cell'
+        assert demo.model['objects']['Cell 42']['type'] == 'CellCPM'
+        assert demo.specialize_many('CellCPM', of_type='Cell', under='field') == []
+
+        # an invalid pair is rejected before anything changes
+        try:
+            demo.specialize_many('CellCPM', of_type=['Cell', 'CellField'])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("CellField cannot become CellCPM")
+        assert demo._object_type('free') == 'Cell'
+
+        # unrelated pending edits are neither validated nor a reason to roll back
+        demo.add_object(name='bogus', object_type='NoSuchType')
+        names = demo.specialize_many('CellCPM', of_type='Cell', under='environment')
+        assert names == ['free'] and demo._object_type('free') == 'CellCPM'
+        assert 'bogus' in demo._dirty_objects and 'free' not in demo._dirty_objects
+        try:
+            demo.validate()
+        except AssertionError as error:
+            assert 'NoSuchType' in str(error)
+        else:
+            raise AssertionError("The pending invalid entry should still be validated")
+
+
 if __name__ == '__main__':
     # test_schema_creator()
     # test_invalid_model()
@@ -0,0 +1,134 @@
+import sys
+import hashlib
+from collections import OrderedDict
+
+from multicell_utils import instrument, serialize
+
+
+def model_digest(model):
+    """Hash of the canonical JSON of ``model``; equal models give equal digests."""
+    if hasattr(model, 'to_dict'):
+        model = model.to_dict()
+    return hashlib.blake2b(serialize.dumps(model, 'canonical', backend='json'), digest_size=20).hexdigest()
+
+
+class ValidationCache:
+    """Bounded LRU cache of validation results.
+
+    Results are the full lists of violations of a model, keyed by the
+    model's canonical digest and stored along with the registry version
+    they were computed under. Any change of version, that is any call of
+    ``register_object`` or ``register_process``, empties the cache on its
+    next use. At most ``max_entries`` results and about ``max_bytes`` of
+    them are kept, the least recently used being evicted first.
+    """
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, digest, version):
+        """Return the cached violations, or None."""
+        self._check_version(version)
+        entry = self.entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            instrument.count('validation_cache.misses')
+            return None
+        self.entries.move_to_end(digest)
+        self.hits += 1
+        instrument.count('validation_cache.hits')
+        return list(entry[0])
+
+    def put(self, digest, version, violations):
+        self._check_version(version)
+        if digest in self.entries:
+            self.size -= self.entries.pop(digest)[1]
+        size = _estimate_size(digest, violations)
+        if size > self.max_bytes:
+            return
+        self.entries[digest] = (tuple(violations), size)
+        self.size += size
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self.size -= self.entries.popitem(last=False)[1][1]
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else None,
+        }
+
+    def _check_version(self, version):
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+
+def _estimate_size(digest, violations):
+    # the key, the entry tuples, and each violation with its message
+    size = sys.getsizeof(digest) + 200
+    for violation in violations:
+        size += 300 + sys.getsizeof(violation.message) + sum(sys.getsizeof(part) for part in violation.path)
+    return size
+
+
+def test_validation_cache():
+    cache = ValidationCache(max_entries=2)
+    assert cache.get('a', 1) is None
+    cache.put('a', 1, [])
+    cache.put('b', 1, [])
+    assert cache.get('a', 1) == []
+    cache.put('c', 1, [])
+    assert 'b' not in cache.entries and cache.evictions == 1
+    assert cache.get('a', 2) is None and not cache.entries
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+    small = ValidationCache(max_bytes=2 * _estimate_size('a', []))
+    small.put('a', 1, [])
+    small.put('b', 1, [])
+    assert list(small.entries) == ['a', 'b']
+    small.put('c', 1, [])
+    assert list(small.entries) == ['b', 'c'] and small.size <= small.max_bytes
+
+
+def test_registry_validation_cache():
+    import json
+    from multicell_utils.registry import SchemaRegistry, object_schemas_dir, process_schemas_dir, project_root
+    registry = SchemaRegistry()
+    registry.add_schema_directory(object_schemas_dir, 'object')
+    registry.add_schema_directory(process_schemas_dir, 'process')
+    registry.validation_cache = ValidationCache()
+    with open(f"{project_root}/models/cell_sorting.json", 'r') as file:
+        model = json.load(file)
+
+    first = registry.collect_violations(model)
+    assert registry.collect_violations(json.loads(json.dumps(model))) == first
+    assert registry.collect_violations(model, max_errors=1) == first[:1]
+    assert registry.validation_cache.stats()['hits'] == 2
+    try:
+        registry.validate_template(model)
+    except (AssertionError, ValueError) as error:
+        assert str(error) == first[0].message
+    assert registry.validation_cache.hits == 3
+
+    # partial validations are not cached, and registry changes invalidate results
+    registry.collect_violations(model, objects=['dark'])
+    assert registry.validation_cache.hits + registry.validation_cache.misses == 4
+    registry.register_object({'type': 'Extra', 'attributes': {}}, 'Extra')
+    registry.collect_violations(model)
+    assert registry.validation_cache.misses == 2
@@ -0,0 +1,291 @@
+import os
+import json
+import sqlite3
+import tempfile
+
+from multicell_utils.registry import project_root
+from multicell_utils.stream import load_model_index
+from multicell_utils.serialize import dump
+
+
+CATALOG_FILENAME = '.model_index.sqlite'
+CATALOG_FORMAT = 1
+
+_TABLES = """
+CREATE TABLE IF NOT EXISTS files (
+    file TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, model_id TEXT, name TEXT);
+CREATE TABLE IF NOT EXISTS objects (file TEXT, name TEXT, type TEXT);
+CREATE TABLE IF NOT EXISTS processes (file TEXT, name TEXT, type TEXT);
+CREATE TABLE IF NOT EXISTS participations (file TEXT, process TEXT, object TEXT);
+CREATE TABLE IF NOT EXISTS containment (file TEXT, parent TEXT, child TEXT);
+CREATE TABLE IF NOT EXISTS object_types (file TEXT, type TEXT);
+CREATE TABLE IF NOT EXISTS process_types (file TEXT, type TEXT);
+CREATE TABLE IF NOT EXISTS participation_types (file TEXT, process_type TEXT, object_type TEXT);
+CREATE TABLE IF NOT EXISTS containment_types (file TEXT, parent_type TEXT, child_type TEXT);
+CREATE INDEX IF NOT EXISTS files_model_id ON files (model_id);
+CREATE INDEX IF NOT EXISTS objects_type ON objects (type, file);
+CREATE INDEX IF NOT EXISTS objects_name ON objects (file, name);
+CREATE INDEX IF NOT EXISTS processes_type ON processes (type, file);
+CREATE INDEX IF NOT EXISTS participations_process ON participations (file, process);
+CREATE INDEX IF NOT EXISTS containment_parent ON containment (file, parent);
+CREATE INDEX IF NOT EXISTS object_types_type ON object_types (type, file);
+CREATE INDEX IF NOT EXISTS process_types_type ON process_types (type, file);
+CREATE INDEX IF NOT EXISTS participation_types_types ON participation_types (process_type, object_type, file);
+CREATE INDEX IF NOT EXISTS containment_types_types ON containment_types (parent_type, child_type, file);
+"""
+_ENTRY_TABLES = ['objects', 'processes', 'participations', 'containment',
+                  'object_types', 'process_types', 'participation_types', 'containment_types']
+
+
+class ModelCatalog:
+    """SQLite index of the models in ``models_dir``.
+
+    For every model file the catalog keeps its id and name, the name and
+    type of each object and process, which objects each process
+    participates with, and the containment edges. The distinct object and
+    process types of each file, and its distinct (process type, object
+    type) and (parent type, child type) pairs, are kept as well, so that
+    queries by type touch one row per type and file. The catalog is brought
+    up to date
+    before each query by comparing file mtimes and sizes with the indexed
+    ones, so only new or modified files are parsed; queries then run in
+    SQLite without reading any JSON.
+
+    Type arguments to the queries also match the types that inherit from
+    them, as registered in ``registry``, unless ``subtypes=False``.
+
+    Checking for changed files takes one ``stat`` per model file; with
+    ``auto_update=False`` queries skip it and :meth:`update` is called
+    explicitly.
+    """
+    def __init__(self, models_dir=None, db_path=None, registry=None, auto_update=True):
+        self.models_dir = models_dir or os.path.join(project_root, 'models')
+        self.db_path = db_path or os.path.join(self.models_dir, CATALOG_FILENAME)
+        self._registry = registry
+        self.auto_update = auto_update
+        self.connection = sqlite3.connect(self.db_path)
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != CATALOG_FORMAT:
+            with self.connection:
+                for table in ['files'] + _ENTRY_TABLES:
+                    self.connection.execute(f'DROP TABLE IF EXISTS {table}')
+                self.connection.execute(f'PRAGMA user_version = {CATALOG_FORMAT}')
+        self.connection.executescript(_TABLES)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def registry(self):
+        if self._registry is None:
+            from schema import schema_registry
+            self._registry = schema_registry
+        return self._registry
+
+    # Updates
+
+    def update(self):
+        """Index new and modified model files and drop deleted ones.
+
+        Returns the number of files that were parsed.
+        """
+        indexed = {file: (mtime_ns, size) for file, mtime_ns, size in
+                   self.connection.execute('SELECT file, mtime_ns, size FROM files')}
+        current = {}
+        for filename in os.listdir(self.models_dir):
+            if not filename.endswith(('.json', '.json.gz')):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.models_dir, filename))
+            except OSError:
+                continue
+            current[filename] = (stat.st_mtime_ns, stat.st_size)
+
+        changed = [filename for filename, fingerprint in current.items() if indexed.get(filename) != fingerprint]
+        removed = [filename for filename in indexed if filename not in current]
+        if not changed and not removed:
+            return 0
+        with self.connection:
+            for filename in removed + changed:
+                self._remove(filename)
+            for filename in changed:
+                self._add(filename, current[filename])
+        return len(changed)
+
+    def _remove(self, filename):
+        for table in ['files'] + _ENTRY_TABLES:
+            self.connection.execute(f'DELETE FROM {table} WHERE file = ?', (filename,))
+
+    def _add(self, filename, fingerprint):
+        try:
+            model = load_model_index(os.path.join(self.models_dir, filename))
+        except (OSError, ValueError):
+            print(f"Error loading model from {filename}")
+            model = {'objects': {}, 'processes': {}}
+        model_id = model.get('id')
+        name = model.get('name')
+        self.connection.execute(
+            'INSERT INTO files VALUES (?, ?, ?, ?, ?)',
+            (filename, fingerprint[0], fingerprint[1],
+             model_id if isinstance(model_id, str) else None, name if isinstance(name, str) else None))
+
+        objects = model['objects'] if isinstance(model.get('objects'), dict) else {}
+        processes = model['processes'] if isinstance(model.get('processes'), dict) else {}
+        self.connection.executemany(
+            'INSERT INTO objects VALUES (?, ?, ?)',
+            [(filename, obj_name, _text(obj['type'])) for obj_name, obj in objects.items()])
+        self.connection.executemany(
+            'INSERT INTO containment VALUES (?, ?, ?)',
+            [(filename, obj_name, child) for obj_name, obj in objects.items()
+             for child in _names(obj.get('contained_objects'))])
+        self.connection.executemany(
+            'INSERT INTO processes VALUES (?, ?, ?)',
+            [(filename, proc_name, _text(proc['type'])) for proc_name, proc in processes.items()])
+        self.connection.executemany(
+            'INSERT INTO participations VALUES (?, ?, ?)',
+            [(filename, proc_name, obj_name) for proc_name, proc in processes.items()
+             for obj_name in _names(proc.get('participating_objects'))])
+
+        self.connection.executemany(
+            'INSERT INTO object_types VALUES (?, ?)',
+            [(filename, object_type) for object_type in dict.fromkeys(_text(obj['type']) for obj in objects.values())])
+        self.connection.executemany(
+            'INSERT INTO process_types VALUES (?, ?)',
+            [(filename, process_type) for process_type in dict.fromkeys(_text(proc['type']) for proc in processes.values())])
+
+        def type_of(name):
+            return _text(objects[name]['type']) if name in objects else None
+        self.connection.executemany(
+            'INSERT INTO containment_types VALUES (?, ?, ?)',
+            [(filename,) + pair for pair in dict.fromkeys(
+                (_text(obj['type']), type_of(child)) for obj in objects.values()
+                for child in _names(obj.get('contained_objects')))])
+        self.connection.executemany(
+            'INSERT INTO participation_types VALUES (?, ?, ?)',
+            [(filename,) + pair for pair in dict.fromkeys(
+                (_text(proc['type']), type_of(obj_name)) for proc in processes.values()
+                for obj_name in _names(proc.get('participating_objects')))])
+
+    # Queries
+
+    def models(self):
+        """Ids of all indexed models."""
+        return self._model_ids('SELECT model_id FROM files', ())
+
+    def files(self, model_id):
+        """Model files with the id ``model_id``."""
+        self._refresh()
+        rows = self.connection.execute('SELECT file FROM files WHERE model_id = ? ORDER BY file', (model_id,))
+        return [file for file, in rows]
+
+    def models_with_object(self, object_type, subtypes=True):
+        """Ids of models with an object of ``object_type``."""
+        types = self._types('object', object_type, subtypes)
+        return self._model_ids(
+            f'SELECT f.model_id FROM files f JOIN object_types t ON t.file = f.file '
+            f'WHERE t.type IN ({_marks(types)})', types)
+
+    def models_with_process(self, process_type, subtypes=True):
+        """Ids of models with a process of ``process_type``."""
+        types = self._types('process', process_type, subtypes)
+        return self._model_ids(
+            f'SELECT f.model_id FROM files f JOIN process_types t ON t.file = f.file '
+            f'WHERE t.type IN ({_marks(types)})', types)
+
+    def models_with_participation(self, process_type, object_type, subtypes=True):
+        """Ids of models where a ``process_type`` process participates with an ``object_type`` object."""
+        process_types = self._types('process', process_type, subtypes)
+        object_types = self._types('object', object_type, subtypes)
+        return self._model_ids(
+            f'SELECT f.model_id FROM files f JOIN participation_types t ON t.file = f.file '
+            f'WHERE t.process_type IN ({_marks(process_types)}) AND t.object_type IN ({_marks(object_types)})',
+            process_types + object_types)
+
+    def models_with_containment(self, parent_type, child_type, subtypes=True):
+        """Ids of models where a ``parent_type`` object contains a ``child_type`` object."""
+        parent_types = self._types('object', parent_type, subtypes)
+        child_types = self._types('object', child_type, subtypes)
+        return self._model_ids(
+            f'SELECT f.model_id FROM files f JOIN containment_types t ON t.file = f.file '
+            f'WHERE t.parent_type IN ({_marks(parent_types)}) AND t.child_type IN ({_marks(child_types)})',
+            parent_types + child_types)
+
+    def objects_of_type(self, object_type, subtypes=True):
+        """``(model_id, object name, type)`` for every object of ``object_type``."""
+        self._refresh()
+        types = self._types('object', object_type, subtypes)
+        rows = self.connection.execute(
+            f'SELECT f.model_id, o.name, o.type FROM files f JOIN objects o ON o.file = f.file '
+            f'WHERE o.type IN ({_marks(types)}) ORDER BY f.model_id, o.name', types)
+        return rows.fetchall()
+
+    def _refresh(self):
+        if self.auto_update:
+            self.update()
+
+    def _model_ids(self, query, parameters):
+        self._refresh()
+        rows = self.connection.execute(f'SELECT DISTINCT model_id FROM ({query}) '
+                                       f'WHERE model_id IS NOT NULL ORDER BY model_id', parameters)
+        return [model_id for model_id, in rows]
+
+    def _types(self, kind, type_name, subtypes):
+        # the type itself, and every registered type that inherits from it
+        if not subtypes:
+            return [type_name]
+        registered = self.registry.object_types if kind == 'object' else self.registry.process_types
+        return [type_name] + sorted(t for t in registered
+                                    if t != type_name and self.registry.inherits_from(t, type_name, kind=kind))
+
+
+def _text(value):
+    return value if isinstance(value, str) else None
+
+
+def _names(value):
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list):
+        return [name for name in value if isinstance(name, str)]
+    return []
+
+
+def _marks(values):
+    return ', '.join('?' * len(values))
+
+
+def test_model_catalog():
+    models_dir = os.path.join(project_root, 'models')
+    with tempfile.TemporaryDirectory() as directory:
+        for filename in ['cell_sorting.json', 'cell_migration.json', 'example1.json']:
+            with open(os.path.join(models_dir, filename), 'r') as file:
+                model = json.load(file)
+            with open(os.path.join(directory, filename), 'w') as file:
+                json.dump(model, file)
+
+        with ModelCatalog(directory) as catalog:
+            assert catalog.update() == 3 and catalog.update() == 0
+            assert catalog.models() == ['model_000035', 'model_000044', 'model_002']
+            assert catalog.models_with_process('Chemotaxis') == ['model_000035']
+            assert catalog.models_with_object('CellPopulation') == ['model_000035']
+            assert catalog.models_with_object('Cell') == ['model_000035', 'model_000044', 'model_002']
+            assert catalog.models_with_object('Cell', subtypes=False) == ['model_000044', 'model_002']
+            assert catalog.models_with_participation('MotileForce', 'Cell') == ['model_000035', 'model_000044']
+            assert catalog.models_with_participation('MotileForce', 'Cell', subtypes=False) == ['model_000044']
+            assert catalog.models_with_participation('Diffusion', 'Cell') == []
+            assert catalog.models_with_containment('MaterialObjectSpace', 'Cell') == ['model_000044']
+            assert ('model_000044', 'single_cell', 'Cell') in catalog.objects_of_type('Material')
+
+            # edits and deletions are picked up from file mtimes and sizes
+            os.remove(os.path.join(directory, 'example1.json'))
+            model['id'] = 'model_000050'
+            model['objects']['extra'] = {'type': 'ECM', 'attributes': {}}
+            dump(model, os.path.join(directory, 'example1.json.gz'), mode='compact')
+            assert catalog.models_with_object('ECM') == ['model_000050']
+            assert catalog.files('model_000050') == ['example1.json.gz'] and catalog.files('model_002') == []
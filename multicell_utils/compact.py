@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+from collections.abc import Mapping, MutableMapping
+
+from multicell_utils.registry import project_root
+from multicell_utils import serialize
+
+
+SECTIONS = {
+    'objects': 'contained_objects',
+    'processes': 'participating_objects',
+}
+
+# key layouts, shared by every entry with the same keys in the same order
+_layouts = {}
+
+
+def _layout(keys):
+    keys = tuple(keys)
+    return _layouts.setdefault(keys, keys)
+
+
+class _Entry:
+    """Compact record for one object or process entry.
+
+    Type names and referenced object names are interned strings, the
+    references are a tuple, and empty ``attributes`` or
+    ``boundary_conditions`` are stored as None until something is written
+    into them. ``layout`` is a shared tuple of the entry's keys in their
+    original order, so that absent and empty keys and the key order survive
+    a round trip. Keys other than the standard ones are kept in ``extra``.
+    """
+    __slots__ = ('type', 'layout', 'attributes', 'boundary_conditions', 'refs', 'extra')
+
+    def __init__(self, entry, references):
+        self.layout = _layout(entry)
+        self.type = None
+        self.attributes = None
+        self.boundary_conditions = None
+        self.refs = ()
+        self.extra = None
+        for key, value in entry.items():
+            if key == 'type' and isinstance(value, str):
+                self.type = sys.intern(value)
+            elif key in ('attributes', 'boundary_conditions') and isinstance(value, dict):
+                setattr(self, key, value or None)
+            elif key == references and isinstance(value, list) and all(isinstance(v, str) for v in value):
+                self.refs = tuple(sys.intern(v) for v in value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    def to_dict(self, references, shared=False):
+        # with shared, empty dicts are handed out as _PendingDicts
+        entry = {}
+        for key in self.layout:
+            if self.extra is not None and key in self.extra:
+                entry[key] = self.extra[key]
+            elif key == 'type':
+                entry[key] = self.type
+            elif key in ('attributes', 'boundary_conditions'):
+                value = getattr(self, key)
+                if value is None:
+                    value = _PendingDict(self, key) if shared else {}
+                entry[key] = value
+            elif key == references:
+                entry[key] = list(self.refs)
+        return entry
+
+
+class _PendingDict(dict):
+    """Empty dict of a record, stored into the record on its first write."""
+    __slots__ = ('record', 'key')
+
+    def __init__(self, record, key):
+        super().__init__()
+        self.record = record
+        self.key = key
+
+    def _target(self):
+        stored = getattr(self.record, self.key)
+        if stored is None:
+            setattr(self.record, self.key, self)
+            return self
+        return stored
+
+    def __setitem__(self, key, value):
+        target = self._target()
+        super().__setitem__(key, value)
+        if target is not self:
+            target[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+
+class _Entries(MutableMapping):
+    """Dict-shaped view of the objects or processes of a :class:`CompactModel`.
+
+    Reading an entry builds a plain dict from the compact record. The
+    ``attributes`` and ``boundary_conditions`` dicts are shared with the
+    store, so writes into them are kept; empty ones are only stored once
+    written to. Other changes to a returned entry must be written back by
+    assigning it.
+    """
+    def __init__(self, section):
+        self.references = SECTIONS[section]
+        self.records = {}
+
+    def __getitem__(self, name):
+        return self.records[name].to_dict(self.references, shared=True)
+
+    def __setitem__(self, name, entry):
+        self.records[sys.intern(name)] = _Entry(entry, self.references)
+
+    def __delitem__(self, name):
+        del self.records[name]
+
+    def __contains__(self, name):
+        return name in self.records
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def to_dict(self):
+        return {name: record.to_dict(self.references) for name, record in self.records.items()}
+
+    def type_of(self, name):
+        return self.records[name].type
+
+    def set_type(self, name, entry_type):
+        # in place, for entries that have a type key
+        record = self.records[name]
+        if 'type' not in record.layout:
+            record.layout = _layout(record.layout + ('type',))
+        record.type = sys.intern(entry_type)
+
+    def references_of(self, name):
+        return self.records[name].refs
+
+
+class CompactModel(MutableMapping):
+    """Memory-compact model store with the same dict-shaped interface.
+
+    ``model['objects']`` and ``model['processes']`` are mutable mapping
+    views over compact per-entry records; the other top-level fields are
+    kept as they are. :meth:`to_dict` gives back the plain JSON model, and
+    ``CompactModel.from_dict(model).to_dict() == model`` including key order.
+    """
+    def __init__(self, fields=None):
+        self.fields = {}
+        for key, value in (fields or {}).items():
+            self[key] = value
+        for section in SECTIONS:
+            if section not in self.fields:
+                self.fields[section] = _Entries(section)
+
+    @classmethod
+    def from_dict(cls, model):
+        return cls(model)
+
+    @classmethod
+    def load(cls, model_file):
+        if not os.path.isabs(model_file) and not os.path.exists(model_file):
+            model_file = os.path.join(project_root, model_file)
+        return cls(serialize.load(model_file))
+
+    def to_dict(self):
+        model = {}
+        for key, value in self.fields.items():
+            model[key] = value.to_dict() if isinstance(value, _Entries) else value
+        return model
+
+    def __getitem__(self, key):
+        return self.fields[key]
+
+    def __setitem__(self, key, value):
+        if key in SECTIONS and isinstance(value, Mapping):
+            entries = _Entries(key)
+            for name, entry in value.items():
+                entries[name] = entry
+            self.fields[key] = entries
+        else:
+            self.fields[key] = value
+
+    def __delitem__(self, key):
+        del self.fields[key]
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __repr__(self):
+        return f"CompactModel({self.to_dict()!r})"
+
+
+def test_compact_round_trip():
+    models_dir = os.path.join(project_root, 'models')
+    for filename in sorted(os.listdir(models_dir)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(models_dir, filename), 'r') as file:
+            model = json.load(file)
+        compact = CompactModel.from_dict(model)
+        assert json.dumps(compact.to_dict(), indent=4) == json.dumps(model, indent=4), filename
+
+    # missing, empty and extra keys survive
+    model = {
+        'name': 'odd',
+        'objects': {'a': {'contained_objects': [], 'type': 'Cell', 'note': 1}},
+        'id': 'model_odd',
+        'processes': {'p': {'type': 'MotileForce', 'participating_objects': 'a', 'attributes': {'x': 1}}},
+    }
+    compact = CompactModel.from_dict(model)
+    assert json.dumps(compact.to_dict()) == json.dumps(model)
+    assert compact['objects']['a'] == model['objects']['a']
+    assert compact['objects'].type_of('a') is sys.intern('Cell')
+
+    # writes into returned attribute dicts are kept, whether they were empty or not
+    compact = CompactModel.from_dict({'id': 'model_writes', 'name': 'writes', 'processes': {}, 'objects': {
+        'empty': {'type': 'Cell', 'attributes': {}}, 'blank': {'type': 'Cell', 'attributes': {}}, 'full': {'type': 'Cell', 'attributes': {'mass': 1}}}})
+    compact['objects']['empty']['attributes']['volume'] = 5
+    compact['objects']['full']['attributes']['volume'] = 5
+    assert compact['objects']['empty']['attributes'] == {'volume': 5}
+    assert compact['objects']['full']['attributes'] == {'mass': 1, 'volume': 5}
+    compact.to_dict()
+    assert compact['objects'].records['full'].boundary_conditions is None
+    twice = compact['objects']['blank']['attributes'], compact['objects']['blank']['attributes']
+    assert compact['objects'].records['blank'].attributes is None
+    twice[0]['x'] = 1
+    twice[1].setdefault('y', 2)
+    assert compact['objects']['blank']['attributes'] == {'x': 1, 'y': 2}
+
+
+def test_compact_validation():
+    from schema import schema_registry
+    compact = CompactModel.load('models/cell_migration.json')
+    empty = [record for record in compact['objects'].records.values() if record.attributes is None]
+    assert empty
+    schema_registry.validate_template(compact)
+    assert all(record.attributes is None for record in empty)
+    compact['objects']['single_cell'] = {'type': 'DoesNotExist', 'attributes': {}}
+    assert 'unregistered_type' in [v.rule for v in schema_registry.collect_violations(compact)]
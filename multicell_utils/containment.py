@@ -0,0 +1,227 @@
+from multicell_utils.registry import Violation, is_name_list
+
+
+class ContainmentIndex:
+    """Parent and child links of a model's containment hierarchy.
+
+    The links are updated in place as objects change, with
+    :meth:`set_children`. A preorder numbering of the hierarchy, with the
+    depth and subtree size of every object, is rebuilt lazily on the first
+    query after a change; after that, :meth:`parent`, :meth:`depth`,
+    :meth:`subtree_size` and :meth:`is_ancestor` take constant time, and
+    :meth:`ancestors` and :meth:`descendants` take time proportional to
+    their result.
+    """
+    def __init__(self, model=None):
+        self.children = {}
+        self.parents = {}
+        self._numbering = None
+        if model is not None:
+            for name, obj in model['objects'].items():
+                self.set_children(name, obj.get('contained_objects') if isinstance(obj, dict) else None)
+
+    def set_children(self, name, children):
+        """Set the objects contained by ``name``, replacing its previous children.
+
+        Children that are not a list of names are left to validation to
+        report, and ``name`` is given none.
+        """
+        for child in self.children.pop(name, ()):
+            parents = self.parents.get(child)
+            if parents is not None:
+                parents.pop(name, None)
+                if not parents:
+                    del self.parents[child]
+        children = list(children) if is_name_list(children) else []
+        if children:
+            self.children[name] = children
+            for child in children:
+                # parents are kept in insertion-ordered dicts
+                self.parents.setdefault(child, {})[name] = None
+        self._numbering = None
+
+    def add_children(self, name, children):
+        """Append ``children`` to the objects contained by ``name``."""
+        children = list(children)
+        if children:
+            self.children.setdefault(name, []).extend(children)
+            for child in children:
+                self.parents.setdefault(child, {})[name] = None
+            self._numbering = None
+
+    def remove(self, name):
+        self.set_children(name, None)
+
+    def parents_of(self, name):
+        return list(self.parents.get(name, ()))
+
+    def parent(self, name):
+        """The object that contains ``name``, or None for top-level objects."""
+        parents = self.parents.get(name)
+        return next(iter(parents)) if parents else None
+
+    # Tree numbering
+
+    def _number(self):
+        if self._numbering is not None:
+            return self._numbering
+        order = []
+        position = {}
+        depth = {}
+        size = {}
+        cycles = []
+        path = []
+        active = set()
+        # start from top-level objects, then from anything left, which can
+        # only be reached through a cycle
+        starts = [name for name in self.children if name not in self.parents] + list(self.children)
+        for root in starts:
+            if root in position:
+                continue
+            stack = [(root, 0, False)]
+            while stack:
+                name, level, done = stack.pop()
+                if done:
+                    size[name] = len(order) - position[name]
+                    active.discard(path.pop())
+                    continue
+                if name in position:
+                    continue  # reached again through a second parent
+                position[name] = len(order)
+                depth[name] = level
+                order.append(name)
+                path.append(name)
+                active.add(name)
+                stack.append((name, level, True))
+                for child in reversed(self.children.get(name, ())):
+                    if child in active:
+                        cycles.append(path[path.index(child):])
+                    elif child not in position:
+                        stack.append((child, level + 1, False))
+        self._numbering = (order, position, depth, size, cycles)
+        return self._numbering
+
+    def depth(self, name):
+        """Number of containers above ``name``; 0 for top-level objects."""
+        return self._number()[2].get(name, 0)
+
+    def subtree_size(self, name):
+        """Number of objects in the subtree of ``name``, including itself."""
+        return self._number()[3].get(name, 1)
+
+    def is_ancestor(self, ancestor, name):
+        """True if ``ancestor`` contains ``name``, directly or indirectly."""
+        order, position, depth, size, cycles = self._number()
+        if ancestor not in position or name not in position:
+            return False
+        return position[ancestor] < position[name] < position[ancestor] + size[ancestor]
+
+    def ancestors(self, name):
+        """Containers of ``name``, from its parent up to the top level."""
+        ancestors = []
+        seen = {name}
+        parent = self.parent(name)
+        while parent is not None and parent not in seen:
+            ancestors.append(parent)
+            seen.add(parent)
+            parent = self.parent(parent)
+        return ancestors
+
+    def descendants(self, name):
+        """Objects contained by ``name``, directly or indirectly, in preorder."""
+        order, position, depth, size, cycles = self._number()
+        if name not in position:
+            return []
+        start = position[name]
+        return order[start + 1:start + size[name]]
+
+    def roots(self, names=None):
+        """Top-level objects, among ``names`` if given."""
+        if names is None:
+            return [name for name in self.children if name not in self.parents]
+        return [name for name in names if name not in self.parents]
+
+    def orphans(self, names):
+        """Objects in ``names`` with no container, other than the first top-level one."""
+        return self.roots(names)[1:]
+
+    # Structural checks
+
+    def violations(self, names=None):
+        """Yield multiple-parent and cycle violations.
+
+        Without ``names`` the whole hierarchy is checked; otherwise only the
+        objects in ``names``, their children, and the chain of containers
+        above each of them.
+        """
+        if names is None:
+            multiple = [name for name, parents in self.parents.items() if len(parents) > 1]
+            cycles = self._number()[4]
+        else:
+            candidates = dict.fromkeys(names)
+            for name in names:
+                candidates.update(dict.fromkeys(self.children.get(name, ())))
+            multiple = [name for name in candidates if len(self.parents.get(name, ())) > 1]
+            cycles = [self._cycle_through(name) for name in names]
+
+        for name in multiple:
+            yield Violation(('objects', name), 'multiple_parents',
+                            f"Object '{name}' is contained by more than one object: {self.parents_of(name)}")
+        reported = set()
+        for cycle in cycles:
+            if cycle and not reported.intersection(cycle):
+                reported.update(cycle)
+                yield Violation(('objects', cycle[0], 'contained_objects'), 'containment_cycle',
+                                f"Containment cycle: {' -> '.join(cycle + [cycle[0]])}")
+
+    def _cycle_through(self, name):
+        # search upwards through all containers for a path back to name
+        stack = [(name, [name])]
+        seen = {name}
+        while stack:
+            current, path = stack.pop()
+            for parent in self.parents.get(current, ()):
+                if parent == name:
+                    # path runs upwards from name; return it top-down from name
+                    return [name] + path[:0:-1]
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append((parent, path + [parent]))
+        return None
+
+
+def test_containment_index():
+    model = {'objects': {
+        'universe': {'contained_objects': ['field', 'space']},
+        'field': {'contained_objects': ['cell 1', 'cell 2']},
+        'space': {},
+        'cell 1': {'contained_objects': ['organelle']},
+        'cell 2': {},
+        'organelle': {},
+        'loose': {},
+    }}
+    index = ContainmentIndex(model)
+    assert index.parent('cell 1') == 'field' and index.parent('universe') is None
+    assert index.depth('organelle') == 3
+    assert index.ancestors('organelle') == ['cell 1', 'field', 'universe']
+    assert index.descendants('field') == ['cell 1', 'organelle', 'cell 2']
+    assert index.subtree_size('universe') == 6
+    assert index.is_ancestor('universe', 'organelle') and not index.is_ancestor('space', 'cell 2')
+    assert index.orphans(model['objects']) == ['loose']
+    assert list(index.violations()) == []
+
+    # edits are applied incrementally
+    index.set_children('space', ['cell 2'])
+    index.set_children('organelle', ['field'])
+    rules = sorted((v.rule, v.path) for v in index.violations())
+    assert rules == [('containment_cycle', ('objects', 'field', 'contained_objects')),
+                     ('multiple_parents', ('objects', 'cell 2')),
+                     ('multiple_parents', ('objects', 'field'))], rules
+    assert [v.message for v in index.violations(['organelle']) if v.rule == 'containment_cycle'] == \
+        ["Containment cycle: organelle -> field -> cell 1 -> organelle"]
+    index.set_children('field', ['cell 1'])
+    index.set_children('organelle', None)
+    assert list(index.violations()) == []
+    assert index.descendants('space') == ['cell 2']
+    index.add_children('space', ['cell 3', 'cell 4'])
+    assert index.descendants('space') == ['cell 2', 'cell 3', 'cell 4'] and index.parent('cell 4') == 'space'
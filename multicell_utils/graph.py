@@ -1,20 +1,116 @@
 import os
-import json
+import hashlib
+from collections import OrderedDict
 from graphviz import Digraph
-from multicell_utils.registry import project_root, make_structure
+from multicell_utils.registry import project_root
+from multicell_utils.stream import load_model_index
+from multicell_utils.containment import ContainmentIndex
+
+
+COLLAPSE_MODES = [None, 'type', 'subtree']
+
+# rendered output of recent graphs, keyed by a hash of their DOT source
+PIPE_CACHE_SIZE = 32
+_pipe_cache = OrderedDict()
+
+
+class CachedDigraph(Digraph):
+    """Digraph that reuses the output of ``dot`` for an unchanged source.
+
+    The DOT source is a function of the model and the render options, so
+    hashing it identifies the rendered output. Re-displaying the same graph
+    in a notebook does not run ``dot`` again.
+    """
+    def source_hash(self):
+        return hashlib.sha256(self.source.encode('utf-8')).hexdigest()
+
+    def pipe(self, *args, **kwargs):
+        key = (self.source_hash(), self.engine, self.format, repr(args), repr(sorted(kwargs.items())))
+        if key in _pipe_cache:
+            _pipe_cache.move_to_end(key)
+            return _pipe_cache[key]
+        output = super().pipe(*args, **kwargs)
+        _pipe_cache[key] = output
+        if len(_pipe_cache) > PIPE_CACHE_SIZE:
+            _pipe_cache.popitem(last=False)
+        return output
 
 
 def create_graph_from_model(model,
                             filename=None,
                             output_dir='out',
+                            collapse=None,
+                            max_nodes=None,
+                            containment=None,
                             ):
+    """Make a Graphviz graph of the objects, processes and containment of ``model``.
+
+    ``collapse='type'`` draws one node per object type and per process type,
+    labelled with its count. ``collapse='subtree'`` expands the containment
+    hierarchy from its roots, breadth first, while the number of object
+    nodes stays within ``max_nodes``, and draws each unexpanded subtree as
+    one node with the number of objects it holds; processes are then
+    grouped by type. Without ``collapse``, a model with more than
+    ``max_nodes`` objects and processes is collapsed by type.
+
+    ``containment`` is the model's :class:`ContainmentIndex`, built here if
+    it is not given.
+
+    When ``filename`` is given the graph is rendered to a PNG in
+    ``output_dir``, unless a PNG rendered from the same graph is already
+    there.
+    """
+    if collapse not in COLLAPSE_MODES:
+        raise ValueError(f"Invalid collapse mode '{collapse}'. Must be one of {COLLAPSE_MODES}.")
     if isinstance(model, str):
-        model_path = os.path.join(project_root, model)
-        with open(model_path, 'r') as file:
-            model = json.load(file)
+        # only names, types and references are needed to draw the graph
+        model = load_model_index(os.path.join(project_root, model))
+
+    if collapse is None and max_nodes is not None and \
+            len(model['objects']) + len(model['processes']) > max_nodes:
+        collapse = 'type'
+
+    if containment is None:
+        containment = ContainmentIndex(model)
 
-    dot = Digraph(comment='Model Graph')
+    dot = CachedDigraph(comment='Model Graph')
+    if collapse is None:
+        _add_full_graph(dot, model, containment)
+    else:
+        if collapse == 'type':
+            groups = {name: obj_data['type'] for name, obj_data in model['objects'].items()}
+        else:
+            groups = _subtree_groups(model, max_nodes, containment)
+        _add_collapsed_graph(dot, model, groups, collapse, containment)
 
+    if filename is not None:
+        format = 'png'
+        os.makedirs(output_dir, exist_ok=True)
+        fig_path = os.path.join(output_dir, filename)
+        render_cached(dot, fig_path, format=format)
+
+    return dot
+
+
+def render_cached(dot, fig_path, format='png'):
+    """Render ``dot`` to ``fig_path``, skipping ``dot`` if the output is current.
+
+    The hash of the DOT source is stored next to the rendered file.
+    """
+    output_path = f"{fig_path}.{format}"
+    hash_path = f"{output_path}.sha256"
+    source_hash = hashlib.sha256((dot.engine + dot.source).encode('utf-8')).hexdigest()
+    if os.path.exists(output_path) and os.path.exists(hash_path):
+        with open(hash_path, 'r') as file:
+            if file.read() == source_hash:
+                return output_path
+    output_path = dot.render(fig_path, format=format)
+    with open(hash_path, 'w') as file:
+        file.write(source_hash)
+    return output_path
+
+
+def _add_full_graph(dot, model, containment):
     # Add objects as circles with labels including their types
     for obj_name, obj_data in model['objects'].items():
         label = f"{obj_name}:{obj_data['type']}"
@@ -24,22 +120,136 @@ def create_graph_from_model(model,
     for proc_name, proc_data in model['processes'].items():
         label = f"{proc_name}:{proc_data['type']}"
         dot.node(proc_name, label, shape='rectangle')
-        for obj in proc_data['participating_objects']:
+        for obj in proc_data.get('participating_objects', []):
             dot.edge(obj, proc_name, style='dashed', dir='back')
 
     # Add containment relations with thicker edges and no arrowhead
-    structure = make_structure(model)
-    for parent, children in structure.items():
+    for parent, children in containment.children.items():
         for child in children:
             dot.edge(parent, child, style='bold', arrowhead='none')
 
-    if filename is not None:
-        format = 'png'
-        os.makedirs(output_dir, exist_ok=True)
-        fig_path = os.path.join(output_dir, filename)
-        dot.render(fig_path, format=format)
 
-    return dot
+def _subtree_groups(model, max_nodes, containment):
+    """Map every object to the visible node that stands for it."""
+    roots = containment.roots(model['objects'])
+    budget = len(model['objects']) if max_nodes is None else max_nodes
+
+    groups = {}
+    visible = len(roots)
+    frontier = list(roots)
+    expanded = set()
+    for name in roots:
+        groups[name] = name
+    while frontier:
+        next_frontier = []
+        for name in frontier:
+            children = [child for child in containment.children.get(name, ()) if child not in groups]
+            if visible + len(children) <= budget:
+                expanded.add(name)
+                for child in children:
+                    groups[child] = child
+                visible += len(children)
+                next_frontier.extend(children)
+        frontier = next_frontier
+
+    # unexpanded subtrees are drawn as their top object
+    for name in list(groups):
+        if name not in expanded:
+            for descendant in containment.descendants(name):
+                groups.setdefault(descendant, name)
+    return groups
+
+
+def _add_collapsed_graph(dot, model, groups, collapse, containment):
+    members = {}
+    for name, group in groups.items():
+        members[group] = members.get(group, 0) + 1
+    for group, count in members.items():
+        if collapse == 'type':
+            label = f"{group} ×{count}" if count > 1 else group
+        else:
+            label = f"{group}:{model['objects'][group]['type']}"
+            if count > 1:
+                label += f"\n(+{count - 1} contained)"
+        dot.node(f"object {group}", label, shape='circle')
+
+    # processes grouped by type, with one dashed edge per participating group
+    process_counts = {}
+    participation = {}
+    for proc_data in model['processes'].values():
+        proc_type = proc_data['type']
+        process_counts[proc_type] = process_counts.get(proc_type, 0) + 1
+        for obj in proc_data.get('participating_objects', []):
+            edge = (groups.get(obj, obj), proc_type)
+            participation[edge] = participation.get(edge, 0) + 1
+    for proc_type, count in process_counts.items():
+        label = f"{proc_type} ×{count}" if count > 1 else proc_type
+        dot.node(f"process {proc_type}", label, shape='rectangle')
+    for (group, proc_type), count in participation.items():
+        dot.edge(f"object {group}", f"process {proc_type}", style='dashed', dir='back',
+                 label=str(count) if count > 1 else None)
+
+    # containment between groups, without edges inside a group
+    group_edges = {}
+    for parent, children in containment.children.items():
+        for child in children:
+            edge = (groups.get(parent, parent), groups.get(child, child))
+            if edge[0] != edge[1]:
+                group_edges[edge] = group_edges.get(edge, 0) + 1
+    for (parent, child), count in group_edges.items():
+        dot.edge(f"object {parent}", f"object {child}", style='bold', arrowhead='none',
+                 label=str(count) if count > 1 else None)
+
+
+def _population_model(n_cells):
+    model = {'id': 'graph_test', 'name': 'graph_test', 'objects': {}, 'processes': {}}
+    cells = [f"cell {i}" for i in range(n_cells)]
+    model['objects']['universe'] = {'type': 'Universe', 'contained_objects': ['field']}
+    model['objects']['field'] = {'type': 'CellField', 'contained_objects': cells}
+    for cell in cells:
+        model['objects'][cell] = {'type': 'Cell'}
+        model['processes'][f"growth {cell}"] = {'type': 'CellGrowth', 'participating_objects': [cell]}
+    return model
+
+
+def test_collapsed_graph():
+    model = _population_model(500)
+
+    by_type = create_graph_from_model(model, collapse='type')
+    assert by_type.source.count('shape=circle') == 3
+    assert 'Cell ×500' in by_type.source and 'CellGrowth ×500' in by_type.source
+
+    by_subtree = create_graph_from_model(model, collapse='subtree', max_nodes=10)
+    assert by_subtree.source.count('shape=circle') == 2
+    assert '(+500 contained)' in by_subtree.source
+
+    # over budget without a collapse mode falls back to grouping by type
+    assert create_graph_from_model(model, max_nodes=100).source == by_type.source
+    small = create_graph_from_model(_population_model(2), max_nodes=100)
+    assert small.source.count('shape=circle') == 4
+
+
+def test_render_cache():
+    import tempfile
+    rendered = []
+
+    class FakeRender(CachedDigraph):
+        def render(self, filepath=None, format=None, **kwargs):
+            rendered.append(filepath)
+            output_path = f"{filepath}.{format}"
+            with open(output_path, 'w') as file:
+                file.write(self.source)
+            return output_path
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        fig_path = os.path.join(output_dir, 'graph')
+        for n_cells in [3, 3, 4]:
+            dot = FakeRender(comment='Model Graph')
+            model = _population_model(n_cells)
+            _add_full_graph(dot, model, ContainmentIndex(model))
+            render_cached(dot, fig_path)
+    assert len(rendered) == 2
+
 
 # Example usage
 if __name__ == "__main__":
@@ -47,4 +257,4 @@ if __name__ == "__main__":
     graph.render('../output/model_graph', format='png')
 
     graph = create_graph_from_model('models/cell_sorting.json')
-    graph.render('../output/cell_sorting', format='png')
\ No newline at end of file
+    graph.render('../output/cell_sorting', format='png')
@@ -0,0 +1,303 @@
+import hashlib
+import itertools
+from collections import OrderedDict
+
+from multicell_utils import instrument, serialize
+from multicell_utils.registry import make_structure
+from multicell_utils.containment import ContainmentIndex
+
+
+DIGEST_SIZE = 16
+
+
+def entry_digest(entry):
+    """Digest of one object or process entry, from its canonical JSON."""
+    return hashlib.blake2b(serialize.dumps(entry, 'canonical', backend='json'), digest_size=DIGEST_SIZE).digest()
+
+
+class ModelHashes:
+    """Merkle-style hashes of the entries and object subtrees of a model.
+
+    ``objects`` and ``processes`` map entry names to the digest of their
+    entry. ``subtrees`` maps each object name to a digest of its entry and
+    of the subtree digests of the objects it contains, in order, so that
+    two subtrees with equal digests are identical, names of contained
+    objects included. Contained objects missing from the model, and
+    containment cycles, are hashed as markers.
+    """
+    def __init__(self, model):
+        self.objects = {name: entry_digest(entry) for name, entry in model['objects'].items()}
+        self.processes = {name: entry_digest(entry) for name, entry in model['processes'].items()}
+        self.structure = make_structure(model)
+        self.subtrees = {}
+        for root in self.objects:
+            if root not in self.subtrees:
+                self._hash_subtree(root)
+
+    def _hash_subtree(self, root):
+        active = set()
+        stack = [(root, False)]
+        while stack:
+            name, done = stack.pop()
+            if done:
+                active.discard(name)
+                digest = hashlib.blake2b(self.objects[name], digest_size=DIGEST_SIZE)
+                for child in self.structure.get(name, ()):
+                    if child in self.subtrees:
+                        digest.update(self.subtrees[child])
+                    elif child in self.objects:
+                        digest.update(b'cycle:' + child.encode('utf-8'))
+                    else:
+                        digest.update(b'missing:' + child.encode('utf-8'))
+                self.subtrees[name] = digest.digest()
+                continue
+            if name in self.subtrees or name in active:
+                continue
+            active.add(name)
+            stack.append((name, True))
+            for child in reversed(self.structure.get(name, ())):
+                if child in self.objects and child not in self.subtrees and child not in active:
+                    stack.append((child, False))
+
+    def roots(self):
+        contained = {child for children in self.structure.values() for child in children}
+        return [name for name in self.objects if name not in contained]
+
+
+def diff(model_a, model_b, hashes_a=None, hashes_b=None):
+    """Return the paths at which ``model_b`` differs from ``model_a``.
+
+    Paths are tuples such as ``('objects', 'cell', 'attributes', 'volume')``;
+    an added or removed entry is reported as ``('objects', name)`` or
+    ``('processes', name)``. Object subtrees with equal hashes are skipped
+    without looking at their contents.
+    """
+    hashes_a = hashes_a or ModelHashes(model_a)
+    hashes_b = hashes_b or ModelHashes(model_b)
+    changes = []
+    for key in dict.fromkeys(list(model_a) + list(model_b)):
+        if key not in ('objects', 'processes') and model_a.get(key) != model_b.get(key):
+            changes.append((key,))
+
+    # walk the hierarchy of model_b from its roots, pruning equal subtrees
+    seen = set()
+    stack = list(reversed(hashes_b.roots())) + list(reversed(list(hashes_b.objects)))
+    while stack:
+        name = stack.pop()
+        if name in seen or name not in hashes_b.objects:
+            continue
+        seen.add(name)
+        if hashes_a.subtrees.get(name) == hashes_b.subtrees[name]:
+            seen.update(_descendants(hashes_b.structure, name))
+            continue
+        if name not in hashes_a.objects:
+            changes.append(('objects', name))
+        elif hashes_a.objects[name] != hashes_b.objects[name]:
+            _diff_values(('objects', name), model_a['objects'][name], model_b['objects'][name], changes)
+        stack.extend(reversed(hashes_b.structure.get(name, ())))
+    changes.extend(('objects', name) for name in hashes_a.objects if name not in hashes_b.objects)
+
+    for name, digest in hashes_b.processes.items():
+        if name not in hashes_a.processes:
+            changes.append(('processes', name))
+        elif hashes_a.processes[name] != digest:
+            _diff_values(('processes', name), model_a['processes'][name], model_b['processes'][name], changes)
+    changes.extend(('processes', name) for name in hashes_a.processes if name not in hashes_b.processes)
+    return changes
+
+
+def _descendants(structure, name):
+    descendants = set()
+    stack = list(structure.get(name, ()))
+    while stack:
+        child = stack.pop()
+        if child not in descendants:
+            descendants.add(child)
+            stack.extend(structure.get(child, ()))
+    return descendants
+
+
+def _diff_values(path, a, b, changes):
+    if isinstance(a, dict) and isinstance(b, dict):
+        for key in dict.fromkeys(list(a) + list(b)):
+            if key not in a or key not in b:
+                changes.append(path + (key,))
+            else:
+                _diff_values(path + (key,), a[key], b[key], changes)
+    elif a != b or type(a) is not type(b):
+        changes.append(path)
+
+
+class SubtreeCache:
+    """Hashes of object subtrees and processes that validated without violations.
+
+    The cache belongs to one registry version: it is cleared when used with
+    a different registry or after the registry has changed. At most
+    ``max_entries`` hashes are kept, the least recently used being dropped
+    first.
+    """
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.valid = OrderedDict()
+        self._registry_key = None
+
+    def _check_registry(self, registry):
+        key = (id(registry), registry.version)
+        if key != self._registry_key:
+            self.valid.clear()
+            self._registry_key = key
+
+    def __contains__(self, key):
+        if key in self.valid:
+            self.valid.move_to_end(key)
+            return True
+        return False
+
+    def add(self, key):
+        self.valid[key] = None
+        self.valid.move_to_end(key)
+        if len(self.valid) > self.max_entries:
+            self.valid.popitem(last=False)
+
+
+default_cache = SubtreeCache()
+
+
+def collect_violations_hashed(model, registry=None, cache=None, max_errors=None, hashes=None, containment=None):
+    """Return the violations of ``model``, skipping already validated parts.
+
+    Objects in a subtree whose hash is in ``cache`` are not checked again,
+    nor are processes whose entry and participant types are. The
+    containment hierarchy is always checked for cycles and objects with
+    several containers, since those depend on the whole model. Parts found
+    without violations are added to the cache.
+
+    ``containment`` is the model's :class:`ContainmentIndex`, built here if
+    it is not given.
+    """
+    if registry is None:
+        from schema import schema_registry as registry
+    cache = default_cache if cache is None else cache
+    cache._check_registry(registry)
+    hashes = hashes or ModelHashes(model)
+
+    skipped = set()
+    for name in hashes.objects:
+        if name not in skipped and ('subtree', hashes.subtrees[name]) in cache:
+            skipped.add(name)
+            skipped.update(_descendants(hashes.structure, name))
+    objects = [name for name in hashes.objects if name not in skipped]
+    process_keys = {name: _process_key(model, hashes, name) for name in hashes.processes}
+    processes = [name for name, key in process_keys.items() if key not in cache]
+    instrument.count('subtree_cache.hits', len(skipped) + len(process_keys) - len(processes))
+    instrument.count('subtree_cache.misses', len(objects) + len(processes))
+
+    # in the order of a full validation: objects, structure, processes
+    violations = itertools.chain(
+        registry.iter_violations(model, objects=objects, processes=[]),
+        (containment or ContainmentIndex(model)).violations(),
+        registry.iter_violations(model, objects=[], processes=processes))
+    result = list(itertools.islice(violations, max_errors))
+    if max_errors is not None and len(result) >= max_errors:
+        return result
+
+    # record the parts that are free of violations
+    bad = {violation.path[1] for violation in result if violation.path[0] == 'objects'}
+    bad_processes = {violation.path[1] for violation in result if violation.path[0] == 'processes'}
+    clean = {}
+    for name in objects:
+        if _is_clean(name, hashes.structure, bad, clean, hashes.objects):
+            cache.add(('subtree', hashes.subtrees[name]))
+    for name in processes:
+        if name not in bad_processes:
+            cache.add(process_keys[name])
+    return result
+
+
+def _process_key(model, hashes, name):
+    # a process check depends on its entry and the types of its participants
+    objects = model['objects']
+    participants = model['processes'][name].get('participating_objects', [])
+    if not isinstance(participants, list):
+        participants = [participants]
+    types = tuple(objects[obj].get('type') if obj in objects else None for obj in participants)
+    return ('process', hashes.processes[name], types)
+
+
+def _is_clean(root, structure, bad, clean, objects):
+    # a subtree is clean if none of its objects has a violation
+    if root in clean:
+        return clean[root]
+    result = True
+    stack = [root]
+    seen = set()
+    while stack:
+        name = stack.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        if name in bad or name not in objects or clean.get(name) is False:
+            result = False
+            break
+        stack.extend(structure.get(name, ()))
+    clean[root] = result
+    return result
+
+
+def _population(n_cells, volume=1.0):
+    objects = {'field': {'type': 'CellField', 'attributes': {}, 'contained_objects': []}}
+    for i in range(n_cells):
+        objects['field']['contained_objects'].append(f"cell {i}")
+        objects[f"cell {i}"] = {'type': 'Cell', 'attributes': {'volume': volume}}
+    processes = {'growth': {'type': 'CellGrowth', 'participating_objects': ['cell 0']}}
+    return {'id': 'model_hashing', 'name': 'hashing',
+            'objects': {'space': {'type': 'Universe', 'attributes': {}, 'contained_objects': ['field']},
+                        **objects},
+            'processes': processes}
+
+
+def test_model_hashes_and_diff():
+    a = _population(100)
+    b = _population(100)
+    hashes_a = ModelHashes(a)
+    assert hashes_a.subtrees == ModelHashes(b).subtrees
+    assert diff(a, b) == []
+
+    b['objects']['cell 7']['attributes']['volume'] = 2.0
+    b['objects']['cell 100'] = {'type': 'Cell', 'attributes': {}}
+    b['objects']['field']['contained_objects'].append('cell 100')
+    b['processes']['growth']['participating_objects'] = ['cell 1']
+    hashes_b = ModelHashes(b)
+    assert hashes_a.subtrees['cell 8'] == hashes_b.subtrees['cell 8']
+    assert hashes_a.subtrees['space'] != hashes_b.subtrees['space']
+    assert sorted(diff(a, b)) == [
+        ('objects', 'cell 100'),
+        ('objects', 'cell 7', 'attributes', 'volume'),
+        ('objects', 'field', 'contained_objects'),
+        ('processes', 'growth', 'participating_objects'),
+    ]
+    assert ('objects', 'cell 100') in diff(b, a)
+
+
+def test_hashed_validation():
+    from schema import schema_registry
+    cache = SubtreeCache()
+    a = _population(50)
+    with instrument.collect() as stats:
+        assert collect_violations_hashed(a, cache=cache) == []
+        assert collect_violations_hashed(_population(50), cache=cache) == []
+    assert stats.counters['subtree_cache.hits'] == 52 + 1
+    assert stats.timers['validate.object'][0] == 52
+
+    # a changed attribute only re-checks the objects above it
+    b = _population(50)
+    b['objects']['cell 3']['attributes']['volume'] = 5.0
+    with instrument.collect() as stats:
+        assert collect_violations_hashed(b, cache=cache) == []
+    assert stats.timers['validate.object'][0] == 3
+
+    # violations are found as in a full validation, and are not cached
+    b['objects']['cell 4']['type'] = 'Field'
+    rules = [(v.rule, v.path) for v in collect_violations_hashed(b, cache=cache)]
+    assert rules == [(v.rule, v.path) for v in schema_registry.collect_violations(b)]
+    assert rules == [(v.rule, v.path) for v in collect_violations_hashed(b, cache=cache)]
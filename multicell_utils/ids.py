@@ -0,0 +1,232 @@
+import os
+import json
+import tempfile
+from contextlib import contextmanager
+
+from multicell_utils import serialize
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+ID_PREFIX = 'model_'
+STATE_FILENAME = '.model_ids'
+SCAN_FILENAME = '.model_ids.scan'
+LOCK_FILENAME = '.model_ids.lock'
+
+
+def parse_model_number(model_id):
+    """Return N for ids like 'model_000042', or None."""
+    if isinstance(model_id, str) and model_id.startswith(ID_PREFIX):
+        try:
+            return int(model_id.split('_')[1])
+        except ValueError:
+            return None
+    return None
+
+
+def format_model_id(number):
+    return f"{ID_PREFIX}{number:06d}"
+
+
+@contextmanager
+def _locked(lock_path):
+    with open(lock_path, 'a+') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ModelIdAllocator:
+    """Hand out unique model ids for the models in ``models_dir``.
+
+    The last allocated id is kept in a small state file next to the models,
+    updated under an exclusive file lock so that concurrent processes never
+    receive the same id. The state also records the directory mtime, read
+    before the directory was last listed; when the directory has changed
+    since, it is listed again and only the files not seen before are
+    parsed, their ids being appended to a scan log. Files written through
+    :meth:`register`, as ``ModelBuilder.save`` does, are logged without
+    being parsed. Without a state file the allocator rebuilds it from the
+    log and the directory.
+    """
+    def __init__(self, models_dir):
+        self.models_dir = models_dir
+        self.state_path = os.path.join(models_dir, STATE_FILENAME)
+        self.scan_path = os.path.join(models_dir, SCAN_FILENAME)
+        self.lock_path = os.path.join(models_dir, LOCK_FILENAME)
+
+    def allocate(self):
+        os.makedirs(self.models_dir, exist_ok=True)
+        with _locked(self.lock_path):
+            state = _read_json(self.state_path)
+            if not isinstance(state, dict):
+                state = {'last_id': 0}
+            dir_mtime_ns = self._dir_mtime_ns()
+            if state.get('dir_mtime_ns') != dir_mtime_ns:
+                state = {'last_id': max(state.get('last_id', 0), self._scan()), 'dir_mtime_ns': dir_mtime_ns}
+            state['last_id'] += 1
+            _write_in_place(self.state_path, json.dumps(state))
+        return format_model_id(state['last_id'])
+
+    def register(self, filename, model_id):
+        """Record the id of a model just written to ``filename`` in the directory.
+
+        Does nothing until ids have been allocated in the directory.
+        """
+        if not os.path.exists(self.state_path):
+            return
+        with _locked(self.lock_path):
+            with open(self.scan_path, 'a') as file:
+                file.write(json.dumps([filename, parse_model_number(model_id) or 0]) + '\n')
+
+    def _dir_mtime_ns(self):
+        return os.stat(self.models_dir).st_mtime_ns
+
+    def _scan(self):
+        """Parse the model files missing from the scan log, and return the highest model id."""
+        known, intact = _read_log(self.scan_path)
+        filenames = [filename for filename in os.listdir(self.models_dir)
+                     if filename.endswith(('.json', '.json.gz'))]
+        new = {}
+        for filename in filenames:
+            if filename in known:
+                continue
+            try:
+                model = serialize.load(os.path.join(self.models_dir, filename))
+            except (OSError, ValueError):
+                print(f"Error loading model from {filename}")
+                continue
+            new[filename] = (parse_model_number(model.get('id')) if isinstance(model, dict) else None) or 0
+        known.update(new)
+        if not intact or len(known) > 2 * len(filenames) + 64:
+            # drop torn lines, superseded entries and removed files
+            _rewrite_log(self.scan_path, {filename: known[filename] for filename in filenames if filename in known})
+        elif new:
+            with open(self.scan_path, 'a') as file:
+                file.write(''.join(json.dumps(item) + '\n' for item in new.items()))
+        return max((known[filename] for filename in filenames if filename in known), default=0)
+
+
+def _write_in_place(path, text):
+    # Rewrite in place rather than by rename, so that only the first
+    # creation of a file changes the directory mtime; a torn write is
+    # read back as missing or damaged and triggers a rescan.
+    if not os.path.exists(path):
+        open(path, 'w').close()
+    with open(path, 'r+') as file:
+        file.truncate()
+        file.write(text)
+
+
+# scan logs read so far, by path: (inode, offset read up to, ids by filename, intact)
+_logs = {}
+
+
+def _read_log(path):
+    """Return the ids by filename in the scan log, and whether every line could be read.
+
+    The log is append-only between rewrites, which replace the file, so
+    only the lines appended since the last call are parsed. The returned
+    dict is cached, the last line for a filename winning.
+    """
+    try:
+        file = open(path, 'rb')
+    except OSError:
+        _logs.pop(path, None)
+        return {}, True
+    with file:
+        stat = os.fstat(file.fileno())
+        inode, offset, known, intact = _logs.get(path) or (None, 0, None, True)
+        if inode != stat.st_ino or offset > stat.st_size:
+            offset, known, intact = 0, {}, True
+        file.seek(offset)
+        for line in file:
+            if not line.endswith(b'\n'):
+                intact = False  # torn write
+                break
+            offset += len(line)
+            try:
+                filename, number = json.loads(line)
+            except (ValueError, TypeError):
+                intact = False
+                continue
+            known[filename] = number
+    _logs[path] = (stat.st_ino, offset, known, intact)
+    return known, intact
+
+
+def _rewrite_log(path, known):
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as file:
+        file.write(''.join(json.dumps(item) + '\n' for item in known.items()))
+    os.replace(temporary_path, path)
+    stat = os.stat(path)
+    _logs[path] = (stat.st_ino, stat.st_size, known, True)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _allocate_ids(models_dir, n):
+    allocator = ModelIdAllocator(models_dir)
+    return [allocator.allocate() for _ in range(n)]
+
+
+def test_model_id_allocator():
+    with tempfile.TemporaryDirectory() as models_dir:
+        with open(os.path.join(models_dir, 'a.json'), 'w') as file:
+            json.dump({'id': 'model_000007'}, file)
+
+        allocator = ModelIdAllocator(models_dir)
+        assert allocator.allocate() == 'model_000008'
+        assert allocator.allocate() == 'model_000009'
+
+        # a model added to the directory is picked up
+        with open(os.path.join(models_dir, 'b.json'), 'w') as file:
+            json.dump({'id': 'model_000020'}, file)
+        assert allocator.allocate() == 'model_000021'
+
+        # a missing state file is rebuilt from the directory
+        os.remove(allocator.state_path)
+        assert allocator.allocate() == 'model_000021'
+
+        # registered files are not parsed, and a damaged log is rebuilt
+        with open(os.path.join(models_dir, 'c.json'), 'w') as file:
+            file.write('{"id": "model_0')
+        allocator.register('c.json', 'model_000050')
+        assert allocator.allocate() == 'model_000051'
+        with open(allocator.scan_path, 'a') as file:
+            file.write('["torn", ')
+        os.remove(allocator.state_path)
+        os.remove(os.path.join(models_dir, 'c.json'))
+        assert allocator.allocate() == 'model_000021'
+        assert sorted(_read_log(allocator.scan_path)[0]) == ['a.json', 'b.json']
+
+
+def test_model_id_allocator_concurrent():
+    from concurrent.futures import ProcessPoolExecutor
+    with tempfile.TemporaryDirectory() as models_dir:
+        with ProcessPoolExecutor(max_workers=4) as pool:
+            batches = list(pool.map(_allocate_ids, [models_dir] * 4, [25] * 4))
+        ids = [model_id for batch in batches for model_id in batch]
+        assert len(set(ids)) == 100
+        assert max(ids) == format_model_id(100)
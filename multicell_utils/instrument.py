@@ -0,0 +1,237 @@
+"""Opt-in timers, counters and memory tracing for the registry and validation.
+
+Instrumentation is off by default, and the hooks in the registry, the
+validators and the model builder then reduce to a check of ``active``.
+Turn it on for a block of code with :func:`collect`::
+
+    with instrument.collect(memory=True) as stats:
+        builder.validate()
+    print(stats.report())
+
+or for a whole session with :func:`enable` or the ``MULTICELL_INSTRUMENT``
+environment variable, reading the results back with :func:`get_stats`.
+"""
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+# the Stats being recorded into, or None when instrumentation is off
+active = None
+
+_disabled = nullcontext()
+
+
+class Stats:
+    """Timings, counters and memory use recorded while instrumentation is on.
+
+    ``timers`` maps a phase name to ``[calls, seconds]``, ``counters`` maps
+    a counter name to its count, and ``files`` maps a schema file name to
+    the seconds it took to parse and meta-validate. With memory tracing,
+    ``memory`` maps a phase name to the net bytes it allocated,
+    ``peak_memory`` is the peak traced size, and ``snapshots`` holds the
+    ``(label, tracemalloc.Snapshot)`` pairs taken by :func:`snapshot`.
+    """
+    def __init__(self, memory=False):
+        self.trace_memory = memory
+        self.timers = {}
+        self.counters = {}
+        self.files = {}
+        self.memory = {}
+        self.peak_memory = None
+        self.snapshots = []
+        self._started_tracing = False
+
+    def add_time(self, name, seconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [1, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_memory(self, name, size):
+        self.memory[name] = self.memory.get(name, 0) + size
+
+    def to_dict(self):
+        return {
+            'timers': {name: {'calls': calls, 'seconds': seconds}
+                       for name, (calls, seconds) in self.timers.items()},
+            'counters': dict(self.counters),
+            'files': dict(self.files),
+            'memory': dict(self.memory),
+            'peak_memory': self.peak_memory,
+        }
+
+    def report(self):
+        lines = []
+        for name, (calls, seconds) in sorted(self.timers.items(), key=lambda item: -item[1][1]):
+            line = f"{name}: {seconds * 1000:.3f} ms in {calls} calls"
+            if name in self.memory:
+                line += f", {self.memory[name] / 1024:.1f} KiB"
+            lines.append(line)
+        for name, count in sorted(self.counters.items()):
+            lines.append(f"{name}: {count}")
+        if self.peak_memory is not None:
+            lines.append(f"peak memory: {self.peak_memory / 1024:.1f} KiB")
+        return '\n'.join(lines)
+
+
+class _Phase:
+    __slots__ = ('stats', 'name', 'start', 'memory_start')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        if self.stats.trace_memory:
+            self.memory_start = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.stats.add_time(self.name, time.perf_counter() - self.start)
+        if self.stats.trace_memory:
+            self.stats.add_memory(self.name, tracemalloc.get_traced_memory()[0] - self.memory_start)
+
+
+def phase(name):
+    """Context manager that times a phase, or does nothing when disabled."""
+    if active is None:
+        return _disabled
+    return _Phase(active, name)
+
+
+def timed_iter(name, iterator):
+    """Time the work done inside ``iterator``, excluding its consumer.
+
+    The iterator's return value is passed through, so ``yield from``
+    works as it would on the original generator.
+    """
+    if active is None:
+        return iterator
+    return _timed_iter(active, name, iterator)
+
+
+def _timed_iter(stats, name, iterator):
+    seconds = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                seconds += time.perf_counter() - start
+            yield item
+    finally:
+        stats.add_time(name, seconds)
+
+
+def count(name, n=1):
+    if active is not None:
+        active.count(name, n)
+
+
+def record_file(path, seconds):
+    """Record the time taken to parse and meta-validate one schema file."""
+    if active is not None:
+        active.files[os.path.basename(path)] = seconds
+        active.add_time('registry.parse_file', seconds)
+        active.count('files_parsed')
+
+
+def snapshot(label):
+    """Take a tracemalloc snapshot, when memory tracing is on."""
+    if active is not None and active.trace_memory:
+        active.snapshots.append((label, tracemalloc.take_snapshot()))
+
+
+def enable(memory=False):
+    """Start recording into a new :class:`Stats`, and return it."""
+    global active
+    disable()
+    active = Stats(memory=memory)
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        active._started_tracing = True
+    return active
+
+
+def disable():
+    """Stop recording, and return the :class:`Stats` recorded so far."""
+    global active
+    stats, active = active, None
+    if stats is not None and stats.trace_memory:
+        stats.peak_memory = tracemalloc.get_traced_memory()[1]
+        if stats._started_tracing:
+            tracemalloc.stop()
+    return stats
+
+
+def get_stats():
+    return active
+
+
+def reset():
+    """Clear the recorded stats, keeping instrumentation on if it is."""
+    if active is not None:
+        enable(memory=active.trace_memory)
+    return active
+
+
+@contextmanager
+def collect(memory=False):
+    """Record stats for the duration of the block, and yield them.
+
+    Stats that were being recorded before the block are set aside and
+    restored afterwards.
+    """
+    global active
+    previous = active
+    active = None
+    stats = enable(memory=memory)
+    try:
+        yield stats
+    finally:
+        disable()
+        active = previous
+
+
+# MULTICELL_INSTRUMENT=1 records from import time, including the schema
+# library loaded by the schema package; MULTICELL_INSTRUMENT=memory also
+# traces memory
+if os.environ.get('MULTICELL_INSTRUMENT'):
+    enable(memory=os.environ['MULTICELL_INSTRUMENT'] == 'memory')
+
+
+def test_instrumentation():
+    from schema import schema_registry
+    model = {
+        'id': 'model_instrument',
+        'objects': {
+            'field': {'type': 'CellField', 'attributes': {}, 'contained_objects': ['cell']},
+            'cell': {'type': 'Cell', 'attributes': {}},
+        },
+        'processes': {'growth': {'type': 'CellGrowth', 'participating_objects': ['cell']}},
+    }
+    assert active is None
+    with collect(memory=True) as stats:
+        schema_registry.validate_template(model)
+        snapshot('validated')
+    assert active is None
+    assert stats.counters['validations'] == 1
+    assert stats.timers['validate.object'][0] == 2 and stats.timers['validate.participation'][0] == 1
+    assert 'validate.meta_schema' in stats.timers and 'validate.containment' in stats.timers
+    assert stats.peak_memory > 0 and stats.snapshots[0][0] == 'validated'
+    assert 'validate.object' in stats.report()
+
+    # nothing is recorded while disabled
+    schema_registry.validate_template(model)
+    assert stats.counters['validations'] == 1
+    assert phase('anything') is _disabled
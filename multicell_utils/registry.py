@@ -1,6 +1,14 @@
 import os
+import copy
 import json
-from jsonschema import validate, ValidationError
+import itertools
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from jsonschema import ValidationError
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+from multicell_utils import instrument
 
 # Get the base directory of the current script
 base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -14,6 +22,8 @@ objects_meta_schema_path = os.path.join(project_root, 'schema/metaschema/object_
 processes_meta_schema_path = os.path.join(project_root, 'schema/metaschema/process_schema.json')
 templates_meta_schema_path = os.path.join(project_root, 'schema/metaschema/template_schema.json')
 
+SCHEMA_KINDS = ['object', 'process', 'template']
+
 # Load meta-schemas from JSON files
 with open(objects_meta_schema_path, 'r') as file:
     object_meta_schema = json.load(file)
@@ -25,6 +35,55 @@ with open(templates_meta_schema_path, 'r') as file:
     template_meta_schema = json.load(file)
 
 
+# compiled validators keyed by meta-schema identity. Each entry keeps a
+# reference to its meta-schema, so replacing a meta-schema compiles a new
+# validator; call clear_compiled_validators() after editing one in place.
+_compiled_validators = {}
+
+
+def compiled_validator(meta_schema):
+    """Return a validator for ``meta_schema``, compiling it on first use."""
+    cached = _compiled_validators.get(id(meta_schema))
+    if cached is not None:
+        instrument.count('validator_cache.hits')
+    else:
+        instrument.count('validator_cache.misses')
+        cls = validator_for(meta_schema)
+        cls.check_schema(meta_schema)
+        cached = (meta_schema, cls(meta_schema))
+        _compiled_validators[id(meta_schema)] = cached
+    return cached[1]
+
+
+def clear_compiled_validators():
+    _compiled_validators.clear()
+
+
+def meta_schema_error(instance, meta_schema):
+    """Return the message of the best-matching validation error, or None."""
+    error = best_match(compiled_validator(meta_schema).iter_errors(instance))
+    return None if error is None else error.message
+
+
+def validate_with_meta_schema(instance, meta_schema):
+    """Same as ``jsonschema.validate``, but reuses the compiled validator."""
+    error = best_match(compiled_validator(meta_schema).iter_errors(instance))
+    if error is not None:
+        raise error
+
+
+# registry attributes saved in snapshots
+SNAPSHOT_TABLES = [
+    '_object_types', '_process_types', '_allowed_containments', '_process_participation',
+    '_object_inheritance', '_process_inheritance', '_ancestors', '_subtypes', '_templates',
+    '_participating_processes', '_containing_types',
+]
+SNAPSHOT_FORMAT = 3
+
+# marks a schema whose meta-schema check has not been run yet
+_UNCHECKED = object()
+
+
 def make_structure(model):
     structure = {}
     for obj_name, obj_schema in model['objects'].items():
@@ -34,179 +93,1193 @@ def make_structure(model):
     return structure
 
 
+def is_name_list(value):
+    """Whether ``value`` is a list of entry names, as references must be."""
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+class Violation:
+    """A single problem found while validating a model.
+
+    ``path`` locates the offending entry, e.g. ``('objects', 'field',
+    'contained_objects', 'cell')``, ``rule`` names the check that failed,
+    and ``expected``/``actual`` hold the allowed types and the type found
+    where the rule is about types.
+    """
+    def __init__(self, path, rule, message, expected=None, actual=None, error=AssertionError):
+        self.path = path
+        self.rule = rule
+        self.message = message
+        self.expected = expected
+        self.actual = actual
+        self.error = error
+
+    def __repr__(self):
+        return f"Violation({self.rule}, {'/'.join(map(str, self.path))}: {self.message})"
+
+    def to_dict(self):
+        return {
+            'path': list(self.path),
+            'rule': self.rule,
+            'message': self.message,
+            'expected': self.expected,
+            'actual': self.actual,
+        }
+
+    @classmethod
+    def from_dict(cls, data, error=AssertionError):
+        return cls(tuple(data['path']), data['rule'], data['message'],
+                   expected=data.get('expected'), actual=data.get('actual'), error=error)
+
+    def raise_error(self):
+        raise self.error(self.message)
+
+
 class SchemaRegistry:
     def __init__(self):
-        self.object_types = {}
-        self.process_types = {}
+        self._object_types = {}
+        self._process_types = {}
         self.object_meta_schema = object_meta_schema
         self.process_meta_schema = process_meta_schema
         self.template_meta_schema = template_meta_schema
 
         # to save allowed object containments with object type as keys
-        self.allowed_containments = {}
+        self._allowed_containments = {}
 
         # save process-object participation with process type as keys
-        self.process_participation = {}
+        self._process_participation = {}
 
         # save type inheritance with types as keys
-        self.object_inheritance = {}
-        self.process_inheritance = {}
+        self._object_inheritance = {}
+        self._process_inheritance = {}
+
+        # compiled templates, by template file name
+        self._templates = {}
+
+        # transitive closure of the inheritance maps, as a frozenset of all
+        # ancestors per type, and the direct subtypes of each base type so
+        # that re-registering a base only invalidates its descendants
+        self._ancestors = {'object': {}, 'process': {}}
+        self._subtypes = {'object': {}, 'process': {}}
+
+        # flattened schemas, by kind and type, dropped with the ancestors of
+        # the type; see effective_schema
+        self._effective = {'object': {}, 'process': {}}
+
+        # reverse of process_participation and allowed_containments: the
+        # process types and container types declaring each object type, and
+        # their expansion over the ancestors of object types, by object type
+        self._participating_processes = {}
+        self._containing_types = {}
+        self._reverse_closure = {'processes': {}, 'containers': {}}
+
+        # incremented whenever a type is registered through the public API,
+        # so that cached validation results can tell they are out of date
+        self.version = 0
+
+        # an optional ValidationCache of the results of full validations
+        self.validation_cache = None
+
+        # schema files that have been listed but not yet loaded, by kind
+        self._pending = {kind: [] for kind in SCHEMA_KINDS}
+
+        # load results of the schema files registered so far, by path, kept
+        # for saving snapshots
+        self._loaded_files = {}
+
+    # Lazy loading
+    # The public tables below load every pending schema file before they are
+    # returned, so code that reads them directly sees the full library.
+    # Validation uses the ``_ensure_*`` helpers instead, which only load the
+    # files needed to resolve the types being looked up.
+
+    @property
+    def object_types(self):
+        self.preload()
+        return self._object_types
+
+    @property
+    def process_types(self):
+        self.preload()
+        return self._process_types
+
+    @property
+    def allowed_containments(self):
+        self.preload()
+        return self._allowed_containments
+
+    @property
+    def process_participation(self):
+        self.preload()
+        return self._process_participation
+
+    @property
+    def templates(self):
+        self.preload()
+        return self._templates
+
+    @property
+    def object_inheritance(self):
+        self.preload()
+        return self._object_inheritance
+
+    @property
+    def process_inheritance(self):
+        self.preload()
+        return self._process_inheritance
+
+    def add_schema_directory(self, directory, kind):
+        """List the schema files in ``directory`` without loading them.
+
+        ``kind`` is one of 'object', 'process' or 'template'. Each file is
+        loaded and registered the first time a type it may define is looked
+        up, or when :meth:`preload` is called.
+        """
+        if kind not in SCHEMA_KINDS:
+            raise ValueError(f"Invalid schema kind '{kind}'. Must be one of {SCHEMA_KINDS}.")
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith('.json'):
+                self._pending[kind].append(os.path.join(directory, filename))
+
+    def preload(self, kind=None, max_workers=None):
+        """Load every pending schema file, or only those of ``kind``.
+
+        With ``max_workers`` above 1, files are parsed and meta-validated in a
+        process pool and then registered here in file name order, which gives
+        the same registry as loading them one by one. Returns the per-file
+        load results, including the time each file took.
+        """
+        kinds = SCHEMA_KINDS if kind is None else [kind]
+        results = []
+        with instrument.phase('registry.preload'):
+            for k in kinds:
+                paths, self._pending[k] = self._pending[k], []
+                for result in load_schema_files(paths, self._meta_schema(k), max_workers):
+                    self._register_loaded(k, result)
+                    results.append(result)
+        return results
+
+    # Snapshots
+    # A snapshot pickles the registry tables together with the parsed and
+    # meta-validated content of every schema file, keyed by the file's
+    # (mtime, size) fingerprint. Loading one skips parsing and validation of
+    # unchanged files; if nothing changed the tables are restored as they are.
+    # Validators are not pickled; they are compiled again on first use.
+
+    def save_snapshot(self, path):
+        """Load all pending schema files and save the registry to ``path``."""
+        self.preload()
+        snapshot = {
+            'format': SNAPSHOT_FORMAT,
+            'meta_schemas': [self.object_meta_schema, self.process_meta_schema, self.template_meta_schema],
+            'files': self._loaded_files,
+            'tables': {table: getattr(self, table) for table in SNAPSHOT_TABLES},
+        }
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        try:
+            with open(tmp_path, 'wb') as file:
+                pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load_snapshot(self, path):
+        """Load the pending schema files, reusing a snapshot saved at ``path``.
+
+        Files whose fingerprint matches the snapshot are registered from it
+        without being read; changed or new files are loaded from disk.
+        Returns the number of files taken from the snapshot, or None if there
+        is no usable snapshot, in which case nothing is loaded.
+        """
+        try:
+            with open(path, 'rb') as file:
+                snapshot = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get('format') != SNAPSHOT_FORMAT:
+            return None
+        if snapshot['meta_schemas'] != [self.object_meta_schema, self.process_meta_schema, self.template_meta_schema]:
+            return None
+
+        cached = snapshot['files']
+        pending = [(kind, schema_path) for kind in SCHEMA_KINDS for schema_path in self._pending[kind]]
+        unchanged = [(kind, schema_path) for kind, schema_path in pending
+                     if schema_path in cached and cached[schema_path][0] == kind
+                     and cached[schema_path][1]['fingerprint'] == file_fingerprint(schema_path)]
+
+        if len(unchanged) == len(pending) == len(cached) and not self._loaded_files and self.version == 0:
+            # nothing changed: restore the tables and derived indexes
+            for table in SNAPSHOT_TABLES:
+                setattr(self, table, snapshot['tables'][table])
+            self._effective = {'object': {}, 'process': {}}
+            self._reverse_closure = {'processes': {}, 'containers': {}}
+            self._loaded_files = dict(cached)
+            self._pending = {kind: [] for kind in SCHEMA_KINDS}
+            return len(unchanged)
+
+        unchanged = set(unchanged)
+        for kind in SCHEMA_KINDS:
+            paths, self._pending[kind] = self._pending[kind], []
+            for schema_path in paths:
+                if (kind, schema_path) in unchanged:
+                    result = cached[schema_path][1]
+                else:
+                    result = load_schema_file(schema_path, self._meta_schema(kind))
+                self._register_loaded(kind, result)
+        return len(unchanged)
+
+    def _meta_schema(self, kind):
+        # templates are registered without a meta-schema check
+        return {'object': self.object_meta_schema, 'process': self.process_meta_schema}.get(kind)
+
+    def _load_pending_file(self, kind, schema_path):
+        self._register_loaded(kind, load_schema_file(schema_path, self._meta_schema(kind)))
+
+    def _register_loaded(self, kind, result):
+        self._loaded_files[result['path']] = (kind, result)
+        instrument.record_file(result['path'], result['seconds'])
+        filename = os.path.basename(result['path'])
+        if result['load_error'] is not None:
+            print(f"Failed to load schema from file '{filename}': {result['load_error']}")
+            return
+        schema_name = os.path.splitext(filename)[0]
+        try:
+            with instrument.phase('registry.register'):
+                if kind == 'object':
+                    self._register_object(result['schema'], schema_name, meta_error=result['meta_error'])
+                elif kind == 'process':
+                    self._register_process(result['schema'], schema_name, meta_error=result['meta_error'])
+                else:
+                    self.register_template(result['schema'], schema_name)
+        except Exception as e:
+            print(f"Failed to register schema '{schema_name}' from file '{filename}': {e}")
+
+    def _load_pending_until(self, kind, type_name, registered):
+        # files named after the type (cell_growth.json -> CellGrowth) are tried first
+        pending = self._pending[kind]
+        key = _type_key(type_name)
+        pending.sort(key=lambda path: _type_key(os.path.splitext(os.path.basename(path))[0]) != key)
+        while pending and type_name not in registered:
+            self._load_pending_file(kind, pending.pop(0))
+
+    def _ensure_object(self, object_type):
+        if object_type not in self._object_types and self._pending['object']:
+            self._load_pending_until('object', object_type, self._object_types)
+        return object_type in self._object_types
+
+    def _ensure_process(self, process_type):
+        if process_type not in self._process_types and self._pending['process']:
+            self._load_pending_until('process', process_type, self._process_types)
+        return process_type in self._process_types
+
+    def _ensure_template(self, template_name):
+        if template_name not in self._templates and self._pending['template']:
+            self._load_pending_until('template', template_name, self._templates)
+        return template_name in self._templates
 
     def validate_schema(self, schema, meta_schema):
-        validate(instance=schema, schema=meta_schema)
+        validate_with_meta_schema(schema, meta_schema)
 
-    def inherits_from(self, new_type, base_type):
+    def inherits_from(self, new_type, base_type, kind='object'):
         # Check if new_type inherits from base_type
         if new_type == base_type:
             return True
-        if new_type in self.object_inheritance:
-            for inherited_type in self.object_inheritance[new_type]:
-                if self.inherits_from(inherited_type, base_type):
-                    return True
-        return False
-
-    def validate_template(self, model):
-        # Validate objects
-        for obj_name, obj_schema in model['objects'].items():
-            try:
-                self.validate_schema(obj_schema, object_meta_schema)
-            except ValidationError as e:
-                raise ValueError(f"Object '{obj_name}' in model '{model['id']}' is invalid. {e.message}")
-
-            object_type = obj_schema['type']
-            assert object_type in self.object_types, f"Object type '{object_type}' is not registered."
+        return base_type in self._get_ancestors(kind, new_type)
+
+    def object_ancestors(self, object_type):
+        """Return the frozenset of every type ``object_type`` inherits from."""
+        return self._get_ancestors('object', object_type)
+
+    def process_ancestors(self, process_type):
+        """Return the frozenset of every type ``process_type`` inherits from."""
+        return self._get_ancestors('process', process_type)
+
+    def _inheritance(self, kind):
+        return self._object_inheritance if kind == 'object' else self._process_inheritance
+
+    def _get_ancestors(self, kind, type_name, visiting=()):
+        index = self._ancestors[kind]
+        ancestors = index.get(type_name)
+        if ancestors is not None:
+            return ancestors
+        if type_name in visiting:
+            cycle = ' -> '.join(visiting + (type_name,))
+            raise ValueError(f"Inheritance cycle in {kind} types: {cycle}")
+        if kind == 'object':
+            self._ensure_object(type_name)
+        else:
+            self._ensure_process(type_name)
+
+        ancestors = set()
+        for base_type in self._inheritance(kind).get(type_name, []):
+            ancestors.add(base_type)
+            ancestors.update(self._get_ancestors(kind, base_type, visiting + (type_name,)))
+        ancestors = frozenset(ancestors)
+        index[type_name] = ancestors
+        return ancestors
+
+    def _register_inheritance(self, kind, type_name, inherits_from):
+        # reject bases that already descend from type_name
+        for base_type in inherits_from:
+            if base_type == type_name or type_name in self._get_ancestors(kind, base_type):
+                raise ValueError(f"Inheritance cycle in {kind} types: "
+                                 f"'{type_name}' cannot inherit from '{base_type}'")
+
+        inheritance = self._inheritance(kind)
+        subtypes = self._subtypes[kind]
+        for base_type in inheritance.get(type_name, []):
+            subtypes.get(base_type, set()).discard(type_name)
+        inheritance[type_name] = inherits_from
+        for base_type in inherits_from:
+            subtypes.setdefault(base_type, set()).add(type_name)
+
+        # drop the closure of this type and everything that inherits from it
+        self._drop_derived(kind, type_name)
+
+    def _drop_derived(self, kind, type_name, reverse_only=False):
+        # drop what is derived from the ancestors of this type and of
+        # everything that inherits from it
+        subtypes = self._subtypes[kind]
+        tables = [] if reverse_only else [self._ancestors[kind], self._effective[kind]]
+        closures = self._reverse_closure.values() if kind == 'object' else ()
+        stale = [type_name]
+        while stale:
+            stale_type = stale.pop()
+            for table in tables:
+                table.pop(stale_type, None)
+            for closure in closures:
+                closure.pop(stale_type, None)
+            stale.extend(subtypes.get(stale_type, ()))
+
+    def subtypes_of(self, type_name, kind='object'):
+        """Return the frozenset of every registered type inheriting from ``type_name``."""
+        self.preload(kind)
+        subtypes = self._subtypes[kind]
+        found = set()
+        stale = list(subtypes.get(type_name, ()))
+        while stale:
+            subtype = stale.pop()
+            if subtype not in found:
+                found.add(subtype)
+                stale.extend(subtypes.get(subtype, ()))
+        return frozenset(found)
+
+    def compatible_processes(self, object_type):
+        """Return the frozenset of process types an object of ``object_type`` can take part in.
+
+        These are the process types whose participating objects include the
+        type or one of its ancestors.
+        """
+        self.preload('process')
+        return self._reverse_lookup('processes', self._participating_processes, object_type)
+
+    def allowed_containers(self, object_type):
+        """Return the frozenset of object types that can contain an object of ``object_type``.
+
+        These are the types whose contained objects include the type or one
+        of its ancestors.
+        """
+        self.preload('object')
+        return self._reverse_lookup('containers', self._containing_types, object_type)
+
+    def _reverse_lookup(self, name, index, object_type):
+        closure = self._reverse_closure[name]
+        types = closure.get(object_type)
+        if types is None:
+            types = set(index.get(object_type, ()))
+            for ancestor in self.object_ancestors(object_type):
+                types.update(index.get(ancestor, ()))
+            types = closure[object_type] = frozenset(types)
+        return types
+
+    def _update_reverse(self, index, declaring_type, old_types, new_types):
+        # keep a reverse index in step with a forward table entry
+        for object_type in old_types - new_types:
+            index.get(object_type, set()).discard(declaring_type)
+            self._drop_derived('object', object_type, reverse_only=True)
+        for object_type in new_types - old_types:
+            index.setdefault(object_type, set()).add(declaring_type)
+            self._drop_derived('object', object_type, reverse_only=True)
+
+    def _participates(self, object_type, process_type, allowed_types):
+        # with every process loaded, the reverse index answers directly
+        if self._pending['process']:
+            return self._is_allowed_type(object_type, allowed_types)
+        return process_type in self.compatible_processes(object_type)
+
+    def _can_contain(self, parent_type, object_type, allowed_types):
+        if self._pending['object']:
+            return self._is_allowed_type(object_type, allowed_types)
+        return parent_type in self.allowed_containers(object_type)
+
+    def effective_schema(self, type_name, kind='object'):
+        """Return the schema of ``type_name`` flattened over its inheritance.
+
+        The result has the ``type``, its ``ancestors`` from the most distant
+        to the nearest, and the ``attributes``, ``boundary_conditions`` and
+        ``required`` attributes of the type merged with those of its
+        ancestors, a type's own entries replacing inherited ones. Object
+        types also get the ``contained_objects`` and process types the
+        ``participating_objects`` declared along the chain, and ``defaults``
+        maps attribute names to their default values.
+
+        Results are cached until the type or one of its ancestors is
+        registered again, and are shared: do not modify them. Raises a
+        KeyError for types that are not registered.
+        """
+        effective = self._effective[kind].get(type_name)
+        if effective is not None:
+            return effective
+        registered = self._ensure_object if kind == 'object' else self._ensure_process
+        if not registered(type_name):
+            raise KeyError(f"{kind.capitalize()} type '{type_name}' is not registered.")
+        self._get_ancestors(kind, type_name)  # rejects inheritance cycles
+        types = self._object_types if kind == 'object' else self._process_types
+        references = 'contained_objects' if kind == 'object' else 'participating_objects'
+
+        chain = self._linearize(kind, type_name)
+        effective = {
+            'type': type_name,
+            'ancestors': chain[:-1],
+            'attributes': {},
+            'boundary_conditions': {},
+            'required': [],
+            references: [],
+        }
+        for chain_type in chain:
+            schema = types.get(chain_type)
+            if schema is None:
+                continue  # unregistered ancestors add nothing
+            effective['attributes'].update(schema.get('attributes') or {})
+            effective['boundary_conditions'].update(schema.get('boundary_conditions') or {})
+            for key in ('required', references):
+                effective[key].extend(value for value in schema.get(key) or [] if value not in effective[key])
+        effective['defaults'] = {name: spec['default'] for name, spec in effective['attributes'].items()
+                                 if isinstance(spec, dict) and 'default' in spec}
+        self._effective[kind][type_name] = effective
+        return effective
+
+    def _linearize(self, kind, type_name):
+        # bases before the types inheriting from them, each type once
+        inheritance = self._inheritance(kind)
+        order = []
+        stack = [(type_name, False)]
+        while stack:
+            name, done = stack.pop()
+            if done:
+                if name not in order:
+                    order.append(name)
+                continue
+            stack.append((name, True))
+            stack.extend((base, False) for base in reversed(inheritance.get(name, [])) if base not in order)
+        return order
+
+    def fill_defaults(self, model, objects=None, processes=None):
+        """Add missing attribute default values to the entries of ``model``.
+
+        Fills every object and process, or only those named in ``objects``
+        and ``processes``. Values already set are kept, and mutable
+        defaults are copied for each entry. Entries of unregistered types
+        are left as they are. Returns the names of the objects and of the
+        processes that changed.
+        """
+        changed = {}
+        for section, kind, names in (('objects', 'object', objects), ('processes', 'process', processes)):
+            entries = model[section]
+            type_of = getattr(entries, 'type_of', None)
+            defaults_by_type = {}
+            changed[section] = []
+            for name in entries if names is None else names:
+                entry_type = type_of(name) if type_of is not None else entries[name].get('type')
+                defaults = defaults_by_type.get(entry_type)
+                if defaults is None:
+                    defaults = defaults_by_type[entry_type] = self._default_items(entry_type, kind)
+                if not defaults:
+                    continue
+                entry = entries[name]
+                attributes = entry.get('attributes')
+                if not isinstance(attributes, dict):
+                    attributes = entry['attributes'] = {}
+                missing = [(key, value, mutable) for key, value, mutable in defaults if key not in attributes]
+                if not missing:
+                    continue
+                for key, value, mutable in missing:
+                    attributes[key] = copy.deepcopy(value) if mutable else value
+                if not isinstance(entries, dict):
+                    entries[name] = entry  # compact stores keep copies
+                changed[section].append(name)
+        return changed['objects'], changed['processes']
+
+    def _default_items(self, type_name, kind):
+        if not isinstance(type_name, str):
+            return ()
+        try:
+            defaults = self.effective_schema(type_name, kind)['defaults']
+        except KeyError:
+            return ()
+        return tuple((key, value, isinstance(value, (dict, list))) for key, value in defaults.items())
+
+    def _is_allowed_type(self, object_type, allowed_types):
+        # the object type or any of its ancestors is in allowed_types
+        return object_type in allowed_types or \
+            not self.object_ancestors(object_type).isdisjoint(allowed_types)
+
+    def validate_template(self, model, objects=None, processes=None, containment=None):
+        """Validate ``model`` against the registered types.
 
+        Raises on the first problem found. ``objects`` and ``processes``
+        restrict validation to those entry names; entries that are not
+        listed are assumed to be unchanged since they were last validated.
+        ``containment`` is the model's :class:`ContainmentIndex`, if the
+        caller maintains one; partial validation needs it to check the
+        containment hierarchy for cycles and objects with several containers.
+        """
+        if self.validation_cache is not None and objects is None and processes is None:
+            violations = self._cached_violations(model, containment)
+        else:
+            violations = self.iter_violations(model, objects, processes, containment)
+        for violation in violations:
+            violation.raise_error()
+
+    def collect_violations(self, model, max_errors=None, objects=None, processes=None, containment=None):
+        """Return a list of every :class:`Violation` in ``model``.
+
+        Objects, containment and processes are walked once. Stops after
+        ``max_errors`` violations when it is given.
+        """
+        if self.validation_cache is not None and objects is None and processes is None:
+            return self._cached_violations(model, containment)[:max_errors]
+        violations = self.iter_violations(model, objects, processes, containment)
+        return list(itertools.islice(violations, max_errors))
+
+    def _cached_violations(self, model, containment=None):
+        # full validations are looked up in the validation cache by the
+        # canonical digest of the model; a miss collects every violation
+        from multicell_utils.cache import model_digest
+        digest = model_digest(model)
+        version = (id(self), self.version)
+        violations = self.validation_cache.get(digest, version)
+        if violations is None:
+            violations = list(self.iter_violations(model, containment=containment))
+            self.validation_cache.put(digest, version, violations)
+        return violations
+
+    def iter_violations(self, model, objects=None, processes=None, containment=None):
+        instrument.count('validations')
+        for obj_name in model['objects'] if objects is None else objects:
+            yield from self._object_violations(model, obj_name)
+        if containment is None and objects is None:
+            from multicell_utils.containment import ContainmentIndex
+            with instrument.phase('validate.containment_index'):
+                containment = ContainmentIndex(model)
+        if containment is not None:
+            yield from instrument.timed_iter('validate.structure', containment.violations(objects))
+        for proc_name in model['processes'] if processes is None else processes:
+            yield from instrument.timed_iter('validate.participation', self._process_violations(model, proc_name))
+
+    def validate_object(self, model, obj_name):
+        for violation in self._object_violations(model, obj_name):
+            violation.raise_error()
+
+    def validate_process(self, model, proc_name):
+        for violation in self._process_violations(model, proc_name):
+            violation.raise_error()
+
+    def _object_violations(self, model, obj_name):
+        entry_violations = self.object_entry_violations(model.get('id'), obj_name, model['objects'][obj_name])
+        if (yield from instrument.timed_iter('validate.object', entry_violations)):
             # get containment from object
-            contained_objects = obj_schema.get('contained_objects')
-            if contained_objects:
-                allowed_obj_types = self.allowed_containments[object_type]
-                for object_name in contained_objects:
-                    assert object_name in model['objects'], f"Contained object '{object_name}' within '{obj_name}' is not in model"
-                    contained_object_type = model['objects'][object_name]['type']
-
-                    # check that the object type or its base types are allowed to be contained
-                    inherited = self.object_inheritance.get(contained_object_type, [])
-                    assert (contained_object_type in allowed_obj_types or
-                            any(base_type in allowed_obj_types for base_type in inherited)
-                            ), f"Object '{object_name}' is not allowed to be contained by '{obj_name}'"
-
-        # Validate processes
-        for proc_name, proc_schema in model['processes'].items():
-            process_type = proc_schema['type']
-            # process_full_schema = self.process_types[process_type]
-            participating_objects_names = proc_schema.get('participating_objects', [])
-            participating_objects_types = self.process_types[process_type].get('participating_objects', [])
-
-            # check that participating objects names are in model objects
-            for obj_name in participating_objects_names:
-                assert obj_name in model['objects'], f"Participating object '{obj_name}' is not valid for process '{proc_name}'"
-                obj_type = model['objects'][obj_name]['type']
-
-                # object types that inherit from this type are also allowed
-                inherited = self.object_inheritance.get(obj_type, [])
-                allowed_obj_types = inherited + [obj_type]
-
-                assert any(obj in participating_objects_types for obj in allowed_obj_types), \
-                    (f"None of the allowed object types {allowed_obj_types} are valid for process type '{process_type}' "
-                     f"with allowed types {participating_objects_types}")
-
-                # assert allowed_obj_types in participating_objects_types, \
-                #     f"Object '{obj_name}' of type '{obj_type}' is not valid for process type '{process_type}' with allowed types {participating_objects_types}"
-
-        # Validate containment structure
-        self.validate_containment(model)
-
-    def validate_containment(self, model):
-        structure = make_structure(model)
-        for parent, children in structure.items():
+            yield from instrument.timed_iter('validate.containment', self.containment_violations(model, obj_name))
+
+    def object_entry_violations(self, model_id, obj_name, obj_schema):
+        """Yield violations that only depend on the object entry itself.
+
+        Returns True when the entry has a registered type and well-formed
+        references, so that checks against other entries can follow.
+        """
+        path = ('objects', obj_name)
+        with instrument.phase('validate.meta_schema'):
+            error = best_match(compiled_validator(self.object_meta_schema).iter_errors(obj_schema))
+        if error is not None:
+            yield Violation(path + tuple(error.absolute_path), 'meta_schema',
+                            f"Object '{obj_name}' in model '{model_id}' is invalid. {error.message}",
+                            error=ValueError)
+            if not isinstance(obj_schema, dict) or not isinstance(obj_schema.get('type'), str):
+                return False
+
+        object_type = obj_schema['type']
+        if not self._ensure_object(object_type):
+            yield Violation(path + ('type',), 'unregistered_type',
+                            f"Object type '{object_type}' is not registered.", actual=object_type)
+            return False
+
+        contained_objects = obj_schema.get('contained_objects', [])
+        if not is_name_list(contained_objects):
+            if isinstance(contained_objects, list):
+                # the meta-schema does not check the items
+                yield Violation(path + ('contained_objects',), 'meta_schema',
+                                f"Object '{obj_name}' in model '{model_id}' is invalid. "
+                                f"Contained objects must be object names.", error=ValueError)
+            return False
+        return True
+
+    def containment_violations(self, model, parent):
+        path = ('objects', parent, 'contained_objects')
+        parent_schema = model['objects'][parent]
+        if not isinstance(parent_schema, dict):
+            return
+        contained_objects = parent_schema.get('contained_objects')
+        if not contained_objects or not is_name_list(contained_objects):
+            return  # malformed references are reported with the parent itself
+        parent_type = parent_schema['type']
+
+        # assert parent object can contain children
+        if parent_type not in self._allowed_containments:
+            yield Violation(path, 'containment_not_claimed',
+                            f"Invalid containment: {parent_type} does not claim contained objects",
+                            expected=[], actual=parent_type, error=ValueError)
+            return
+
+        allowed_obj_types = self._allowed_containments[parent_type]
+        for object_name in contained_objects:
+            if object_name not in model['objects']:
+                yield Violation(path + (object_name,), 'missing_object',
+                                f"Contained object '{object_name}' within '{parent}' is not in model")
+                continue
+
+            # check that the object type or its base types are allowed to be contained
+            contained_object = model['objects'][object_name]
+            contained_object_type = contained_object.get('type') if isinstance(contained_object, dict) else None
+            if not isinstance(contained_object_type, str):
+                continue  # reported with the contained object itself
+            if not self._can_contain(parent_type, contained_object_type, allowed_obj_types):
+                yield Violation(path + (object_name,), 'containment',
+                                f"Object '{object_name}' is not allowed to be contained by '{parent}'",
+                                expected=list(allowed_obj_types), actual=contained_object_type)
+
+    def _process_violations(self, model, proc_name):
+        path = ('processes', proc_name)
+        proc_schema = model['processes'][proc_name]
+        if not isinstance(proc_schema, dict):
+            yield Violation(path, 'meta_schema',
+                            f"Process '{proc_name}' in model '{model.get('id')}' is invalid. "
+                            f"{proc_schema!r} is not of type 'object'", error=ValueError)
+            return
+        process_type = proc_schema.get('type')
+        if not isinstance(process_type, str) or not self._ensure_process(process_type):
+            yield Violation(path + ('type',), 'unregistered_type',
+                            f"Process type '{process_type}' is not registered.", actual=process_type)
+            return
+
+        participating_objects_names = proc_schema.get('participating_objects', [])
+        if not is_name_list(participating_objects_names):
+            yield Violation(path + ('participating_objects',), 'meta_schema',
+                            f"Process '{proc_name}' in model '{model.get('id')}' is invalid. "
+                            f"Participating objects must be a list of object names.", error=ValueError)
+            return
+        participating_objects_types = self._process_types[process_type].get('participating_objects', [])
+
+        # check that participating objects names are in model objects
+        for obj_name in participating_objects_names:
+            obj_path = path + ('participating_objects', obj_name)
+            if obj_name not in model['objects']:
+                yield Violation(obj_path, 'missing_object',
+                                f"Participating object '{obj_name}' is not valid for process '{proc_name}'")
+                continue
+            obj = model['objects'][obj_name]
+            obj_type = obj.get('type') if isinstance(obj, dict) else None
+            if not isinstance(obj_type, str):
+                continue  # reported with the object itself
+
+            # object types that inherit from this type are also allowed
+            if not self._participates(obj_type, process_type, participating_objects_types):
+                yield Violation(obj_path, 'participation',
+                                f"None of the allowed object types {sorted(self.object_ancestors(obj_type)) + [obj_type]} "
+                                f"are valid for process type '{process_type}' with allowed types {participating_objects_types}",
+                                expected=list(participating_objects_types), actual=obj_type)
+
+    def validate_containment(self, model, parents=None):
+        for parent in model['objects'] if parents is None else parents:
             parent_type = model['objects'][parent]['type']
+            if not model['objects'][parent].get('contained_objects'):
+                continue
 
             # assert parent object is registered
-            assert parent_type in self.object_inheritance, f"Object '{parent}' does not have inheritance information"
-
-            # assert parent object can contain children
-            if parent_type not in self.allowed_containments:
-                raise ValueError(f"Invalid containment: {parent_type} does not claim contained objects")
+            assert self._ensure_object(parent_type), f"Object '{parent}' does not have inheritance information"
 
-            # assert children types can be contained by the parent type
-            allowed_children_types = self.allowed_containments[parent_type]
-            for child in children:
-                child_type = model['objects'][child]['type']
-                if child_type not in allowed_children_types:
-                    if not any(base_type in allowed_children_types for base_type in self.object_inheritance.get(child_type, [])):
-                        print(f"Invalid containment: {child_type} object is not contained by {parent_type}")
+            # disallowed children are reported without raising
+            for violation in self.containment_violations(model, parent):
+                if violation.rule == 'containment':
+                    print(f"Invalid containment: {violation.actual} object is not contained by {parent_type}")
+                else:
+                    violation.raise_error()
 
     def register_object(self, schema, object_type, overwrite=False):
+        if not overwrite:
+            # a pending file may already define this type
+            self._ensure_object(schema.get('type', object_type))
+        with instrument.phase('registry.register'):
+            self._register_object(schema, object_type, overwrite)
+        self.version += 1
+
+    def _register_object(self, schema, object_type, overwrite=False, meta_error=_UNCHECKED):
         if 'type' in schema:
             object_type = schema['type']
-        if object_type in self.object_types and not overwrite:
+        if object_type in self._object_types and not overwrite:
             raise ValueError(f"Object schema '{object_type}' is already registered.")
-        try:
-            self.validate_schema(schema, self.object_meta_schema)
-        except ValidationError as e:
-            print(f"Failed to register object schema '{object_type} with metaschema {self.object_meta_schema}': {e.message}")
+        if meta_error is _UNCHECKED:
+            meta_error = meta_schema_error(schema, self.object_meta_schema)
+        if meta_error is not None:
+            print(f"Failed to register object schema '{object_type} with metaschema {self.object_meta_schema}': {meta_error}")
 
-        self.object_types[object_type] = schema
+        # Register inheritance, rejecting cycles before anything is stored
+        self._register_inheritance('object', object_type, schema.get('inherits_from', []))
+
+        self._object_types[object_type] = schema
         # print(f"Object schema '{schema_name}' registered successfully.")
 
+        old_children = set(self._allowed_containments.get(object_type, ()))
         contained_objects = schema.get('contained_objects')
         if contained_objects:
-            if object_type not in self.allowed_containments:
-                self.allowed_containments[object_type] = []
+            if object_type not in self._allowed_containments:
+                self._allowed_containments[object_type] = []
             for obj_type in contained_objects:
-                self.allowed_containments[object_type].append(obj_type)
-
-        # Register inheritance
-        inherits_from = schema.get('inherits_from', [])
-        self.object_inheritance[object_type] = inherits_from
-
+                self._allowed_containments[object_type].append(obj_type)
+        self._update_reverse(self._containing_types, object_type,
+                             old_children, set(self._allowed_containments.get(object_type, ())))
 
     def register_process(self, schema, process_type=None, overwrite=False):
+        if not overwrite:
+            # a pending file may already define this type
+            self._ensure_process(schema.get('type', process_type))
+        with instrument.phase('registry.register'):
+            self._register_process(schema, process_type, overwrite)
+        self.version += 1
+
+    def _register_process(self, schema, process_type=None, overwrite=False, meta_error=_UNCHECKED):
         if 'type' in schema:
             process_type = schema['type']
-        if process_type in self.process_types and not overwrite:
+        if process_type in self._process_types and not overwrite:
             raise ValueError(f"Process schema type '{process_type}' is already registered.")
+        if meta_error is _UNCHECKED:
+            meta_error = meta_schema_error(schema, self.process_meta_schema)
+        if meta_error is not None:
+            print(f"Failed to register process schema '{process_type}': {meta_error}")
+            return
+
+        # Register inheritance, rejecting cycles before anything is stored
+        self._register_inheritance('process', process_type, schema.get('inherits_from', []))
+
+        self._process_types[process_type] = schema
+        # print(f"Process schema '{schema_name}' registered successfully.")
+
+        old_participants = set(self._process_participation.get(process_type, ()))
+        participating_objects = schema.get('participating_objects')
+        if participating_objects:
+            if process_type not in self._process_participation:
+                self._process_participation[process_type] = []
+            for object_type in participating_objects:
+                self._process_participation[process_type].append(object_type)
+        self._update_reverse(self._participating_processes, process_type,
+                             old_participants, set(self._process_participation.get(process_type, ())))
+
+    def register_template(self, schema, template_name):
+        """Compile ``schema`` into a :class:`TemplatePlan` named ``template_name``."""
+        from multicell_utils.template import TemplatePlan
+        self._templates[template_name] = TemplatePlan(template_name, schema)
+
+    def template_plan(self, template_name):
+        if not self._ensure_template(template_name):
+            raise KeyError(f"Template '{template_name}' is not registered.")
+        return self._templates[template_name]
+
+    def instantiate_template(self, template_name, **kwargs):
+        """Return a new model from a registered template; see :meth:`TemplatePlan.instantiate`."""
+        return self.template_plan(template_name).instantiate(self, **kwargs)
+
+
+def _type_key(name):
+    # normalize type and file names so that 'CellGrowth' matches 'cell_growth'
+    return name.replace('_', '').replace(' ', '').lower()
+
+
+def file_fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_schema_file(schema_path, meta_schema=None):
+    """Parse a schema file and check it against ``meta_schema``.
+
+    Returns a dict with the ``path``, its ``fingerprint``, the parsed
+    ``schema``, the ``load_error`` or ``meta_error`` message if any, and
+    the ``seconds`` the file took.
+    """
+    start = time.perf_counter()
+    result = {'path': schema_path, 'fingerprint': file_fingerprint(schema_path),
+              'schema': None, 'load_error': None, 'meta_error': None}
+    try:
+        with open(schema_path, 'r') as schema_file:
+            result['schema'] = json.load(schema_file)
+    except Exception as e:
+        result['load_error'] = str(e)
+    else:
+        if meta_schema is not None:
+            result['meta_error'] = meta_schema_error(result['schema'], meta_schema)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+_worker_meta_schema = None
+
+
+def _init_loader_worker(meta_schema):
+    global _worker_meta_schema
+    _worker_meta_schema = meta_schema
+
+
+def _load_schema_file_in_worker(schema_path):
+    return load_schema_file(schema_path, _worker_meta_schema)
+
+
+def load_schema_files(paths, meta_schema=None, max_workers=None):
+    """Load and meta-validate schema files, in a process pool if ``max_workers`` > 1.
+
+    Results are returned in the order of ``paths``.
+    """
+    paths = list(paths)
+    if not max_workers or max_workers <= 1 or len(paths) <= 1:
+        return [load_schema_file(path, meta_schema) for path in paths]
+    chunksize = max(1, len(paths) // (4 * max_workers))
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=_init_loader_worker,
+                             initargs=(meta_schema,)) as pool:
+        return list(pool.map(_load_schema_file_in_worker, paths, chunksize=chunksize))
+
+
+def register_schema_file(schema_path, register_function):
+    filename = os.path.basename(schema_path)
+    start = time.perf_counter()
+    with open(schema_path, 'r') as schema_file:
         try:
-            self.validate_schema(schema, self.process_meta_schema)
-            self.process_types[process_type] = schema
-            # print(f"Process schema '{schema_name}' registered successfully.")
-            # if process_name == 'contact_force':
-            #     breakpoint()
+            schema = json.load(schema_file)
+            schema_name = os.path.splitext(filename)[0]
+        except Exception as e:
+            print(f"Failed to load schema from file '{filename}': {e}")
+            return
+    try:
+        register_function(schema, schema_name)
+    except Exception as e:
+        print(f"Failed to register schema '{schema_name}' from file '{filename}': {e}")
+    finally:
+        instrument.record_file(schema_path, time.perf_counter() - start)
 
-            participating_objects = schema.get('participating_objects')
-            if participating_objects:
-                if process_type not in self.process_participation:
-                    self.process_participation[process_type] = []
-                for object_type in participating_objects:
-                    self.process_participation[process_type].append(object_type)
 
-            # Register inheritance
-            self.process_inheritance[process_type] = schema.get('inherits_from', [])
+def register_schemas_from_directory(directory, register_function):
+    with instrument.phase('registry.register_directory'):
+        for filename in os.listdir(directory):
+            if filename.endswith('.json'):
+                register_schema_file(os.path.join(directory, filename), register_function)
 
-        except ValidationError as e:
-            print(f"Failed to register process schema '{process_type}': {e.message}")
 
+def test_compiled_validators():
+    registry = SchemaRegistry()
+    registry.validate_schema({'type': 'A', 'attributes': {}}, registry.object_meta_schema)
+    validator = compiled_validator(registry.object_meta_schema)
+    registry.validate_schema({'type': 'B', 'attributes': {}}, registry.object_meta_schema)
+    assert compiled_validator(registry.object_meta_schema) is validator
 
-    def register_template(self, schema, template_name):
-        # TODO implement template registration
-        schema_name = schema['name']
+    try:
+        registry.validate_schema({'type': 'C'}, registry.object_meta_schema)
+    except ValidationError as e:
+        assert "'attributes' is a required property" in e.message
+    else:
+        raise AssertionError("Schema without attributes should be invalid")
+
+    # a replaced meta-schema gets its own validator
+    registry.object_meta_schema = dict(registry.object_meta_schema, required=['type'])
+    assert compiled_validator(registry.object_meta_schema) is not validator
+    registry.validate_schema({'type': 'C'}, registry.object_meta_schema)
+
+
+def test_inheritance_closure():
+    registry = SchemaRegistry()
+    registry.register_object({'type': 'A', 'attributes': {}}, 'A')
+    registry.register_object({'type': 'B', 'inherits_from': ['A'], 'attributes': {}}, 'B')
+    registry.register_object({'type': 'C', 'inherits_from': ['B'], 'attributes': {}}, 'C')
+    assert registry.object_ancestors('C') == {'A', 'B'}
+    assert registry.inherits_from('C', 'A')
+    assert not registry.inherits_from('A', 'C')
+
+    # re-registering a base updates the closure of its descendants
+    registry.register_object({'type': 'B', 'inherits_from': [], 'attributes': {}}, 'B', overwrite=True)
+    assert registry.object_ancestors('C') == {'B'}
+
+    # cycles are rejected
+    try:
+        registry.register_object({'type': 'B', 'inherits_from': ['C'], 'attributes': {}}, 'B', overwrite=True)
+    except ValueError as e:
+        assert 'cycle' in str(e)
+    else:
+        raise AssertionError("Inheritance cycle should be rejected")
+    assert registry.object_ancestors('C') == {'B'}
+
+    # process inheritance is indexed too
+    registry.register_process({'type': 'P', 'participating_objects': ['A']}, 'P')
+    registry.register_process({'type': 'Q', 'inherits_from': ['P'], 'participating_objects': ['A']}, 'Q')
+    assert registry.inherits_from('Q', 'P', kind='process')
+
+
+def test_grandchild_types_validate():
+    registry = SchemaRegistry()
+    registry.add_schema_directory(object_schemas_dir, 'object')
+    registry.add_schema_directory(process_schemas_dir, 'process')
+    registry.register_object({'type': 'CellCPMVariant', 'inherits_from': ['CellCPM'], 'attributes': {}},
+                             'CellCPMVariant')
+    model = {
+        'id': 'model', 'name': 'model',
+        'objects': {
+            'field': {'type': 'CellField', 'attributes': {}, 'contained_objects': ['cell']},
+            'cell': {'type': 'CellCPMVariant', 'attributes': {}},
+        },
+        'processes': {
+            'growth': {'type': 'CellGrowth', 'participating_objects': ['cell']},
+        },
+    }
+    registry.validate_template(model)
+
+
+def test_collect_violations():
+    registry = SchemaRegistry()
+    registry.add_schema_directory(object_schemas_dir, 'object')
+    registry.add_schema_directory(process_schemas_dir, 'process')
+    model = {
+        'id': 'model', 'name': 'model',
+        'objects': {
+            'field': {'type': 'CellField', 'attributes': {}, 'contained_objects': ['cell', 'ghost', 'space']},
+            'cell': {'type': 'Cell', 'attributes': {}, 'contained_objects': ['space']},
+            'space': {'type': 'MaterialObjectSpace'},
+            'unknown': {'type': 'DoesNotExist', 'attributes': {}},
+        },
+        'processes': {
+            'diffusion': {'type': 'Diffusion', 'participating_objects': ['cell', 'nothing']},
+        },
+    }
+    violations = registry.collect_violations(model)
+    rules = [(v.rule, v.path) for v in violations]
+    assert rules == [
+        ('missing_object', ('objects', 'field', 'contained_objects', 'ghost')),
+        ('containment', ('objects', 'field', 'contained_objects', 'space')),
+        ('containment_not_claimed', ('objects', 'cell', 'contained_objects')),
+        ('meta_schema', ('objects', 'space')),
+        ('unregistered_type', ('objects', 'unknown', 'type')),
+        ('multiple_parents', ('objects', 'space')),
+        ('participation', ('processes', 'diffusion', 'participating_objects', 'cell')),
+        ('missing_object', ('processes', 'diffusion', 'participating_objects', 'nothing')),
+    ], rules
+    assert violations[1].expected == ['Cell'] and violations[1].actual == 'MaterialObjectSpace'
+    assert len(registry.collect_violations(model, max_errors=2)) == 2
+
+    # raising mode stops at the first violation
+    try:
+        registry.validate_template(model)
+    except AssertionError as e:
+        assert str(e) == violations[0].message
+    else:
+        raise AssertionError("Model validation should have failed")
+
+    # malformed entries are reported once, without checking their references
+    malformed = {
+        'id': 'malformed', 'name': 'malformed',
+        'objects': {
+            'field': {'type': 'CellField', 'attributes': {}, 'contained_objects': ['cell', 'junk', 'nested']},
+            'cell': {'type': 'Cell', 'attributes': {}, 'contained_objects': 'cell'},
+            'junk': 'not an object',
+            'nested': {'type': 'Cell', 'attributes': {}, 'contained_objects': [['cell']]},
+        },
+        'processes': {
+            'text': 'not a process',
+            'diffusion': {'type': 'Diffusion', 'participating_objects': 'cell'},
+            'lists': {'type': 'Diffusion', 'participating_objects': [['cell']]},
+            'motion': {'type': 'MotileForce', 'participating_objects': ['junk']},
+        },
+    }
+    rules = [(v.rule, v.path) for v in registry.collect_violations(malformed)]
+    assert rules == [
+        ('meta_schema', ('objects', 'cell', 'contained_objects')),
+        ('meta_schema', ('objects', 'junk')),
+        ('meta_schema', ('objects', 'nested', 'contained_objects')),
+        ('meta_schema', ('processes', 'text')),
+        ('meta_schema', ('processes', 'diffusion', 'participating_objects')),
+        ('meta_schema', ('processes', 'lists', 'participating_objects')),
+    ], rules
+
+
+def test_parallel_preload():
+    def loaded_registry(max_workers):
+        registry = SchemaRegistry()
+        registry.add_schema_directory(object_schemas_dir, 'object')
+        registry.add_schema_directory(process_schemas_dir, 'process')
+        registry.add_schema_directory(templates_dir, 'template')
+        results = registry.preload(max_workers=max_workers)
+        assert all(result['seconds'] >= 0 for result in results)
+        return registry
+
+    serial = loaded_registry(None)
+    parallel = loaded_registry(2)
+    for table in ['_object_types', '_process_types', '_allowed_containments', '_process_participation',
+                  '_object_inheritance', '_process_inheritance']:
+        assert getattr(serial, table) == getattr(parallel, table), table
+        assert list(getattr(serial, table)) == list(getattr(parallel, table)), table
+
+
+def test_registry_snapshot():
+    import shutil
+    import tempfile
+
+    def new_registry(directory):
+        registry = SchemaRegistry()
+        registry.add_schema_directory(directory, 'object')
+        registry.add_schema_directory(process_schemas_dir, 'process')
+        return registry
+
+    with tempfile.TemporaryDirectory() as tmp:
+        objects_dir = os.path.join(tmp, 'object')
+        shutil.copytree(object_schemas_dir, objects_dir)
+        snapshot_path = os.path.join(tmp, 'registry.pickle')
+
+        assert new_registry(objects_dir).load_snapshot(snapshot_path) is None
+        expected = new_registry(objects_dir)
+        expected.save_snapshot(snapshot_path)
+
+        # nothing changed: everything comes from the snapshot
+        registry = new_registry(objects_dir)
+        n_files = len(registry._pending['object']) + len(registry._pending['process'])
+        assert registry.load_snapshot(snapshot_path) == n_files
+        assert registry.object_types == expected.object_types
+        assert registry.object_ancestors('CellCPM') == {'Cell', 'Material'}
+
+        # a changed file is reloaded, the others are reused
+        with open(os.path.join(objects_dir, 'universe.json'), 'w') as file:
+            json.dump({'type': 'Universe', 'attributes': {}, 'contained_objects': ['Field']}, file)
+        registry = new_registry(objects_dir)
+        assert registry.load_snapshot(snapshot_path) == n_files - 1
+        assert registry.allowed_containments['Universe'] == ['Field']
+        assert registry.process_types == expected.process_types
+
+        # an unwritable snapshot path only warns when importing the library
+        import subprocess
+        import sys
+        env = dict(os.environ, MULTICELL_SCHEMA_SNAPSHOT=os.path.join(tmp, 'missing', 'registry.pickle'))
+        code = "import schema; print('Universe' in schema.schema_registry.object_types)"
+        result = subprocess.run([sys.executable, '-c', code], cwd=project_root, env=env,
+                                capture_output=True, text=True)
+        assert result.returncode == 0 and result.stdout.strip() == 'True', result.stderr
+        assert 'Could not save the schema registry snapshot' in result.stderr
+
+
+def test_lazy_registry():
+    registry = SchemaRegistry()
+    registry.add_schema_directory(object_schemas_dir, 'object')
+    registry.add_schema_directory(process_schemas_dir, 'process')
+    n_pending = len(registry._pending['object'])
+    assert n_pending > 2 and not registry._object_types
+
+    # looking up a type only loads the files needed to find it and its bases
+    assert registry.inherits_from('CellCPM', 'Material')
+    assert 'CellCPM' in registry._object_types
+    assert len(registry._pending['object']) < n_pending - 2
+
+    # the public tables see the whole library
+    assert 'Universe' in registry.object_types
+    assert 'Diffusion' in registry.process_types
+    assert not any(registry._pending.values())
+
+
+def test_effective_schemas():
+    registry = SchemaRegistry()
+    registry.add_schema_directory(object_schemas_dir, 'object')
+    registry.add_schema_directory(process_schemas_dir, 'process')
+    assert registry.effective_schema('Diffusion', 'process')['defaults'] == {'diffusion_coeffient': 0.0}
+    assert registry.effective_schema('CellField')['defaults']['medium'] == 'fluid'
+    assert registry.effective_schema('CellCPM')['ancestors'][-1] == 'Cell'
+
+    registry.register_object({'type': 'Base', 'attributes': {'volume': {'type': 'float', 'default': 1.0},
+                                                             'tags': {'type': 'array', 'default': []}},
+                              'required': ['volume'], 'contained_objects': ['Cell']}, 'Base')
+    registry.register_object({'type': 'Derived', 'inherits_from': ['Base'], 'contained_objects': ['Field'],
+                              'attributes': {'volume': {'type': 'float', 'default': 2.0}}}, 'Derived')
+    derived = registry.effective_schema('Derived')
+    assert derived['ancestors'] == ['Base']
+    assert derived['defaults'] == {'volume': 2.0, 'tags': []}
+    assert derived['required'] == ['volume'] and derived['contained_objects'] == ['Cell', 'Field']
+    assert registry.effective_schema('Derived') is derived
+
+    model = {'id': 'model', 'name': 'model', 'processes': {}, 'objects': {
+        f"cell {i}": {'type': 'Derived', 'attributes': {'volume': 3.0} if i == 0 else {}} for i in range(3)}}
+    model['objects']['other'] = {'type': 'Unregistered'}
+    assert registry.fill_defaults(model) == (['cell 0', 'cell 1', 'cell 2'], [])
+    assert model['objects']['cell 0']['attributes'] == {'volume': 3.0, 'tags': []}
+    assert model['objects']['cell 1']['attributes'] == {'volume': 2.0, 'tags': []}
+    assert model['objects']['cell 1']['attributes']['tags'] is not model['objects']['cell 2']['attributes']['tags']
+    assert registry.fill_defaults(model) == ([], [])
+
+    # re-registering an ancestor drops the flattened schemas below it
+    registry.register_object({'type': 'Base', 'attributes': {'mass': {'default': 0.5}}}, 'Base', overwrite=True)
+    assert registry.effective_schema('Derived')['defaults'] == {'mass': 0.5, 'volume': 2.0}
+    try:
+        registry.effective_schema('Unregistered')
+    except KeyError:
         pass
+    else:
+        raise AssertionError("Unregistered types have no effective schema")
 
 
-def register_schemas_from_directory(directory, register_function):
-    for filename in os.listdir(directory):
-        if filename.endswith('.json'):
-            schema_path = os.path.join(directory, filename)
-            with open(schema_path, 'r') as schema_file:
-                try:
-                    schema = json.load(schema_file)
-                    schema_name = os.path.splitext(filename)[0]
-                except Exception as e:
-                    print(f"Failed to load schema from file '{filename}': {e}")
-                try:
-                    register_function(schema, schema_name)
-                except Exception as e:
-                    print(f"Failed to register schema '{schema_name}' from file '{filename}': {e}")
+def test_reverse_indexes():
+    registry = SchemaRegistry()
+    registry.add_schema_directory(object_schemas_dir, 'object')
+    registry.add_schema_directory(process_schemas_dir, 'process')
+    registry.preload()
+    for object_type in registry.object_types:
+        lineage = registry.object_ancestors(object_type) | {object_type}
+        assert registry.compatible_processes(object_type) == {
+            process_type for process_type, allowed in registry.process_participation.items()
+            if not lineage.isdisjoint(allowed)}
+        assert registry.allowed_containers(object_type) == {
+            container for container, allowed in registry.allowed_containments.items()
+            if not lineage.isdisjoint(allowed)}
+    assert 'CellGrowth' in registry.compatible_processes('CellCPM')
+    assert 'CellField' in registry.subtypes_of('Field')
+
+    # registrations update the indexes of the types they affect
+    registry.register_object({'type': 'Variant', 'inherits_from': ['CellCPM'], 'attributes': {}}, 'Variant')
+    assert registry.compatible_processes('Variant') == registry.compatible_processes('CellCPM')
+    registry.register_process({'type': 'Fusion', 'participating_objects': ['Cell']}, 'Fusion')
+    registry.register_object({'type': 'Dish', 'attributes': {}, 'contained_objects': ['CellCPM']}, 'Dish')
+    assert 'Fusion' in registry.compatible_processes('Variant')
+    assert 'Dish' in registry.allowed_containers('Variant') and 'Dish' not in registry.allowed_containers('Cell')
+    registry.register_object({'type': 'Variant', 'attributes': {}}, 'Variant', overwrite=True)
+    assert registry.compatible_processes('Variant') == frozenset()
+
+    # validation gives the same results with and without the indexes
+    model = {'id': 'model', 'name': 'model', 'processes': {
+        'fusion': {'type': 'Fusion', 'participating_objects': ['cell', 'variant']}}, 'objects': {
+        'dish': {'type': 'Dish', 'attributes': {}, 'contained_objects': ['cell', 'variant']},
+        'cell': {'type': 'CellCPM', 'attributes': {}},
+        'variant': {'type': 'Variant', 'attributes': {}}}}
+    indexed = [violation.to_dict() for violation in registry.collect_violations(model)]
+    assert [violation['rule'] for violation in indexed] == ['containment', 'participation']
+    registry._pending['process'].append('unused.json')
+    registry._pending['object'].append('unused.json')
+    try:
+        assert [violation.to_dict() for violation in registry.collect_violations(model)] == indexed
+    finally:
+        registry._pending = {kind: [] for kind in SCHEMA_KINDS}
 
 
 if __name__ == '__main__':
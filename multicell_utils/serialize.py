@@ -0,0 +1,181 @@
+"""Reading and writing of model and schema JSON files.
+
+Data is written in one of three modes:
+
+- ``'pretty'``: indented with 4 spaces, the format of the files checked
+  into this repository.
+- ``'compact'``: no whitespace, for large generated models.
+- ``'canonical'``: compact with sorted keys, so that equal data gives equal
+  bytes with a given backend.
+
+The stdlib ``json`` backend is always available. When ``orjson`` is
+installed it is used for compact and canonical output and for reading;
+pretty output always goes through the stdlib, since orjson only indents
+by 2 spaces. Files whose name ends in ``.gz`` are gzip-compressed, and
+compressed files are recognized when reading whatever their name.
+Writes go to a temporary file in the target directory which then replaces
+the target, so an interrupted write never leaves a truncated file.
+"""
+import io
+import os
+import gzip
+import json
+import tempfile
+
+try:
+    import orjson
+except ImportError:  # optional fast backend
+    orjson = None
+
+
+MODES = ['pretty', 'compact', 'canonical']
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class JsonBackend:
+    name = 'json'
+
+    def dumps(self, data, mode='pretty'):
+        if mode == 'pretty':
+            text = json.dumps(data, indent=4)
+        elif mode == 'compact':
+            text = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+        else:
+            text = json.dumps(data, separators=(',', ':'), ensure_ascii=False, sort_keys=True)
+        return text.encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonBackend:
+    name = 'orjson'
+
+    def dumps(self, data, mode='pretty'):
+        if mode == 'pretty':
+            return BACKENDS['json'].dumps(data, mode)
+        option = orjson.OPT_SORT_KEYS if mode == 'canonical' else 0
+        return orjson.dumps(data, option=option | orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+BACKENDS = {'json': JsonBackend()}
+if orjson is not None:
+    BACKENDS['orjson'] = OrjsonBackend()
+
+default_backend = 'orjson' if orjson is not None else 'json'
+
+
+def get_backend(backend=None):
+    """Return the named backend, or the default one."""
+    name = default_backend if backend is None else backend
+    if name not in BACKENDS:
+        raise ValueError(f"JSON backend '{name}' is not available. Available backends: {list(BACKENDS)}.")
+    return BACKENDS[name]
+
+
+def dumps(data, mode='pretty', backend=None):
+    """Serialize ``data`` to UTF-8 JSON bytes in the given mode."""
+    if mode not in MODES:
+        raise ValueError(f"Invalid mode '{mode}'. Must be one of {MODES}.")
+    return get_backend(backend).dumps(data, mode)
+
+
+def loads(data, backend=None):
+    """Parse JSON from ``bytes`` or ``str``, decompressing gzip data."""
+    if isinstance(data, bytes) and data[:2] == GZIP_MAGIC:
+        data = gzip.decompress(data)
+    return get_backend(backend).loads(data)
+
+
+def dump(data, path, mode='pretty', backend=None, compress=None):
+    """Write ``data`` to ``path`` atomically.
+
+    ``compress`` defaults to whether ``path`` ends in ``.gz``.
+    """
+    content = dumps(data, mode, backend)
+    if compress is None:
+        compress = path.endswith('.gz')
+    if compress:
+        # a fixed mtime keeps the compressed bytes reproducible
+        content = _gzip(content)
+    atomic_write(path, content)
+
+
+def _gzip(content):
+    # gzip.compress only takes mtime from Python 3.8
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as file:
+        file.write(content)
+    return buffer.getvalue()
+
+
+def load(path, backend=None):
+    with open(path, 'rb') as file:
+        return loads(file.read(), backend)
+
+
+def open_text(path):
+    """Open a JSON file for reading as text, decompressing it if needed."""
+    with open(path, 'rb') as file:
+        compressed = file.read(2) == GZIP_MAGIC
+    if compressed:
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def atomic_write(path, content):
+    """Replace ``path`` with ``content`` through a temporary file and a rename."""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        permissions = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        permissions = 0o666 & ~umask
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(temp_path, permissions)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def test_serialize_modes():
+    data = {'name': 'ünïcode', 'b': [1, 2.5, None], 'a': {'nested': True}}
+    for backend in BACKENDS:
+        for mode in MODES:
+            assert loads(dumps(data, mode, backend), backend) == data
+        assert dumps(data, 'pretty', backend) == json.dumps(data, indent=4).encode('utf-8')
+        assert dumps(data, 'canonical', backend).startswith(b'{"a":')
+    assert len(dumps(data, 'compact')) < len(dumps(data, 'pretty'))
+    assert loads(gzip.compress(dumps(data, 'compact'))) == data
+
+
+def test_atomic_dump():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'model.json.gz')
+        dump({'id': 'model_1'}, path, mode='compact')
+        with open(path, 'rb') as file:
+            assert file.read(2) == GZIP_MAGIC
+        assert load(path) == {'id': 'model_1'}
+        with open_text(path) as file:
+            assert json.load(file) == {'id': 'model_1'}
+
+        # a failed write leaves the previous file in place
+        try:
+            dump({'id': object()}, path)
+        except TypeError:
+            pass
+        else:
+            raise AssertionError("Serializing an object should fail")
+        assert load(path) == {'id': 'model_1'}
+        assert os.listdir(directory) == ['model.json.gz']
@@ -0,0 +1,348 @@
+"""Local validation service.
+
+A long-running process keeps the schema library loaded in a pool of worker
+processes and validates models sent to it over a Unix socket, so that
+tools which only need to validate do not each load the registry::
+
+    python -m multicell_utils.service [--socket PATH] [--workers N]
+
+The protocol is newline-delimited JSON. Each request is one line
+``{"id": ..., "model": {...}, "max_errors": n}``, and is answered by one
+line ``{"id": ..., "violations": [...]}`` with the violations in the
+format of :meth:`Violation.to_dict` plus the name of their ``error``
+class, or ``{"id": ..., "error": "..."}`` when the request could not be
+validated. Requests on a connection are validated concurrently and
+answered as they complete, so answers are matched to requests by ``id``.
+Requests arriving together, on one or several connections, are sent to
+the workers in batches.
+
+:class:`ValidationClient` talks to the service, and validates in-process
+when it is not running.
+"""
+import os
+import sys
+import json
+import socket
+import asyncio
+import argparse
+import builtins
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from multicell_utils import serialize
+
+
+DEFAULT_SOCKET = os.environ.get('MULTICELL_VALIDATION_SOCKET') or \
+    os.path.join(tempfile.gettempdir(), f"multicell-validation-{getattr(os, 'getuid', lambda: 0)()}.sock")
+
+# longest request line accepted, models included
+MAX_REQUEST_SIZE = 2 ** 30
+
+
+# Workers
+# Each worker loads the whole schema library once, and keeps a cache of
+# validation results so that repeated documents are answered from memory.
+
+_worker_registry = None
+
+
+def _init_worker():
+    global _worker_registry
+    from schema import schema_registry
+    from multicell_utils.cache import ValidationCache
+    schema_registry.preload()
+    schema_registry.validation_cache = ValidationCache()
+    _worker_registry = schema_registry
+
+
+def _validate_batch(lines):
+    return [_validate_line(line) for line in lines]
+
+
+def _validate_line(line):
+    request_id = None
+    try:
+        request = serialize.loads(line)
+        request_id = request.get('id')
+        violations = _worker_registry.collect_violations(request['model'], max_errors=request.get('max_errors'))
+        response = {'id': request_id, 'violations': [
+            dict(violation.to_dict(), error=violation.error.__name__) for violation in violations]}
+    except Exception as e:
+        response = {'id': request_id, 'error': f"{type(e).__name__}: {e}"}
+    return serialize.dumps(response, 'compact') + b'\n'
+
+
+class ValidationServer:
+    """Validation service listening on the Unix socket ``socket_path``.
+
+    ``workers`` processes validate, by default one per CPU. Requests are
+    sent to them in batches of up to ``batch_size``, waiting at most
+    ``batch_delay`` seconds for a batch to fill.
+    """
+    def __init__(self, socket_path=DEFAULT_SOCKET, workers=None, batch_size=16, batch_delay=0.002):
+        self.socket_path = socket_path
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.pool = None
+        self.server = None
+        self._queue = None
+        self._stopped = None
+        self._loop = None
+        self._tasks = set()
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            if _is_listening(self.socket_path):
+                raise RuntimeError(f"A validation service is already listening on '{self.socket_path}'")
+            os.remove(self.socket_path)
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._stopped = asyncio.Event()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        # start and warm up every worker before accepting requests
+        await asyncio.gather(*(self._loop.run_in_executor(self.pool, _validate_batch, [])
+                               for _ in range(self.workers)))
+        self._spawn(self._batch_requests())
+        self.server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path,
+                                                      limit=MAX_REQUEST_SIZE)
+
+    async def serve(self):
+        """Start, then serve until :meth:`stop` is called."""
+        await self.start()
+        try:
+            await self._stopped.wait()
+        finally:
+            await self.close()
+
+    def stop(self):
+        """Stop serving; may be called from any thread."""
+        self._loop.call_soon_threadsafe(self._stopped.set)
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for task in list(self._tasks):
+            task.cancel()
+        try:
+            self.pool.shutdown(cancel_futures=True)
+        except TypeError:  # Python < 3.9
+            self.pool.shutdown()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _handle_client(self, reader, writer):
+        responses = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                future = self._loop.create_future()
+                await self._queue.put((line, future))
+                responses.append(self._spawn(self._respond(writer, future)))
+            await asyncio.gather(*responses, return_exceptions=True)
+        except (ConnectionError, ValueError) as e:
+            # ValueError: a request line longer than MAX_REQUEST_SIZE
+            if isinstance(e, ValueError):
+                writer.write(serialize.dumps({'id': None, 'error': f"Request too large: {e}"}, 'compact') + b'\n')
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, future):
+        writer.write(await future)
+        await writer.drain()
+
+    async def _batch_requests(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self.batch_delay and self._queue.qsize() < self.batch_size - 1:
+                await asyncio.sleep(self.batch_delay)
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self._spawn(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        lines = [line for line, _ in batch]
+        try:
+            results = await self._loop.run_in_executor(self.pool, _validate_batch, lines)
+        except Exception as e:
+            error = serialize.dumps({'id': None, 'error': f"{type(e).__name__}: {e}"}, 'compact') + b'\n'
+            results = [error] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def _is_listening(socket_path):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+class ValidationClient:
+    """Validate models through the validation service.
+
+    When the service is not running at ``socket_path``, or Unix sockets are
+    not available, models are validated in-process against ``registry``,
+    by default the library's registry, unless ``fallback`` is False.
+    Violations are returned as :class:`Violation` objects either way.
+    """
+    def __init__(self, socket_path=DEFAULT_SOCKET, registry=None, fallback=True, timeout=None):
+        self.socket_path = socket_path
+        self.registry = registry
+        self.fallback = fallback
+        self.timeout = timeout
+
+    def validate(self, model):
+        """Raise the first violation of ``model``, as ``validate_template`` does."""
+        for violation in self.collect_violations(model, max_errors=1):
+            violation.raise_error()
+
+    def collect_violations(self, model, max_errors=None):
+        return self.collect_many([model], max_errors)[0]
+
+    def collect_many(self, models, max_errors=None):
+        """Return the list of violations of each model, in order.
+
+        All models are sent over one connection and validated concurrently.
+        """
+        models = [model.to_dict() if hasattr(model, 'to_dict') else model for model in models]
+        sock = self._connect()
+        if sock is None:
+            registry = self._registry()
+            return [registry.collect_violations(model, max_errors=max_errors) for model in models]
+
+        from multicell_utils.registry import Violation
+        payload = b''.join(serialize.dumps({'id': i, 'model': model, 'max_errors': max_errors}, 'compact') + b'\n'
+                           for i, model in enumerate(models))
+        results = [None] * len(models)
+        with sock:
+            # send from a thread, so that answers are read while large
+            # payloads are still being written
+            sender = threading.Thread(target=_send, args=(sock, payload))
+            sender.start()
+            with sock.makefile('rb') as answers:
+                for _ in models:
+                    line = answers.readline()
+                    if not line:
+                        raise ConnectionError("The validation service closed the connection")
+                    response = json.loads(line)
+                    if 'error' in response:
+                        raise ValueError(f"The validation service could not validate model: {response['error']}")
+                    results[response['id']] = [Violation.from_dict(violation, _error_class(violation.get('error')))
+                                               for violation in response['violations']]
+            sender.join()
+        return results
+
+    def _connect(self):
+        if not hasattr(socket, 'AF_UNIX'):
+            return self._no_service(OSError("Unix sockets are not available"))
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            return self._no_service(e)
+        return sock
+
+    def _no_service(self, error):
+        if not self.fallback:
+            raise ConnectionError(f"No validation service at '{self.socket_path}': {error}")
+        return None
+
+    def _registry(self):
+        if self.registry is None:
+            from schema import schema_registry
+            return schema_registry
+        return self.registry
+
+
+def _send(sock, payload):
+    try:
+        sock.sendall(payload)
+        sock.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
+
+
+def _error_class(name):
+    error = getattr(builtins, name or 'AssertionError', None)
+    return error if isinstance(error, type) and issubclass(error, Exception) else AssertionError
+
+
+def test_validation_service():
+    from multicell_utils.registry import project_root
+    from schema import schema_registry
+    with open(f"{project_root}/models/cell_sorting.json", 'r') as file:
+        model = json.load(file)
+    expected = [violation.to_dict() for violation in schema_registry.collect_violations(model)]
+    assert expected
+
+    with tempfile.TemporaryDirectory() as directory:
+        socket_path = os.path.join(directory, 'validation.sock')
+
+        # without a service, models are validated in-process
+        client = ValidationClient(socket_path)
+        assert [violation.to_dict() for violation in client.collect_violations(model)] == expected
+        try:
+            ValidationClient(socket_path, fallback=False).collect_violations(model)
+        except ConnectionError:
+            pass
+        else:
+            raise AssertionError("Connecting to a missing service should fail")
+
+        server = ValidationServer(socket_path, workers=1)
+        thread = threading.Thread(target=asyncio.run, args=(server.serve(),))
+        thread.start()
+        try:
+            for _ in range(500):
+                if _is_listening(socket_path):
+                    break
+                threading.Event().wait(0.01)
+            client = ValidationClient(socket_path, fallback=False)
+            results = client.collect_many([model] * 20, max_errors=2)
+            assert all([violation.to_dict() for violation in result] == expected[:2] for result in results)
+            try:
+                client.validate(model)
+            except AssertionError as error:
+                assert str(error) == expected[0]['message']
+            else:
+                raise AssertionError("The model should not validate")
+            try:
+                client.collect_many([model, {'id': 'bad'}])
+            except ValueError as error:
+                assert "KeyError" in str(error)
+            else:
+                raise AssertionError("A model without objects should not validate")
+        finally:
+            server.stop()
+            thread.join()
+        assert not os.path.exists(socket_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve model validation over a Unix socket.")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="path of the Unix socket")
+    parser.add_argument('--workers', type=int, default=None, help="number of validation processes")
+    parser.add_argument('--batch-size', type=int, default=16)
+    args = parser.parse_args()
+    service = ValidationServer(args.socket, workers=args.workers, batch_size=args.batch_size)
+    print(f"Serving validation on {args.socket}", file=sys.stderr)
+    try:
+        asyncio.run(service.serve())
+    except KeyboardInterrupt:
+        pass
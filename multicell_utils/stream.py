@@ -0,0 +1,272 @@
+import io
+import os
+import sys
+import json
+import itertools
+import tempfile
+
+from multicell_utils.registry import project_root
+from multicell_utils import serialize
+from multicell_utils.containment import ContainmentIndex
+
+
+CHUNK_SIZE = 1 << 20
+STREAMED_SECTIONS = ('objects', 'processes')
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+
+
+class _Reader:
+    """Incremental reader over a JSON text file.
+
+    Only the characters that have not been consumed yet, plus at most one
+    chunk or as much again as the value being read, are kept in memory.
+    """
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        if self.pos > self.chunk_size:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        chunk = self.file.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buffer += chunk
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _whitespace:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof:
+                raise ValueError("Unexpected end of JSON document")
+            self._fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos}, found '{self.buffer[self.pos]}'")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            else:
+                # a number at the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            # decoding starts over from the beginning of the value, so read
+            # as much again as is pending to keep large values linear
+            self._fill(max(self.chunk_size, len(self.buffer) - self.pos))
+
+
+def iter_model(model_file, chunk_size=CHUNK_SIZE):
+    """Yield the top-level entries of a model file without loading it whole.
+
+    Yields ``('objects', name, entry)`` and ``('processes', name, entry)``
+    for each object and process, in file order, and ``(None, key, value)``
+    for the other top-level fields such as ``id`` and ``name``.
+    """
+    with serialize.open_text(model_file) as file:
+        reader = _Reader(file, chunk_size)
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            key = reader.value()
+            reader.expect(':')
+            if key in STREAMED_SECTIONS and reader.peek() == '{':
+                reader.expect('{')
+                if reader.peek() == '}':
+                    reader.pos += 1
+                else:
+                    while True:
+                        name = reader.value()
+                        reader.expect(':')
+                        yield key, name, reader.value()
+                        if reader.peek() == ',':
+                            reader.pos += 1
+                        else:
+                            reader.expect('}')
+                            break
+            else:
+                yield None, key, reader.value()
+            if reader.peek() == ',':
+                reader.pos += 1
+            else:
+                reader.expect('}')
+                return
+
+
+def scan_model(model_file, registry=None, max_errors=None, chunk_size=CHUNK_SIZE):
+    """Validate a model file entry by entry and build a compact index of it.
+
+    Each object is checked against the registry as it is read and then
+    dropped; only its type and contained object names are kept, and for
+    processes only their type and participating object names. Checks that
+    need other entries run on that index once the file has been read.
+
+    Returns ``(index, violations)``. The index is model-shaped, with
+    ``id``, ``name``, ``objects`` and ``processes``, and can be passed to
+    ``SchemaRegistry.collect_violations`` or ``create_graph_from_model``.
+    """
+    if registry is None:
+        from schema import schema_registry as registry
+    model_file = _resolve(model_file)
+
+    index = {'objects': {}, 'processes': {}}
+    violations = []
+    checked = set()
+    # violations of objects read before the model id, and their entries,
+    # to be redone with the id once the file has been read
+    unnamed = []
+    entries = iter_model(model_file, chunk_size)
+    for section, name, entry in entries:
+        if section is None:
+            index[name] = entry
+        elif section == 'objects':
+            start = len(violations)
+            if _collect(registry.object_entry_violations(index.get('id'), name, entry), violations):
+                checked.add(name)
+            if 'id' not in index and len(violations) > start:
+                unnamed.append((start, len(violations), name, entry))
+            if isinstance(entry, dict):
+                index['objects'][name] = _slim_entry(entry, 'contained_objects')
+        else:
+            if isinstance(entry, dict):
+                index['processes'][name] = _slim_entry(entry, 'participating_objects')
+        if max_errors is not None and len(violations) >= max_errors:
+            break
+    if unnamed and 'id' not in index:
+        # stopped early: only look for the id in the rest of the file
+        for section, name, entry in entries:
+            if section is None and name == 'id':
+                index['id'] = entry
+                break
+    entries.close()
+    if 'id' in index:
+        for start, end, name, entry in unnamed:
+            violations[start:end] = registry.object_entry_violations(index['id'], name, entry)
+    if max_errors is not None and len(violations) >= max_errors:
+        return index, violations[:max_errors]
+
+    # cross-reference checks on the index
+    remaining = registry.iter_violations(index, objects=[], processes=None)
+    containment = (violation for name in index['objects'] if name in checked
+                   for violation in registry.containment_violations(index, name))
+    structure = ContainmentIndex(index).violations()
+    violations.extend(itertools.islice(itertools.chain(containment, structure, remaining),
+                                       None if max_errors is None else max_errors - len(violations)))
+    return index, violations
+
+
+def load_model_index(model_file, chunk_size=CHUNK_SIZE):
+    """Read the compact index of a model file without validating it."""
+    index = {'objects': {}, 'processes': {}}
+    for section, name, entry in iter_model(_resolve(model_file), chunk_size):
+        if section is None:
+            index[name] = entry
+        elif isinstance(entry, dict):
+            references = 'contained_objects' if section == 'objects' else 'participating_objects'
+            index[section][name] = _slim_entry(entry, references)
+    return index
+
+
+def _resolve(model_file):
+    # relative paths that do not exist here are relative to the project root
+    if not os.path.isabs(model_file) and not os.path.exists(model_file):
+        return os.path.join(project_root, model_file)
+    return model_file
+
+
+def _collect(generator, violations):
+    # extend violations and return the generator's return value
+    while True:
+        try:
+            violations.append(next(generator))
+        except StopIteration as stop:
+            return stop.value
+
+
+def _slim_entry(entry, references):
+    slim = {'type': entry.get('type')}
+    if isinstance(slim['type'], str):
+        slim['type'] = sys.intern(slim['type'])
+    names = entry.get(references)
+    if names:
+        slim[references] = names
+    return slim
+
+
+def test_iter_model():
+    model_file = os.path.join(project_root, 'models', 'cell_sorting.json')
+    with open(model_file, 'r') as file:
+        model = json.load(file)
+    streamed = {'objects': {}, 'processes': {}}
+    for section, name, entry in iter_model(model_file, chunk_size=7):
+        if section is None:
+            streamed[name] = entry
+        else:
+            streamed[section][name] = entry
+    assert streamed == model
+    assert list(streamed['objects']) == list(model['objects'])
+
+    # a large value is read in a number of chunks logarithmic in its size
+    class CountingFile(io.StringIO):
+        reads = 0
+
+        def read(self, size=-1):
+            self.reads += 1
+            return super().read(size)
+
+    value = {f"attribute {i}": [i, i / 7] for i in range(20000)}
+    file = CountingFile(json.dumps(value))
+    assert _Reader(file, chunk_size=16).value() == value
+    assert file.reads < 40
+
+
+def test_scan_model():
+    model = {
+        'name': 'stream',
+        'processes': {
+            'growth': {'type': 'CellGrowth', 'attributes': {}, 'participating_objects': ['cell 1', 'field']},
+        },
+        'objects': {
+            'field': {'type': 'CellField', 'attributes': {}, 'contained_objects': ['cell 0', 'cell 1']},
+            'cell 0': {'type': 'Cell', 'attributes': {'volume': 12.5}},
+            'cell 1': {'type': 'CellCPM', 'attributes': {'volume': 1e3}},
+            'broken': {'type': 'Cell'},
+        },
+        'id': 'model_stream',
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        model_file = os.path.join(tmp, 'model.json')
+        with open(model_file, 'w') as file:
+            json.dump(model, file, indent=4)
+        index, violations = scan_model(model_file, chunk_size=16)
+        assert load_model_index(model_file) == index
+        _, first = scan_model(model_file, max_errors=1, chunk_size=16)
+        assert [v.rule for v in first] == ['meta_schema'] and "model 'model_stream'" in first[0].message
+
+    from schema import schema_registry
+    assert sorted((v.rule, v.path) for v in violations) == \
+        sorted((v.rule, v.path) for v in schema_registry.collect_violations(model))
+    assert {v.rule for v in violations} == {'meta_schema', 'participation'}
+    assert [v.message for v in violations if v.rule == 'meta_schema'] == \
+        [v.message for v in schema_registry.collect_violations(model) if v.rule == 'meta_schema']
+    assert all("model 'model_stream'" in v.message for v in violations if v.rule == 'meta_schema')
+    assert index['id'] == 'model_stream'
+    assert index['objects']['field'] == {'type': 'CellField', 'contained_objects': ['cell 0', 'cell 1']}
+    assert index['objects']['cell 0'] == {'type': 'Cell'}
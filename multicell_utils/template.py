@@ -0,0 +1,231 @@
+import copy
+
+
+OBJECT_KEYS = ('type', 'attributes', 'boundary_conditions', 'contained_objects')
+PROCESS_KEYS = ('type', 'attributes', 'participating_objects')
+
+
+class TemplatePlan:
+    """A model template compiled for repeated instantiation.
+
+    Templates are either shaped like models, or list objects as
+    ``{name: type}`` with their containment in a separate ``structure``
+    mapping of parent names to child names. Either way the template is
+    normalized once into a model, whose types, containment and
+    participation are validated on first use and again only when the
+    registry changes.
+
+    :meth:`instantiate` then copies that model, substituting names and
+    attribute values. Only the entries whose values change are checked,
+    since renaming and attribute values cannot affect the other rules.
+    """
+    def __init__(self, name, schema):
+        if not isinstance(schema, dict):
+            raise ValueError(f"Template '{name}' must be a JSON object")
+        self.name = name
+        self.model = {
+            'id': schema.get('id', name),
+            'name': schema.get('name', name),
+            'objects': {},
+            'processes': {},
+        }
+        for obj_name, entry in (schema.get('objects') or {}).items():
+            if isinstance(entry, str):
+                entry = {'type': entry}
+            self.model['objects'][obj_name] = _normalize(entry, OBJECT_KEYS)
+        for parent, children in (schema.get('structure') or {}).items():
+            if parent not in self.model['objects']:
+                raise ValueError(f"Template '{name}' structure refers to unknown object '{parent}'")
+            contained = self.model['objects'][parent]['contained_objects']
+            contained.extend(child for child in children if child not in contained)
+        for proc_name, entry in (schema.get('processes') or {}).items():
+            if isinstance(entry, str):
+                entry = {'type': entry}
+            self.model['processes'][proc_name] = _normalize(entry, PROCESS_KEYS)
+
+        # entries with nested values, in their attributes or in keys other
+        # than the standard ones, are deep-copied on instantiation; the
+        # others only need their dicts and lists copied
+        self._nested = {
+            (section, entry_name) for section, keys in (('objects', OBJECT_KEYS), ('processes', PROCESS_KEYS))
+            for entry_name, entry in self.model[section].items()
+            if _has_nested(entry, keys)
+        }
+        self._checked = None
+
+    def __getstate__(self):
+        # validation results belong to the registry that produced them
+        state = dict(self.__dict__)
+        state['_checked'] = None
+        return state
+
+    def violations(self, registry):
+        """Violations of the compiled model, checked once per registry version."""
+        key = (id(registry), registry.version)
+        if self._checked is None or self._checked[0] != key:
+            self._checked = (key, registry.collect_violations(self.model))
+        return self._checked[1]
+
+    def instantiate(self,
+                    registry,
+                    model_id=None,
+                    name=None,
+                    rename=None,
+                    objects=None,
+                    processes=None,
+                    boundary_conditions=None,
+                    ):
+        """Return a new model from the template.
+
+        ``rename`` maps template object and process names to new names.
+        ``objects`` and ``processes`` map template entry names to attribute
+        values that update the template's, and ``boundary_conditions`` maps
+        object names to boundary conditions that update the template's.
+
+        Raises the first violation of the template itself, or of an entry
+        whose values changed.
+        """
+        for violation in self.violations(registry):
+            violation.raise_error()
+        rename = rename or {}
+        objects = objects or {}
+        processes = processes or {}
+        boundary_conditions = boundary_conditions or {}
+        for section, overrides in (('objects', objects), ('processes', processes),
+                                   ('objects', boundary_conditions)):
+            for entry_name, values in overrides.items():
+                if entry_name not in self.model[section]:
+                    raise KeyError(f"No entry named '{entry_name}' in '{section}' of template '{self.name}'")
+                if not isinstance(values, dict):
+                    raise ValueError(f"Values for '{entry_name}' in template '{self.name}' must be a dict")
+        object_names = {old: rename.get(old, old) for old in self.model['objects']}
+        process_names = {old: rename.get(old, old) for old in self.model['processes']}
+        for section, names in (('objects', object_names), ('processes', process_names)):
+            if len(set(names.values())) != len(names):
+                raise ValueError(f"Renaming the {section} of template '{self.name}' gives duplicate names")
+
+        model = {
+            'id': self.model['id'] if model_id is None else model_id,
+            'name': self.model['name'] if name is None else name,
+            'objects': {},
+            'processes': {},
+        }
+        for old, entry in self.model['objects'].items():
+            new_entry = self._copy_entry('objects', old, entry)
+            new_entry['contained_objects'] = [object_names.get(child, child) for child in entry['contained_objects']]
+            if old in objects:
+                new_entry['attributes'].update(objects[old])
+            if old in boundary_conditions:
+                new_entry['boundary_conditions'].update(boundary_conditions[old])
+            model['objects'][object_names[old]] = new_entry
+        for old, entry in self.model['processes'].items():
+            new_entry = self._copy_entry('processes', old, entry)
+            new_entry['participating_objects'] = [object_names.get(obj, obj) for obj in entry['participating_objects']]
+            if old in processes:
+                new_entry['attributes'].update(processes[old])
+            model['processes'][process_names[old]] = new_entry
+
+        # only the changed object entries can break the meta-schema
+        for old in dict.fromkeys(list(objects) + list(boundary_conditions)):
+            new_name = object_names[old]
+            for violation in registry.object_entry_violations(model['id'], new_name, model['objects'][new_name]):
+                violation.raise_error()
+        return model
+
+    def instantiate_many(self, registry, variations):
+        """Yield one model per dict of :meth:`instantiate` keyword arguments."""
+        for variation in variations:
+            yield self.instantiate(registry, **variation)
+
+    def _copy_entry(self, section, entry_name, entry):
+        if (section, entry_name) in self._nested:
+            return copy.deepcopy(entry)
+        new_entry = dict(entry)
+        for key in ('attributes', 'boundary_conditions'):
+            if key in entry:
+                new_entry[key] = dict(entry[key])
+        return new_entry
+
+
+def _has_nested(entry, keys):
+    values = [value for key in ('attributes', 'boundary_conditions') for value in entry.get(key, {}).values()]
+    values += [value for key, value in entry.items() if key not in keys]
+    return any(isinstance(value, (dict, list)) for value in values)
+
+
+def _normalize(entry, keys):
+    # standard keys first, with empty defaults, then any others as they are
+    normalized = {'type': entry.get('type')}
+    for key in keys[1:]:
+        value = entry.get(key)
+        if key in ('contained_objects', 'participating_objects'):
+            normalized[key] = [value] if isinstance(value, str) else list(value or [])
+        else:
+            normalized[key] = copy.deepcopy(value) if isinstance(value, dict) else {}
+    for key, value in entry.items():
+        if key not in normalized:
+            normalized[key] = copy.deepcopy(value)
+    return normalized
+
+
+def test_template_plans():
+    from schema import schema_registry
+    plan = schema_registry.template_plan('cellular_potts')
+    assert plan.model['objects']['cell_field']['contained_objects'] == ['cells']
+    assert plan.model['objects']['cells'] == {
+        'type': 'CellPopulation', 'attributes': {}, 'boundary_conditions': {}, 'contained_objects': []}
+    assert plan.model['processes']['contact_force']['condition'] == {'object': 'cell_field'}
+
+    # the checked-in cell sorting template has a participation violation
+    assert [v.rule for v in schema_registry.template_plan('cell_sorting').violations(schema_registry)] == \
+        ['participation']
+    try:
+        schema_registry.instantiate_template('cell_sorting')
+    except AssertionError:
+        pass
+    else:
+        raise AssertionError("Instantiating an invalid template should fail")
+
+
+def test_template_instantiation():
+    from multicell_utils.registry import SchemaRegistry
+    from multicell_utils import instrument
+    from schema import schema_registry
+    registry = SchemaRegistry()
+    for object_type in ['Material', 'Cell', 'CellCPM', 'Field', 'CellField']:
+        registry.register_object(schema_registry.object_types[object_type], object_type)
+    registry.register_process(schema_registry.process_types['MotileForce'], 'MotileForce')
+    registry.register_template({
+        'id': 'template_sweep',
+        'name': 'Sweep',
+        'objects': {'field': 'CellField', 'cell': 'CellCPM'},
+        'structure': {'field': ['cell']},
+        'processes': {'motility': {'type': 'MotileForce', 'participating_objects': ['cell'],
+                                   'attributes': {'strength': 1.0, 'direction': [0, 1]}}},
+    }, 'sweep')
+
+    variations = [{'model_id': f"sweep_{i}", 'rename': {'cell': f"cell {i}"},
+                   'objects': {'cell': {'volume': float(i)}}, 'processes': {'motility': {'strength': i}}}
+                  for i in range(1000)]
+    with instrument.collect() as stats:
+        models = list(registry.template_plan('sweep').instantiate_many(registry, variations))
+    assert stats.counters['validations'] == 1
+    assert models[7]['objects']['field']['contained_objects'] == ['cell 7']
+    assert models[7]['objects']['cell 7']['attributes'] == {'volume': 7.0}
+    assert models[7]['processes']['motility'] == {
+        'type': 'MotileForce', 'attributes': {'strength': 7, 'direction': [0, 1]},
+        'participating_objects': ['cell 7']}
+    assert models[7]['processes']['motility']['attributes']['direction'] is not \
+        models[8]['processes']['motility']['attributes']['direction']
+    for model in models[:10]:
+        registry.validate_template(model)
+
+    # changed values are checked, and registry changes re-check the template
+    try:
+        registry.instantiate_template('sweep', boundary_conditions={'field': []})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Boundary conditions must be a dict")
+    registry.register_object({'type': 'CellCPM', 'attributes': {}}, 'CellCPM', overwrite=True)
+    assert [v.rule for v in registry.template_plan('sweep').violations(registry)] == ['containment', 'participation']
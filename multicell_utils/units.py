@@ -0,0 +1,294 @@
+"""Units of attribute values, and their conversion.
+
+The units of the schema library are the ``unit`` enum of
+``schema/metaschema/basic_schema.json``. A unit is parsed into a factor
+and dimension exponents of length, mass and time; expressions combining
+the symbols of the enum, such as ``1/h``, are understood too. Conversion
+factors between the enum units are computed once at import.
+
+Attribute schemas give the unit of their values with a ``unit`` key.
+:func:`convert_model` converts every attribute with a unit in a model in
+one vectorized call per type and attribute, using NumPy when it is
+installed, after checking once per attribute schema that the units are
+compatible.
+"""
+import os
+import re
+import json
+import functools
+
+try:
+    import numpy as np
+except ImportError:  # optional, for vectorized conversion
+    np = None
+
+from multicell_utils.registry import project_root
+
+
+basic_schema_path = os.path.join(project_root, 'schema/metaschema/basic_schema.json')
+with open(basic_schema_path, 'r') as file:
+    UNITS = json.load(file)['unit']['enum']
+
+DIMENSIONS = ('length', 'mass', 'time')
+
+# factors of the unit symbols to meters, kilograms and seconds
+SYMBOLS = {
+    'um': (1e-6, (1, 0, 0)),
+    'pg': (1e-15, (0, 1, 0)),
+    's': (1.0, (0, 0, 1)),
+    'h': (3600.0, (0, 0, 1)),
+}
+
+_TERM = re.compile(r'^([A-Za-z]+)(?:\^(-?\d+))?$')
+
+
+@functools.lru_cache(maxsize=None)
+def parse_unit(unit):
+    """Return the factor and dimension exponents of ``unit``."""
+    if not isinstance(unit, str) or not unit.strip():
+        raise ValueError(f"Invalid unit {unit!r}")
+    numerator, slash, denominator = unit.replace(' ', '').partition('/')
+    if slash and not denominator:
+        raise ValueError(f"Invalid unit {unit!r}")
+    factor = 1.0
+    dimensions = [0] * len(DIMENSIONS)
+    for part, sign in ((numerator, 1), (denominator, -1)):
+        if part in ('', '1'):
+            continue
+        for term in part.split('*'):
+            match = _TERM.match(term)
+            if match is None or match.group(1) not in SYMBOLS:
+                raise ValueError(f"Unknown unit {unit!r}. Units are built from {sorted(SYMBOLS)}.")
+            exponent = sign * int(match.group(2) or 1)
+            symbol_factor, symbol_dimensions = SYMBOLS[match.group(1)]
+            factor *= symbol_factor ** exponent
+            for i, power in enumerate(symbol_dimensions):
+                dimensions[i] += power * exponent
+    return factor, tuple(dimensions)
+
+
+def _factor(from_unit, to_unit):
+    from_factor, from_dimensions = parse_unit(from_unit)
+    to_factor, to_dimensions = parse_unit(to_unit)
+    if from_dimensions != to_dimensions:
+        raise ValueError(f"Cannot convert '{from_unit}' to '{to_unit}': incompatible dimensions")
+    return from_factor / to_factor
+
+
+# conversion factors between compatible units of the enum
+FACTORS = {}
+for _from_unit in UNITS:
+    for _to_unit in UNITS:
+        if parse_unit(_from_unit)[1] == parse_unit(_to_unit)[1]:
+            FACTORS[(_from_unit, _to_unit)] = _factor(_from_unit, _to_unit)
+
+
+def conversion_factor(from_unit, to_unit):
+    """Return the factor converting values in ``from_unit`` to ``to_unit``.
+
+    Raises a ValueError when the units have different dimensions.
+    """
+    factor = FACTORS.get((from_unit, to_unit))
+    if factor is None:
+        factor = _factor(from_unit, to_unit)
+    return factor
+
+
+def convert(values, from_unit, to_unit):
+    """Convert a number, a sequence or a NumPy array of numbers.
+
+    Sequences and arrays are converted in one vectorized call when NumPy is
+    installed, and returned as arrays; without NumPy, sequences are
+    returned as lists.
+    """
+    factor = conversion_factor(from_unit, to_unit)
+    if isinstance(values, (int, float)) and not isinstance(values, bool):
+        return values * factor
+    return _scale(values, factor)
+
+
+def _scale(values, factor):
+    if np is not None:
+        return np.asarray(values, dtype=float) * factor
+    return [value * factor for value in values]
+
+
+def attribute_units(registry, type_name, kind='object'):
+    """Map the attributes of a type, inherited ones included, to their units."""
+    attributes = registry.effective_schema(type_name, kind)['attributes']
+    return {name: spec['unit'] for name, spec in attributes.items()
+            if isinstance(spec, dict) and isinstance(spec.get('unit'), str)}
+
+
+def convert_model(model, units, to_schema=False, registry=None, inplace=True):
+    """Convert the attribute values of ``model`` between units.
+
+    ``units`` maps attribute names to units. Values are taken to be in the
+    units of their attribute schemas, and converted to ``units``; with
+    ``to_schema``, values are taken to be in ``units`` and converted to
+    those of the schemas, as when loading data produced elsewhere.
+    Attributes without a unit in their schema, entries of unregistered
+    types and non-numeric values are left as they are. Numbers nested in
+    lists and dicts, such as bounds, are converted too.
+
+    Units are checked once per type and attribute, raising a ValueError
+    when they are incompatible. With ``inplace`` False the model is not
+    modified: a shallow copy is returned, with copies of the changed
+    entries. Returns the converted model.
+    """
+    if registry is None:
+        from schema import schema_registry as registry
+    if not inplace:
+        model = dict(model)
+    for section, kind in (('objects', 'object'), ('processes', 'process')):
+        entries = model[section]
+        if not inplace:
+            entries = model[section] = dict(entries)
+        type_of = getattr(entries, 'type_of', None)
+        factors_by_type = {}
+        columns = {}
+        for name in list(entries):
+            entry_type = type_of(name) if type_of is not None else entries[name].get('type')
+            factors = factors_by_type.get(entry_type)
+            if factors is None:
+                factors = factors_by_type[entry_type] = _attribute_factors(registry, entry_type, kind,
+                                                                           units, to_schema)
+            if factors:
+                columns.setdefault(entry_type, []).append(name)
+
+        # one vectorized conversion per type and attribute: the numbers of
+        # every entry are gathered along with where they go, scaled at once,
+        # and scattered back into copies of the entries
+        for entry_type, names in columns.items():
+            changed = {}
+            for attribute, factor in factors_by_type[entry_type].items():
+                numbers, slots = [], []
+                for name in names:
+                    entry = changed.get(name) or entries[name]
+                    attributes = entry.get('attributes')
+                    value = attributes.get(attribute) if isinstance(attributes, dict) else None
+                    if _is_number(value):
+                        numbers.append(value)
+                    elif isinstance(value, (dict, list)):
+                        start = len(numbers)
+                        value = _gather(value, numbers, slots)
+                        if len(numbers) == start:
+                            continue
+                    else:
+                        continue
+                    entry = changed.get(name)
+                    if entry is None:
+                        entry = changed[name] = dict(entries[name])
+                        entry['attributes'] = dict(entry['attributes'])
+                    if _is_number(value):
+                        slots.append((entry['attributes'], attribute))
+                    else:
+                        entry['attributes'][attribute] = value
+                for (container, key), number in zip(slots, _to_list(_scale(numbers, factor))):
+                    container[key] = number
+            for name, entry in changed.items():
+                entries[name] = entry
+    return model
+
+
+def _attribute_factors(registry, type_name, kind, units, to_schema):
+    # conversion factors of the attributes of a type, checked once
+    if not isinstance(type_name, str):
+        return {}
+    try:
+        schema_units = attribute_units(registry, type_name, kind)
+    except KeyError:
+        return {}
+    factors = {}
+    for attribute, unit in units.items():
+        if attribute in schema_units:
+            from_unit, to_unit = (unit, schema_units[attribute]) if to_schema else (schema_units[attribute], unit)
+            try:
+                factor = conversion_factor(from_unit, to_unit)
+            except ValueError as e:
+                raise ValueError(f"Attribute '{attribute}' of {kind} type '{type_name}': {e}") from None
+            if factor != 1.0:
+                factors[attribute] = factor
+    return factors
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _gather(value, numbers, slots):
+    # a copy of a list or dict, with the numbers in it appended to numbers
+    # and their containers and keys in the copy to slots
+    copy = dict(value) if isinstance(value, dict) else list(value)
+    for key, item in value.items() if isinstance(value, dict) else enumerate(value):
+        if _is_number(item):
+            numbers.append(item)
+            slots.append((copy, key))
+        elif isinstance(item, (dict, list)):
+            copy[key] = _gather(item, numbers, slots)
+    return copy
+
+
+def _to_list(values):
+    return values.tolist() if hasattr(values, 'tolist') else values
+
+
+def test_units():
+    assert UNITS == ["um", "um^2", "um^3", "pg", "um^2/s", "s", "h"]
+    assert conversion_factor('h', 's') == 3600.0
+    assert conversion_factor('um^2/s', 'um^2/s') == 1.0
+    assert abs(conversion_factor('1/h', '1/s') * 3600.0 - 1.0) < 1e-12
+    assert abs(convert(2.0, 'um^2/s', 'um^2/h') - 7200.0) < 1e-9
+    assert [round(value, 6) for value in _to_list(convert([1, 2], 'h', 's'))] == [3600.0, 7200.0]
+    for from_unit, to_unit in (('um', 's'), ('um^2', 'um^3'), ('pg', 'um')):
+        try:
+            conversion_factor(from_unit, to_unit)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"'{from_unit}' and '{to_unit}' should be incompatible")
+    try:
+        parse_unit('furlong')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Unknown units should be rejected")
+
+
+def test_convert_model():
+    from multicell_utils.registry import SchemaRegistry
+    registry = SchemaRegistry()
+    registry.register_object({'type': 'Box', 'attributes': {
+        'size': {'type': 'float', 'unit': 'um'},
+        'label': {'type': 'string'}}}, 'Box')
+    registry.register_process({'type': 'Growth', 'participating_objects': ['Box'], 'attributes': {
+        'rate': {'type': 'float', 'unit': '1/h'}}}, 'Growth')
+    model = {'id': 'model_units', 'name': 'units', 'processes': {
+        'growth': {'type': 'Growth', 'attributes': {'rate': 2.0}, 'participating_objects': ['box 0']}}}
+    model['objects'] = {f"box {i}": {'type': 'Box', 'attributes': {'size': float(i), 'label': 'x'}}
+                        for i in range(100)}
+    model['objects']['box 1']['attributes']['size'] = {'x': 1, 'y': 2}
+    model['objects']['box 2']['attributes']['size'] = [1, {'z': 0.5}, 'far']
+    model['objects']['other'] = {'type': 'Unregistered', 'attributes': {'size': 1.0}}
+
+    exported = convert_model(model, {'size': 'um', 'rate': '1/s'}, registry=registry, inplace=False)
+    assert exported['objects']['box 3'] is model['objects']['box 3']
+    assert abs(exported['processes']['growth']['attributes']['rate'] - 2.0 / 3600) < 1e-12
+    assert model['processes']['growth']['attributes']['rate'] == 2.0
+
+    loaded = convert_model(exported, {'rate': '1/s'}, to_schema=True, registry=registry)
+    assert abs(loaded['processes']['growth']['attributes']['rate'] - 2.0) < 1e-12
+    try:
+        convert_model(model, {'size': 's'}, registry=registry)
+    except ValueError as e:
+        assert 'Box' in str(e)
+    else:
+        raise AssertionError("Converting lengths to times should fail")
+
+    registry.register_object({'type': 'Box', 'attributes': {'size': {'unit': 'h'}}}, 'Box', overwrite=True)
+    convert_model(model, {'size': 's'}, registry=registry)
+    assert model['objects']['box 7']['attributes']['size'] == 7.0 * 3600
+    assert model['objects']['box 1']['attributes']['size'] == {'x': 3600.0, 'y': 7200.0}
+    assert model['objects']['box 2']['attributes']['size'] == [3600.0, {'z': 1800.0}, 'far']
+    assert model['objects']['box 7']['attributes']['label'] == 'x'
+    assert model['objects']['other']['attributes']['size'] == 1.0
@@ -1,10 +1,10 @@
 import os
-import json
-from jsonschema import validate, ValidationError
+from jsonschema import ValidationError
 from schema import schema_registry
 from multicell_utils.registry import (
     object_schemas_dir, process_schemas_dir, templates_dir,
-    object_meta_schema, process_meta_schema, template_meta_schema
+    object_meta_schema, process_meta_schema, template_meta_schema,
+    validate_with_meta_schema, load_schema_files
 )
 
 
@@ -13,36 +13,34 @@ from multicell_utils.registry import (
 def validate_schema(schema, meta_schema):
     schema_repr = schema.get('type', schema.get('name', schema.get('id')))
     try:
-        validate(instance=schema, schema=meta_schema)
+        validate_with_meta_schema(schema, meta_schema)
         # print(f"Schema {schema_repr} is valid.")
     except ValidationError as e:
         print(f"Schema {schema_repr}: is invalid: \n {e.message}")
 
 
+def _report_schema_files(directory, meta_schema, max_workers, kind):
+    paths = [os.path.join(directory, filename)
+             for filename in sorted(os.listdir(directory)) if filename.endswith('.json')]
+    results = load_schema_files(paths, meta_schema, max_workers)
+    for result in results:
+        if result['load_error'] is not None:
+            print(f"Error validating {kind} file {result['path']}: {result['load_error']}")
+        elif result['meta_error'] is not None:
+            schema = result['schema']
+            schema_repr = schema.get('type', schema.get('name', schema.get('id')))
+            print(f"Schema {schema_repr}: is invalid: \n {result['meta_error']}")
+    return results
+
+
 # Function to load and validate schemas from a directory
-def validate_schemas_from_directory(directory, meta_schema):
-    for filename in os.listdir(directory):
-        if filename.endswith('.json'):
-            schema_path = os.path.join(directory, filename)
-            with open(schema_path, 'r') as schema_file:
-                schema = json.load(schema_file)
-                try:
-                    validate_schema(schema, meta_schema)
-                except Exception as e:
-                    print(f"Error validating schema file {schema_file}: {e}")
+def validate_schemas_from_directory(directory, meta_schema, max_workers=None):
+    return _report_schema_files(directory, meta_schema, max_workers, 'schema')
 
 
 # Function to load and validated templates from a directory
-def validate_templates_from_directory(directory, meta_schema):
-    for filename in os.listdir(directory):
-        if filename.endswith('.json'):
-            template_path = os.path.join(directory, filename)
-            with open(template_path, 'r') as template_file:
-                template = json.load(template_file)
-                try:
-                    validate_schema(template, meta_schema)
-                except Exception as e:
-                    print(f"Error validating template file {template_file}: {e}")
+def validate_templates_from_directory(directory, meta_schema, max_workers=None):
+    return _report_schema_files(directory, meta_schema, max_workers, 'template')
 
 
 def test_validate_schema():
@@ -56,6 +54,12 @@ def test_validate_schema():
     validate_templates_from_directory(templates_dir, template_meta_schema)
 
 
+def test_validate_schema_parallel():
+    serial = validate_schemas_from_directory(object_schemas_dir, object_meta_schema)
+    parallel = validate_schemas_from_directory(object_schemas_dir, object_meta_schema, max_workers=2)
+    assert [(r['path'], r['meta_error']) for r in serial] == [(r['path'], r['meta_error']) for r in parallel]
+
+
 if __name__ == '__main__':
     # Validate object schemas
     print("VALIDATING SCHEMAS")
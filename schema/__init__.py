@@ -1,14 +1,27 @@
+import os
+import warnings
+
 from multicell_utils.registry import SchemaRegistry, object_schemas_dir, \
-    process_schemas_dir, register_schemas_from_directory, templates_dir
+    process_schemas_dir, templates_dir
 
 # Create an instance of SchemaRegistry
 schema_registry = SchemaRegistry()
 
-# Register object schemas
-register_schemas_from_directory(object_schemas_dir, schema_registry.register_object)
-
-# Register process schemas
-register_schemas_from_directory(process_schemas_dir, schema_registry.register_process)
+# List object, process and template schema files. Each file is loaded and
+# registered the first time one of its types is looked up; call
+# schema_registry.preload() to load the whole library up front.
+schema_registry.add_schema_directory(object_schemas_dir, 'object')
+schema_registry.add_schema_directory(process_schemas_dir, 'process')
+schema_registry.add_schema_directory(templates_dir, 'template')
 
-# Register templates
-register_schemas_from_directory(templates_dir, schema_registry.register_template)
+# Optionally load the whole library from a registry snapshot, refreshing the
+# snapshot when schema files have changed since it was saved. A snapshot that
+# cannot be written leaves the loaded registry usable.
+snapshot_path = os.environ.get('MULTICELL_SCHEMA_SNAPSHOT')
+if snapshot_path:
+    n_files = sum(len(paths) for paths in schema_registry._pending.values())
+    if schema_registry.load_snapshot(snapshot_path) != n_files:
+        try:
+            schema_registry.save_snapshot(snapshot_path)
+        except OSError as e:
+            warnings.warn(f"Could not save the schema registry snapshot to '{snapshot_path}': {e}")